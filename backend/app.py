@@ -1,25 +1,177 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g, send_file
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from datetime import datetime, timedelta
 import jwt
+import json
 import pandas as pd
+import os
 import time
+import atexit
+import signal
+import threading
 from functools import wraps
-from database import Database
-from model import LoanPredictionModel
+from database import Database, RECENT_ACTIVITY_TYPES
+from pagination import encode_cursor, decode_cursor, parse_outcome
+from batch_jobs import InMemoryJobStore, score_batch_chunk, describe_job
+from prediction_writer import WriterBusy
+from coalescer import CoalescerBusy
+from profiling import Profiler
+from metrics import REGISTRY, STAGE_SECONDS, PREDICTIONS, CONTENT_TYPE, record_request, serving_collector
+from parallel_scoring import stop_pool
+from services import (BATCH_CHUNK_ROWS, build_models, build_coalescer, build_prediction_writer,
+                      build_audit_log, build_batch_jobs, start_scoring_pool)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, timing each response it serializes"""
+
+    def response(self, *args, **kwargs):
+        with STAGE_SECONDS.time('serialization'):
+            return super().response(*args, **kwargs)
+
 
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 CORS(app)
 
 # Configuration
 app.config['SECRET_KEY'] = 'your-secret-key-change-in-production-2024'
 app.config['JWT_EXPIRATION_HOURS'] = 24
 
-# Initialize ML model
-predictor = LoanPredictionModel()
+# Under the pre-fork server (serve.py) this module is imported once in the parent,
+# which only loads the model; each worker then builds its LightGBM models, opens
+# its own database pool and starts its own background threads through init_worker().
+PREFORK = os.environ.get('SERVE_PREFORK', '0') == '1'
+
+# Batch scoring workers are forked first, before anything below builds a LightGBM
+# model or starts a thread; under serve.py each worker forks its own in init_worker()
+if not PREFORK:
+    start_scoring_pool()
+
+# Initialize ML model (MODEL_ENGINE=native selects the NumPy tree evaluator).
+# Handlers take models.current() once per request so a hot swap never changes
+# the model under a request that is already running.
+models = build_models(defer_booster=PREFORK)
+
+# Initialize database (the pool opens connections on first use)
+db = Database(connect=not PREFORK)
+
+# Background batch jobs keep their state in MySQL unless BATCH_JOB_STORE=memory,
+# which keeps it in this process instead, for tests and local runs.
+job_store = InMemoryJobStore() if os.environ.get('BATCH_JOB_STORE') == 'memory' else None
+
+
+def get_job_store():
+    """Where batch job rows are kept: the in-memory stand-in or the database"""
+    return job_store or db
+
+
+# Unknown categories, cache hits and pool use are read from the model and the
+# database when /metrics is scraped
+REGISTRY.add_collector(serving_collector(models, db))
+
+# Admin-controlled request profiling (see profiling.py); idle unless a session is running
+profiler = Profiler()
+
+# Per-process services, started by start_services()
+coalescer = None
+prediction_writer = None
+audit_log = None
+batch_jobs = None
+ready = threading.Event()
+
+
+def start_services(worker_id=None):
+    """Start this process's background threads.
+
+    worker_id (the pre-fork worker slot) keeps each worker's prediction spool
+    in a file of its own.
+    """
+    global coalescer, prediction_writer, audit_log, batch_jobs
+    # PREDICT_COALESCE_MS, PREDICTION_WRITE_BEHIND, AUDIT_LOG and BATCH_JOB_WORKERS
+    # turn these on and off (see services.py)
+    coalescer = build_coalescer(models.current())
+    prediction_writer = build_prediction_writer(db, worker_id)
+    audit_log = build_audit_log()
+    batch_jobs = build_batch_jobs(get_job_store, models.current, audit_log)
+    profiler.start()
+
+
+def stop_services():
+    """Stop background threads, writing out queued predictions and audit records"""
+    if coalescer:
+        coalescer.stop()
+    if batch_jobs:
+        batch_jobs.stop(timeout=30)
+    if prediction_writer:
+        prediction_writer.close()
+    if audit_log:
+        audit_log.close()
+    profiler.stop()
+    stop_pool()
+    REGISTRY.sync()
+    db.disconnect()
+
+
+def warm_up():
+    """Score a sample applicant and check out a database connection.
+
+    /ready answers 200 only once this has run.
+    """
+    started = time.perf_counter()
+    models.warm_up()
+    db_connected = db.connect()
+    ready.set()
+    return {'seconds': round(time.perf_counter() - started, 4), 'database_connected': db_connected}
+
+
+def init_worker(worker_id=None):
+    """Everything a serving process needs after the model is loaded"""
+    if PREFORK:
+        start_scoring_pool()
+    if worker_id is not None:
+        REGISTRY.share(worker_id)
+    models.after_fork()
+    start_services(worker_id)
+    return warm_up()
+
+
+if not PREFORK:
+    init_worker()
+    atexit.register(stop_services)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if profiler.session is not None:
+        # Profiling must never fail the request it watches
+        try:
+            g.profile = profiler.begin(request.method, request.url_rule.rule if request.url_rule else None)
+        except Exception as e:
+            print(f" Profiling error: {e}")
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        record_request(request.method, endpoint, response.status_code, time.perf_counter() - started)
+    if g.get('profile') is not None:
+        g.profile_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def finish_request_profile(error):
+    # Runs even when the view raised, and for stream_with_context responses
+    # only once the stream is done, so every profile that began is finished
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.finish(500 if error is not None else g.pop('profile_status', None))
 
-# Initialize database
-db = Database()
 
 # JWT token decorator
 def token_required(f):
@@ -38,8 +190,10 @@ def token_required(f):
             return jsonify({'detail': 'Token is missing'}), 401
         
         try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            current_user = db.get_user_by_id(data['user_id'])
+            with STAGE_SECONDS.time('jwt_decode'):
+                data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+            with STAGE_SECONDS.time('user_lookup'):
+                current_user = db.get_user_by_id_cached(data['user_id'])
             
             if not current_user:
                 return jsonify({'detail': 'User not found'}), 401
@@ -74,8 +228,10 @@ def admin_required(f):
             return jsonify({'detail': 'Token is missing'}), 401
         
         try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            current_user = db.get_user_by_id(data['user_id'])
+            with STAGE_SECONDS.time('jwt_decode'):
+                data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+            with STAGE_SECONDS.time('user_lookup'):
+                current_user = db.get_user_by_id_cached(data['user_id'])
             
             if not current_user:
                 return jsonify({'detail': 'User not found'}), 401
@@ -106,6 +262,8 @@ def index():
         'status': 'running',
         'endpoints': {
             'health': '/health',
+            'ready': '/ready',
+            'metrics': '/metrics',
             'register': '/register',
             'login': '/token',
             'user_info': '/me',
@@ -114,6 +272,9 @@ def index():
             'update_profile': '/me/update',
             'predict_single': '/predict',
             'predict_batch': '/predict/batch',
+            'predict_batch_stream': '/predict/batch?stream=true',
+            'batch_jobs': '/predict/batch/jobs',
+            'batch_job_status': '/predict/batch/jobs/<id>',
             'prediction_history': '/history/predictions',
             'batch_history': '/history/batch',
             'batch_details': '/history/batch/<id>',
@@ -121,7 +282,11 @@ def index():
             'user_stats': '/statistics/user',
             'credit_score_analysis': '/statistics/credit-score',
             'admin_users': '/admin/users',
-            'admin_statistics': '/admin/statistics'
+            'admin_statistics': '/admin/statistics',
+            'admin_models': '/admin/models',
+            'admin_activate_model': '/admin/models/<version>/activate',
+            'admin_profiling': '/admin/profiling',
+            'admin_profiles': '/admin/profiles'
         }
     })
 
@@ -135,15 +300,44 @@ def health_check():
     except:
         db_connected = False
     
+    predictor = models.current()
+    
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'model_loaded': predictor.model is not None,
+        'ready': ready.is_set(),
+        'pid': os.getpid(),
+        'model_loaded': predictor.is_loaded(),
+        'model_version': predictor.model_version,
+        'model_error': predictor.load_error,
+        'approval_threshold': predictor.threshold,
+        'engine': predictor.engine,
         'database_connected': db_connected,
-        'features': len(predictor.feature_names) if predictor.feature_names else 0
+        'database_pool': db.get_pool_metrics(),
+        'user_cache': db.get_user_cache_metrics(),
+        'features': len(predictor.feature_names) if predictor.feature_names else 0,
+        'metrics': predictor.get_metrics(),
+        'coalescer': coalescer.get_metrics() if coalescer else None,
+        'prediction_writer': prediction_writer.get_metrics() if prediction_writer else None,
+        'audit_log': audit_log.get_metrics() if audit_log else None,
+        'batch_jobs': batch_jobs.get_metrics() if batch_jobs else None
     })
 
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 503 until this process has warmed up"""
+    if not ready.is_set():
+        return jsonify({'ready': False, 'pid': os.getpid()}), 503
+    return jsonify({'ready': True, 'pid': os.getpid()})
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus metrics (of every worker under serve.py)"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
 # ============= AUTHENTICATION ENDPOINTS =============
 @app.route('/register', methods=['POST'])
 def register():
@@ -419,37 +613,47 @@ def reset_password():
 def predict_single(current_user):
     """Single loan prediction"""
     try:
-        if not db.ensure_connection():
+        # With write-behind, rows are spooled while the database is unreachable
+        if not prediction_writer and not db.ensure_connection():
             return jsonify({'detail': 'Database connection failed'}), 500
         
-        if predictor.model is None:
+        predictor = models.current()
+        if not predictor.is_loaded():
             return jsonify({'detail': 'Model not loaded'}), 500
         
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({'detail': 'No data provided'}), 400
-        
-        # Extract and validate features
-        try:
-            features = {
-                'annual_income': float(data.get('annual_income', 0)),
-                'debt_to_income_ratio': float(data.get('debt_to_income_ratio', 0)),
-                'credit_score': int(data.get('credit_score', 0)),
-                'loan_amount': float(data.get('loan_amount', 0)),
-                'interest_rate': float(data.get('interest_rate', 0)),
-                'gender': str(data.get('gender', 'Male')),
-                'marital_status': str(data.get('marital_status', 'Single')),
-                'education_level': str(data.get('education_level', 'High School')),
-                'employment_status': str(data.get('employment_status', 'Employed')),
-                'loan_purpose': str(data.get('loan_purpose', 'Other')),
-                'grade_subgrade': str(data.get('grade_subgrade', 'C1'))
-            }
-        except (ValueError, TypeError) as e:
-            return jsonify({'detail': f'Invalid data format: {str(e)}'}), 400
+        with STAGE_SECONDS.time('validation'):
+            data = request.get_json()
+            
+            if not data:
+                return jsonify({'detail': 'No data provided'}), 400
+            
+            # Extract and validate features
+            try:
+                features = {
+                    'annual_income': float(data.get('annual_income', 0)),
+                    'debt_to_income_ratio': float(data.get('debt_to_income_ratio', 0)),
+                    'credit_score': int(data.get('credit_score', 0)),
+                    'loan_amount': float(data.get('loan_amount', 0)),
+                    'interest_rate': float(data.get('interest_rate', 0)),
+                    'gender': str(data.get('gender', 'Male')),
+                    'marital_status': str(data.get('marital_status', 'Single')),
+                    'education_level': str(data.get('education_level', 'High School')),
+                    'employment_status': str(data.get('employment_status', 'Employed')),
+                    'loan_purpose': str(data.get('loan_purpose', 'Other')),
+                    'grade_subgrade': str(data.get('grade_subgrade', 'C1'))
+                }
+            except (ValueError, TypeError) as e:
+                return jsonify({'detail': f'Invalid data format: {str(e)}'}), 400
         
-        # Make prediction
-        result = predictor.predict_single(features)
+        # Make prediction (preprocessing and inference are timed by the model)
+        if coalescer:
+            try:
+                result = coalescer.predict(features, predictor)
+            except CoalescerBusy as e:
+                return jsonify({'detail': f'{e}, retry shortly'}), 503
+        else:
+            result = predictor.predict_single(features)
+        PREDICTIONS.inc('single', 'approved' if result['prediction'] == 1 else 'rejected')
         
         # Save to database
         prediction_data = {
@@ -458,10 +662,21 @@ def predict_single(current_user):
             'prediction': result['prediction'],
             'probability': result['probability'],
             'risk_score': result.get('risk_score'),
-            'rejection_reasons': result.get('rejection_reasons')
+            'rejection_reasons': result.get('rejection_reasons'),
+            'model_version': predictor.model_version
         }
         
-        prediction_id = db.save_prediction(current_user['id'], prediction_data)
+        with STAGE_SECONDS.time('db_write'):
+            if prediction_writer:
+                try:
+                    prediction_id = prediction_writer.submit(current_user['id'], prediction_data)
+                except WriterBusy as e:
+                    return jsonify({'detail': f'{e}, retry shortly'}), 503
+            else:
+                prediction_id = db.save_prediction(current_user['id'], prediction_data)
+        
+        if audit_log:
+            audit_log.log_single(current_user['id'], prediction_id, prediction_data)
         
         print(f" Prediction made for {current_user['username']}: {result['status']}")
         
@@ -469,6 +684,8 @@ def predict_single(current_user):
             'prediction': result['prediction'],
             'probability': result['probability'],
             'status': result['status'],
+            'threshold': result['threshold'],
+            'model_version': predictor.model_version,
             'risk_score': result.get('risk_score'),
             'rejection_reasons': result.get('rejection_reasons'),
             'prediction_id': prediction_id
@@ -481,6 +698,115 @@ def predict_single(current_user):
         return jsonify({'detail': f'Prediction failed: {str(e)}'}), 500
 
 
+def stream_batch(current_user, predictor, file, file_size_kb, start_time):
+    """NDJSON response for a batch upload read BATCH_CHUNK_ROWS rows at a time.
+    
+    Only one chunk is held in memory: each is scored, stored and written to the
+    response before the next is read. Lines are a 'batch' header, one 'result'
+    per CSV row in file order, then a 'summary' (or an 'error' if the file
+    fails part-way; rows already streamed stay saved).
+    """
+    try:
+        reader = pd.read_csv(file, chunksize=BATCH_CHUNK_ROWS)
+        with STAGE_SECONDS.time('csv_read'):
+            first_chunk = next(reader)
+    except StopIteration:
+        first_chunk = None
+    except Exception as e:
+        return jsonify({'detail': f'Failed to read CSV: {str(e)}'}), 400
+    
+    if first_chunk is None or first_chunk.empty:
+        return jsonify({'detail': 'CSV file is empty'}), 400
+    
+    batch_data = {
+        'batch_name': request.form.get('batch_name', file.filename),
+        'filename': file.filename,
+        'file_size_kb': file_size_kb,
+        'total_applications': 0,
+        'approved_applications': 0,
+        'rejected_applications': 0,
+        'approval_rate': 0,
+        'processing_time_seconds': 0
+    }
+    # Saved first so each chunk's details can reference it; totals are filled in at the end
+    with STAGE_SECONDS.time('db_write'):
+        batch_id = db.save_batch_prediction(current_user['id'], batch_data)
+    if not batch_id:
+        return jsonify({'detail': 'Failed to save batch'}), 500
+    
+    print(f" Streaming batch {batch_id} for {current_user['username']} in chunks of {BATCH_CHUNK_ROWS}")
+    
+    def generate():
+        total_applications = approved_count = rejected_count = error_count = 0
+        threshold = predictor.threshold
+        failure = None
+        
+        yield json.dumps({
+            'type': 'batch',
+            'batch_id': batch_id,
+            'model_version': predictor.model_version,
+            'chunk_rows': BATCH_CHUNK_ROWS
+        }) + '\n'
+        
+        try:
+            df = first_chunk
+            while df is not None:
+                chunk = score_batch_chunk(predictor, df, row_offset=total_applications)
+                if len(chunk['scored']):
+                    with STAGE_SECONDS.time('db_write'):
+                        if not db.save_batch_prediction_columns(batch_id, chunk['scored']):
+                            raise RuntimeError(f'failed to save rows {total_applications + 1}-{total_applications + len(df)}')
+                    if audit_log:
+                        audit_log.log_batch(current_user['id'], batch_id, chunk['scored'])
+                
+                total_applications += len(df)
+                approved_count += chunk['approved']
+                rejected_count += chunk['rejected']
+                error_count += chunk['errors']
+                threshold = chunk['threshold']
+                yield ''.join(json.dumps({'type': 'result', **result}) + '\n' for result in chunk['results'])
+                
+                with STAGE_SECONDS.time('csv_read'):
+                    df = next(reader, None)
+        except Exception as e:
+            print(f" Streaming batch error: {e}")
+            failure = str(e)
+        
+        processing_time = round(time.time() - start_time, 3)
+        successful_predictions = approved_count + rejected_count
+        approval_rate = round((approved_count / successful_predictions * 100), 2) if successful_predictions > 0 else 0
+        batch_data.update({
+            'total_applications': total_applications,
+            'approved_applications': approved_count,
+            'rejected_applications': rejected_count,
+            'approval_rate': approval_rate,
+            'processing_time_seconds': processing_time
+        })
+        db.update_batch_prediction(batch_id, batch_data)
+        
+        if failure:
+            yield json.dumps({'type': 'error', 'batch_id': batch_id, 'detail': f'Batch processing failed: {failure}',
+                              'rows_processed': total_applications}) + '\n'
+            return
+        
+        print(f" Batch processed: {approved_count} approved, {rejected_count} rejected, {error_count} errors")
+        yield json.dumps({
+            'type': 'summary',
+            'batch_id': batch_id,
+            'total_applications': total_applications,
+            'approved_applications': approved_count,
+            'rejected_applications': rejected_count,
+            'error_count': error_count,
+            'approval_rate': f"{approval_rate}%",
+            'threshold': threshold,
+            'model_version': predictor.model_version,
+            'processing_time_seconds': processing_time,
+            'file_size_kb': file_size_kb
+        }) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 @app.route('/predict/batch', methods=['POST'])
 @token_required
 def predict_batch(current_user):
@@ -489,7 +815,8 @@ def predict_batch(current_user):
         if not db.ensure_connection():
             return jsonify({'detail': 'Database connection failed'}), 500
         
-        if predictor.model is None:
+        predictor = models.current()
+        if not predictor.is_loaded():
             return jsonify({'detail': 'Model not loaded'}), 500
         
         if 'file' not in request.files:
@@ -511,9 +838,15 @@ def predict_batch(current_user):
         file.seek(0)
         file_size_kb = round(file_size / 1024, 2)
         
+        # ?stream=true (or Accept: application/x-ndjson) streams results chunk by chunk
+        if request.args.get('stream', '').lower() in ('1', 'true') or \
+                'application/x-ndjson' in request.headers.get('Accept', ''):
+            return stream_batch(current_user, predictor, file, file_size_kb, start_time)
+        
         # Read CSV
         try:
-            df = pd.read_csv(file)
+            with STAGE_SECONDS.time('csv_read'):
+                df = pd.read_csv(file)
         except Exception as e:
             return jsonify({'detail': f'Failed to read CSV: {str(e)}'}), 400
         
@@ -522,70 +855,16 @@ def predict_batch(current_user):
         
         print(f" Processing batch of {len(df)} applications for {current_user['username']}")
         
-        results = []
-        batch_details = []
-        approved_count = 0
-        rejected_count = 0
-        error_count = 0
-        
-        for idx, row in df.iterrows():
-            try:
-                features = {
-                    'annual_income': float(row.get('annual_income', 0)),
-                    'debt_to_income_ratio': float(row.get('debt_to_income_ratio', 0)),
-                    'credit_score': int(row.get('credit_score', 0)),
-                    'loan_amount': float(row.get('loan_amount', 0)),
-                    'interest_rate': float(row.get('interest_rate', 0)),
-                    'gender': str(row.get('gender', 'Male')),
-                    'marital_status': str(row.get('marital_status', 'Single')),
-                    'education_level': str(row.get('education_level', 'High School')),
-                    'employment_status': str(row.get('employment_status', 'Employed')),
-                    'loan_purpose': str(row.get('loan_purpose', 'Other')),
-                    'grade_subgrade': str(row.get('grade_subgrade', 'C1'))
-                }
-                
-                result = predictor.predict_single(features)
-                applicant_name = str(row.get('applicant_name', f'Applicant {idx + 1}'))
-                
-                if result['prediction'] == 1:
-                    approved_count += 1
-                else:
-                    rejected_count += 1
-                
-                # For API response
-                results.append({
-                    'row_number': idx + 1,
-                    'applicant_name': applicant_name,
-                    'prediction': result['prediction'],
-                    'probability': result['probability'],
-                    'credit_score': features['credit_score'],
-                    'debt_to_income_ratio': features['debt_to_income_ratio'],
-                    'status': result['status'],
-                    'risk_score': result.get('risk_score'),
-                    'rejection_reasons': result.get('rejection_reasons')
-                })
-                
-                # For database storage
-                batch_details.append({
-                    'row_number': idx + 1,
-                    'applicant_name': applicant_name,
-                    **features,
-                    'prediction': result['prediction'],
-                    'probability': result['probability'],
-                    'risk_score': result.get('risk_score'),
-                    'rejection_reasons': result.get('rejection_reasons')
-                })
-                
-            except Exception as e:
-                error_count += 1
-                results.append({
-                    'row_number': idx + 1,
-                    'applicant_name': str(row.get('applicant_name', f'Applicant {idx + 1}')),
-                    'error': str(e)
-                })
+        # Score the whole file in one vectorized pass
+        chunk = score_batch_chunk(predictor, df)
+        scored = chunk['scored']
+        results = chunk['results']
+        total_applications = len(df)
+        approved_count = chunk['approved']
+        rejected_count = chunk['rejected']
+        error_count = chunk['errors']
         
         processing_time = round(time.time() - start_time, 3)
-        total_applications = len(df)
         successful_predictions = approved_count + rejected_count
         approval_rate = round((approved_count / successful_predictions * 100), 2) if successful_predictions > 0 else 0
         
@@ -603,11 +882,19 @@ def predict_batch(current_user):
             'approval_rate': approval_rate,
             'processing_time_seconds': processing_time
         }
-        batch_id = db.save_batch_prediction(current_user['id'], batch_data)
-        
-        # Save batch details
-        if batch_id and batch_details:
-            db.save_batch_prediction_details(batch_id, batch_details)
+        with STAGE_SECONDS.time('db_write'):
+            batch_id = db.save_batch_prediction(current_user['id'], batch_data)
+            if not batch_id:
+                return jsonify({'detail': 'Failed to save batch'}), 500
+            
+            # Details are committed in slices; a failure part-way removes the
+            # whole batch so /history/batch never shows a partial one
+            if len(scored) and not db.save_batch_prediction_columns(batch_id, scored):
+                if not db.delete_batch_prediction(batch_id):
+                    print(f" Batch {batch_id} is partially stored and could not be removed")
+                return jsonify({'detail': 'Failed to save batch results'}), 500
+        if audit_log:
+            audit_log.log_batch(current_user['id'], batch_id, scored)
         
         print(f" Batch processed: {approved_count} approved, {rejected_count} rejected, {error_count} errors")
         
@@ -619,6 +906,8 @@ def predict_batch(current_user):
             'rejected_applications': rejected_count,
             'error_count': error_count,
             'approval_rate': f"{approval_rate}%",
+            'threshold': chunk['threshold'],
+            'model_version': predictor.model_version,
             'processing_time_seconds': processing_time,
             'file_size_kb': file_size_kb
         }), 200
@@ -630,6 +919,101 @@ def predict_batch(current_user):
         return jsonify({'detail': f'Batch processing failed: {str(e)}'}), 500
 
 
+@app.route('/predict/batch/jobs', methods=['POST'])
+@token_required
+def submit_batch_job(current_user):
+    """Queue a CSV for background scoring; returns a job id straight away"""
+    try:
+        if batch_jobs is None:
+            return jsonify({'detail': 'Batch jobs are disabled'}), 503
+        
+        store = get_job_store()
+        if not store.ensure_connection():
+            return jsonify({'detail': 'Database connection failed'}), 500
+        
+        if 'file' not in request.files:
+            return jsonify({'detail': 'No file uploaded'}), 400
+        
+        file = request.files['file']
+        
+        if file.filename == '':
+            return jsonify({'detail': 'No file selected'}), 400
+        
+        if not file.filename.endswith('.csv'):
+            return jsonify({'detail': 'Only CSV files are supported'}), 400
+        
+        batch_name = request.form.get('batch_name', file.filename)
+        try:
+            job_id = batch_jobs.submit(store, current_user['id'], file, batch_name)
+        except ValueError as e:
+            return jsonify({'detail': str(e)}), 400
+        
+        if not job_id:
+            return jsonify({'detail': 'Failed to queue batch job'}), 500
+        
+        print(f" Queued batch job {job_id} for {current_user['username']}")
+        
+        job = describe_job(store.get_batch_job(job_id))
+        job['status_url'] = f'/predict/batch/jobs/{job_id}'
+        return jsonify(job), 202
+        
+    except Exception as e:
+        print(f" Batch job submit error: {e}")
+        return jsonify({'detail': f'Failed to queue batch job: {str(e)}'}), 500
+
+
+@app.route('/predict/batch/jobs', methods=['GET'])
+@token_required
+def get_batch_jobs(current_user):
+    """Get user's batch jobs with their progress"""
+    try:
+        store = get_job_store()
+        if not store.ensure_connection():
+            return jsonify({'detail': 'Database connection failed'}), 500
+        
+        limit = request.args.get('limit', 20, type=int)
+        
+        if limit < 1 or limit > 50:
+            limit = 20
+        
+        jobs = [describe_job(job) for job in store.get_user_batch_jobs(current_user['id'], limit)]
+        
+        return jsonify({
+            'jobs': jobs,
+            'total': len(jobs),
+            'limit': limit
+        }), 200
+        
+    except Exception as e:
+        print(f" Batch jobs error: {e}")
+        return jsonify({'detail': f'Failed to fetch batch jobs: {str(e)}'}), 500
+
+
+@app.route('/predict/batch/jobs/<int:job_id>', methods=['GET'])
+@token_required
+def get_batch_job(current_user, job_id):
+    """Status, rows processed, throughput and ETA of one batch job"""
+    try:
+        store = get_job_store()
+        if not store.ensure_connection():
+            return jsonify({'detail': 'Database connection failed'}), 500
+        
+        job = store.get_batch_job(job_id)
+        
+        if not job:
+            return jsonify({'detail': 'Job not found'}), 404
+        
+        # Check ownership
+        if job['user_id'] != current_user['id']:
+            return jsonify({'detail': 'Access denied'}), 403
+        
+        return jsonify(describe_job(job)), 200
+        
+    except Exception as e:
+        print(f" Batch job status error: {e}")
+        return jsonify({'detail': f'Failed to fetch batch job: {str(e)}'}), 500
+
+
 # ============= HISTORY ENDPOINTS =============
 @app.route('/history/predictions', methods=['GET'])
 @token_required
@@ -644,7 +1028,20 @@ def get_prediction_history(current_user):
         if limit < 1 or limit > 100:
             limit = 50
         
-        predictions = db.get_user_predictions(current_user['id'], limit)
+        # ?cursor= continues after the previous page; ?outcome=approved|rejected filters
+        try:
+            cursor = request.args.get('cursor')
+            after = decode_cursor(cursor, 'predictions', datetime, int) if cursor else None
+            outcome = parse_outcome(request.args.get('outcome'))
+        except ValueError as e:
+            return jsonify({'detail': str(e)}), 400
+        
+        # One extra row tells whether another page exists
+        predictions = db.get_user_predictions(current_user['id'], limit + 1, after=after, outcome=outcome)
+        next_cursor = None
+        if len(predictions) > limit:
+            predictions = predictions[:limit]
+            next_cursor = encode_cursor('predictions', predictions[-1]['created_at'], predictions[-1]['id'])
         
         # Convert datetime objects to strings and Decimal to float
         for pred in predictions:
@@ -660,7 +1057,8 @@ def get_prediction_history(current_user):
         return jsonify({
             'predictions': predictions,
             'total': len(predictions),
-            'limit': limit
+            'limit': limit,
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
@@ -681,7 +1079,17 @@ def get_batch_history(current_user):
         if limit < 1 or limit > 50:
             limit = 20
         
-        batches = db.get_user_batch_predictions(current_user['id'], limit)
+        try:
+            cursor = request.args.get('cursor')
+            after = decode_cursor(cursor, 'batches', datetime, int) if cursor else None
+        except ValueError as e:
+            return jsonify({'detail': str(e)}), 400
+        
+        batches = db.get_user_batch_predictions(current_user['id'], limit + 1, after=after)
+        next_cursor = None
+        if len(batches) > limit:
+            batches = batches[:limit]
+            next_cursor = encode_cursor('batches', batches[-1]['processed_at'], batches[-1]['id'])
         
         # Convert datetime objects to strings and Decimal to float
         for batch in batches:
@@ -696,7 +1104,8 @@ def get_batch_history(current_user):
         return jsonify({
             'batches': batches,
             'total': len(batches),
-            'limit': limit
+            'limit': limit,
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
@@ -722,8 +1131,24 @@ def get_batch_details(current_user, batch_id):
         if batch['user_id'] != current_user['id']:
             return jsonify({'detail': 'Access denied'}), 403
         
-        # Get batch details
-        details = db.get_batch_prediction_details(batch_id)
+        limit = request.args.get('limit', 500, type=int)
+        
+        if limit < 1 or limit > 5000:
+            limit = 500
+        
+        try:
+            cursor = request.args.get('cursor')
+            after = decode_cursor(cursor, f'batch-{batch_id}', int)[0] if cursor else None
+            outcome = parse_outcome(request.args.get('outcome'))
+        except ValueError as e:
+            return jsonify({'detail': str(e)}), 400
+        
+        # Get one page of batch details
+        details = db.get_batch_prediction_details(batch_id, limit + 1, after=after, outcome=outcome)
+        next_cursor = None
+        if len(details) > limit:
+            details = details[:limit]
+            next_cursor = encode_cursor(f'batch-{batch_id}', details[-1]['row_number'])
         
         # Convert datetime and Decimal types
         if batch.get('processed_at'):
@@ -742,7 +1167,9 @@ def get_batch_details(current_user, batch_id):
         return jsonify({
             'batch': batch,
             'details': details,
-            'total_details': len(details)
+            'total_details': len(details),
+            'limit': limit,
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
@@ -759,17 +1186,18 @@ def get_statistics(current_user):
         if not db.ensure_connection():
             return jsonify({'detail': 'Database connection failed'}), 500
         
-        predictions = db.get_user_predictions(current_user['id'], 1000)
-        batches = db.get_user_batch_predictions(current_user['id'], 100)
+        counters = db.get_user_counters(current_user['id'])
+        if counters is None:
+            return jsonify({'detail': 'Statistics not available'}), 500
         
-        total_predictions = len(predictions)
-        approved = sum(1 for p in predictions if p['prediction'] == 1)
-        rejected = total_predictions - approved
+        total_predictions = int(counters['single_predictions'])
+        approved = int(counters['single_approved'])
+        rejected = int(counters['single_rejected'])
         
-        total_batches = len(batches)
-        total_batch_applications = sum(b['total_applications'] for b in batches)
-        total_batch_approved = sum(b['approved_applications'] for b in batches)
-        total_batch_rejected = sum(b['rejected_applications'] for b in batches)
+        total_batches = int(counters['batch_predictions'])
+        total_batch_applications = int(counters['batch_applications'])
+        total_batch_approved = int(counters['batch_approved'])
+        total_batch_rejected = int(counters['batch_rejected'])
         
         return jsonify({
             'single_predictions': {
@@ -865,7 +1293,23 @@ def get_recent_predictions(current_user):
         if limit < 1 or limit > 100:
             limit = 50
         
-        recent = db.get_recent_predictions_summary(limit)
+        # ?cursor= continues after the previous page; ?user_id= limits the feed to one user
+        try:
+            cursor = request.args.get('cursor')
+            before = decode_cursor(cursor, 'recent', datetime, str, int) if cursor else None
+            if before and before[1] not in RECENT_ACTIVITY_TYPES:
+                raise ValueError('Invalid cursor')
+        except ValueError as e:
+            return jsonify({'detail': str(e)}), 400
+        user_id = request.args.get('user_id', type=int)
+        
+        # One extra row tells whether another page exists
+        recent = db.get_recent_predictions_summary(limit + 1, before=before, user_id=user_id)
+        next_cursor = None
+        if len(recent) > limit:
+            recent = recent[:limit]
+            last = recent[-1]
+            next_cursor = encode_cursor('recent', last['prediction_date'], last['prediction_type'], last['id'])
         
         # Convert datetime and Decimal types
         for item in recent:
@@ -879,7 +1323,8 @@ def get_recent_predictions(current_user):
         return jsonify({
             'recent_predictions': recent,
             'total': len(recent),
-            'limit': limit
+            'limit': limit,
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
@@ -997,6 +1442,133 @@ def admin_get_statistics(current_user):
         return jsonify({'detail': str(e)}), 500
 
 
+@app.route('/admin/models', methods=['GET'])
+@admin_required
+def admin_get_models(current_user):
+    """List registered model versions and reload status (admin only)"""
+    try:
+        return jsonify(models.get_status()), 200
+    except Exception as e:
+        print(f" Admin models error: {e}")
+        return jsonify({'detail': str(e)}), 500
+
+
+def restart_workers_after(loading, version):
+    """Under serve.py, have the parent roll the new version out to every worker"""
+    loading.join()
+    if models.current().model_version == version:
+        os.kill(os.getppid(), signal.SIGHUP)
+
+
+@app.route('/admin/models/<version>/activate', methods=['POST'])
+@admin_required
+def admin_activate_model(current_user, version):
+    """Load a registered model version in the background and swap it in (admin only)"""
+    try:
+        loading = models.activate(version)
+        print(f" Model version {version} activation started by admin {current_user['username']}")
+        if PREFORK:
+            threading.Thread(target=restart_workers_after, args=(loading, version), daemon=True).start()
+        return jsonify({
+            'message': 'Model activation started',
+            'version': version,
+            'active_version': models.current().model_version
+        }), 202
+        
+    except ValueError as e:
+        return jsonify({'detail': str(e)}), 404
+    except RuntimeError as e:
+        return jsonify({'detail': str(e)}), 409
+    except Exception as e:
+        print(f" Activate model error: {e}")
+        return jsonify({'detail': str(e)}), 500
+
+
+@app.route('/admin/profiling', methods=['GET'])
+@admin_required
+def admin_get_profiling(current_user):
+    """Status of the profiling session (admin only)"""
+    return jsonify(profiler.status()), 200
+
+
+@app.route('/admin/profiling', methods=['POST'])
+@admin_required
+def admin_start_profiling(current_user):
+    """Profile the next N requests, optionally to one route (admin only).
+    
+    JSON body: requests (default 10), route (e.g. /predict/batch), mode
+    (statistical or deterministic), interval_ms (sampling period, default 5)
+    and seconds (the session ends after this long, default 600).
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        session = profiler.start_session(
+            route=data.get('route'),
+            requests=data.get('requests', 10),
+            mode=data.get('mode', 'statistical'),
+            interval_ms=data.get('interval_ms', 5),
+            seconds=data.get('seconds', 600)
+        )
+        print(f" Profiling started by admin {current_user['username']}")
+        return jsonify(dict(session, active=True)), 201
+        
+    except (ValueError, TypeError) as e:
+        return jsonify({'detail': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'detail': str(e)}), 409
+    except Exception as e:
+        print(f" Start profiling error: {e}")
+        return jsonify({'detail': str(e)}), 500
+
+
+@app.route('/admin/profiling', methods=['DELETE'])
+@admin_required
+def admin_stop_profiling(current_user):
+    """End the profiling session early (admin only)"""
+    session = profiler.stop_session()
+    if session is None:
+        return jsonify({'detail': 'No profiling session is running'}), 404
+    return jsonify(dict(session, active=False)), 200
+
+
+@app.route('/admin/profiles', methods=['GET'])
+@admin_required
+def admin_list_profiles(current_user):
+    """Profiling sessions and the request profiles they saved (admin only)"""
+    try:
+        sessions = profiler.list_profiles()
+        for session in sessions:
+            session['merged_url'] = f"/admin/profiles/{session['id']}/merged.folded"
+            for profile in session['profiles']:
+                profile['url'] = f"/admin/profiles/{session['id']}/{profile['file']}"
+        return jsonify({'sessions': sessions, 'total': len(sessions)}), 200
+    except Exception as e:
+        print(f" List profiles error: {e}")
+        return jsonify({'detail': str(e)}), 500
+
+
+@app.route('/admin/profiles/<session_id>/<name>', methods=['GET'])
+@admin_required
+def admin_download_profile(current_user, session_id, name):
+    """Download one profile, or merged.folded for a whole session (admin only).
+    
+    .folded files are folded stacks for flamegraph.pl, inferno or speedscope;
+    .pstats files are cProfile output for snakeviz or flameprof.
+    """
+    if name == 'merged.folded':
+        merged = profiler.merged_folded(session_id)
+        if merged is None:
+            return jsonify({'detail': 'No sampled profiles in this session'}), 404
+        return Response(merged, mimetype='text/plain',
+                        headers={'Content-Disposition': f'attachment; filename={session_id}.folded'})
+    
+    path = profiler.profile_path(session_id, name)
+    if path is None:
+        return jsonify({'detail': 'Profile not found'}), 404
+    mimetype = 'text/plain' if name.endswith('.folded') else 'application/octet-stream'
+    return send_file(path, mimetype=mimetype, as_attachment=True, download_name=f'{session_id}-{name}')
+
+
 # ============= ERROR HANDLERS =============
 @app.errorhandler(404)
 def not_found(error):
@@ -1038,24 +1610,6 @@ def forbidden(error):
     }), 403
 
 
-# saved predictions
-
-import csv
-from datetime import datetime
-import os
-
-LOG_FILE = "logs/predictions.csv"
-os.makedirs("logs", exist_ok=True)
-
-def log_prediction(inputs, prediction):
-    file_exists = os.path.isfile(LOG_FILE)
-    with open(LOG_FILE, "a", newline="") as f:
-        writer = csv.writer(f)
-        if not file_exists:
-            writer.writerow(["timestamp", "inputs", "prediction"])
-        writer.writerow([datetime.now(), inputs, prediction])
-
-
 if __name__ == '__main__':   
     print(" Starting Loan Payback Prediction API...")
     print(f" Server: http://127.0.0.1:5000")
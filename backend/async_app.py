@@ -0,0 +1,1059 @@
+"""Asyncio (FastAPI) variant of the API, with the same routes and responses as app.py.
+
+    python async_app.py                      # http://127.0.0.1:5001
+    uvicorn async_app:app --port 5001 --workers 4
+
+Handlers never block the event loop: users, predictions, history and
+statistics go through an aiomysql pool (async_db.py), while model scoring,
+CSV parsing and bulk batch writes run in a thread pool of
+ASYNC_EXECUTOR_THREADS threads. Upload bodies are received by the event
+loop, so one process keeps thousands of slow uploads open at the cost of
+a socket and a buffer each rather than a thread. The model, coalescer,
+write-behind writer, audit log and batch jobs are the ones app.py uses
+(services.py), configured by the same environment variables.
+"""
+import asyncio
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from functools import partial
+
+import pandas as pd
+from fastapi import Depends, FastAPI, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.exceptions import HTTPException as StarletteHTTPException
+
+from async_db import AsyncDatabase
+from auth import User, authenticate_user, create_access_token, get_current_admin_user, get_current_user
+from batch_jobs import InMemoryJobStore, score_batch_chunk, describe_job
+from database import Database, RECENT_ACTIVITY_TYPES
+from metrics import REGISTRY, STAGE_SECONDS, PREDICTIONS, CONTENT_TYPE, record_request, serving_collector
+from pagination import encode_cursor, decode_cursor, parse_outcome
+from prediction_writer import WriterBusy
+from coalescer import CoalescerBusy
+from parallel_scoring import stop_pool
+from services import (BATCH_CHUNK_ROWS, build_models, build_coalescer, build_prediction_writer,
+                      build_audit_log, build_batch_jobs, start_scoring_pool)
+
+JWT_EXPIRATION_HOURS = 24
+
+# Batch scoring workers are forked before a LightGBM model is built or a thread starts
+start_scoring_pool()
+models = build_models()
+db = AsyncDatabase()
+# Blocking work: bulk batch writes, batch jobs and the write-behind writer
+sync_db = Database(connect=False)
+executor = ThreadPoolExecutor(max_workers=int(os.environ.get('ASYNC_EXECUTOR_THREADS', 8)),
+                              thread_name_prefix='async-app')
+job_store = InMemoryJobStore() if os.environ.get('BATCH_JOB_STORE') == 'memory' else None
+
+coalescer = None
+prediction_writer = None
+audit_log = None
+batch_jobs = None
+ready = asyncio.Event()
+REGISTRY.add_collector(serving_collector(models, db))
+
+
+def get_job_store():
+    """Where batch job rows are kept: the in-memory stand-in or the database"""
+    return job_store or sync_db
+
+
+async def run_blocking(function, *args, **kwargs):
+    """Run a blocking call in the executor"""
+    return await asyncio.get_running_loop().run_in_executor(executor, partial(function, *args, **kwargs))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global coalescer, prediction_writer, audit_log, batch_jobs
+    app.state.db = db
+    await db.connect()
+    coalescer = build_coalescer(models.current())
+    prediction_writer = build_prediction_writer(sync_db)
+    audit_log = build_audit_log()
+    batch_jobs = build_batch_jobs(get_job_store, models.current, audit_log)
+    await run_blocking(models.warm_up)
+    ready.set()
+    yield
+    ready.clear()
+    if coalescer:
+        await run_blocking(coalescer.stop)
+    if batch_jobs:
+        await run_blocking(batch_jobs.stop, 30)
+    if prediction_writer:
+        await run_blocking(prediction_writer.close)
+    if audit_log:
+        await run_blocking(audit_log.close)
+    await db.disconnect()
+    sync_db.disconnect()
+    executor.shutdown(wait=False)
+    stop_pool()
+
+
+class RequestMetrics:
+    """ASGI middleware recording each request's endpoint, status and duration"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router leaves the matched route in the scope
+            route = scope.get('route')
+            endpoint = getattr(route, 'path_format', None) or 'unmatched'
+            record_request(scope['method'], endpoint, status, time.perf_counter() - started)
+
+
+app = FastAPI(title='Loan Payback Prediction API', version='1.0.0', lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+app.add_middleware(RequestMetrics)
+
+
+def respond(content, status_code=200):
+    with STAGE_SECONDS.time('serialization'):
+        return JSONResponse(jsonable_encoder(content), status_code=status_code)
+
+
+def error(detail, status_code):
+    return JSONResponse({'detail': detail}, status_code=status_code)
+
+
+def int_arg(request, name, default):
+    """Integer query parameter, falling back to default like Flask's args.get(type=int)"""
+    try:
+        return int(request.query_params.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+async def json_body(request):
+    try:
+        return await request.json()
+    except Exception:
+        return None
+
+
+def to_float(row, keys):
+    for key in keys:
+        if key in row and row[key] is not None:
+            row[key] = float(row[key])
+
+
+def to_int(row, keys):
+    for key in keys:
+        if key in row and row[key] is not None:
+            row[key] = int(row[key])
+
+
+def to_isoformat(row, keys):
+    for key in keys:
+        if row.get(key):
+            row[key] = row[key].isoformat()
+
+
+def issue_token(user_id, username):
+    return create_access_token({'user_id': user_id, 'username': username},
+                               expires_delta=timedelta(hours=JWT_EXPIRATION_HOURS))
+
+
+class SavedUpload:
+    """An UploadFile with the save() BatchJobRunner.submit expects of an upload"""
+
+    def __init__(self, upload):
+        self.upload = upload
+        self.filename = upload.filename
+
+    def save(self, path):
+        self.upload.file.seek(0)
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(self.upload.file, f, 1024 * 1024)
+
+
+async def csv_upload(request):
+    """(form, upload) of a multipart CSV upload, or (None, error response)"""
+    form = await request.form()
+    file = form.get('file')
+    if file is None or isinstance(file, str):
+        return None, error('No file uploaded', 400)
+    if file.filename == '':
+        return None, error('No file selected', 400)
+    if not file.filename.endswith('.csv'):
+        return None, error('Only CSV files are supported', 400)
+    return form, file
+
+
+# ============= HEALTH CHECK =============
+@app.get('/')
+async def index():
+    """Root endpoint"""
+    return {
+        'message': 'Loan Payback Prediction API',
+        'version': '1.0.0',
+        'status': 'running',
+        'server': 'asyncio',
+        'endpoints': {route.name: route.path for route in app.routes if hasattr(route, 'methods')}
+    }
+
+
+@app.get('/health')
+async def health_check():
+    """Health check endpoint"""
+    predictor = models.current()
+    return respond({
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'ready': ready.is_set(),
+        'pid': os.getpid(),
+        'model_loaded': predictor.is_loaded(),
+        'model_version': predictor.model_version,
+        'model_error': predictor.load_error,
+        'approval_threshold': predictor.threshold,
+        'engine': predictor.engine,
+        'database_connected': await db.ensure_connection(),
+        'database_pool': db.get_pool_metrics(),
+        'batch_database_pool': sync_db.get_pool_metrics(),
+        'executor_threads': executor._max_workers,
+        'user_cache': db.get_user_cache_metrics(),
+        'features': len(predictor.feature_names) if predictor.feature_names else 0,
+        'metrics': predictor.get_metrics(),
+        'coalescer': coalescer.get_metrics() if coalescer else None,
+        'prediction_writer': prediction_writer.get_metrics() if prediction_writer else None,
+        'audit_log': audit_log.get_metrics() if audit_log else None,
+        'batch_jobs': batch_jobs.get_metrics() if batch_jobs else None
+    })
+
+
+@app.get('/ready')
+async def readiness_check():
+    """Readiness probe: 503 until this process has warmed up"""
+    if not ready.is_set():
+        return JSONResponse({'ready': False, 'pid': os.getpid()}, status_code=503)
+    return {'ready': True, 'pid': os.getpid()}
+
+
+@app.get('/metrics')
+async def prometheus_metrics():
+    """Prometheus metrics of this process"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+# ============= AUTHENTICATION ENDPOINTS =============
+@app.post('/register')
+async def register(request: Request):
+    """User registration"""
+    try:
+        if not await db.ensure_connection():
+            return error('Database connection failed', 500)
+
+        data = await json_body(request)
+        if not data:
+            return error('No data provided', 400)
+
+        username = data.get('username', '').strip()
+        email = data.get('email', '').strip()
+        password = data.get('password', '')
+        full_name = data.get('full_name', '').strip()
+
+        if not username or len(username) < 3:
+            return error('Username must be at least 3 characters', 400)
+        if not email or '@' not in email:
+            return error('Valid email is required', 400)
+        if not password or len(password) < 6:
+            return error('Password must be at least 6 characters', 400)
+
+        if await db.get_user_by_username(username):
+            return error('Username already exists', 400)
+        if await db.get_user_by_email(email):
+            return error('Email already registered', 400)
+
+        user_id = await db.create_user(username, email, password, full_name)
+        if not user_id:
+            return error('Failed to create user', 500)
+
+        print(f" User registered: {username} (ID: {user_id})")
+        return respond({
+            'message': 'User registered successfully',
+            'access_token': issue_token(user_id, username),
+            'token_type': 'bearer',
+            'user': {'id': user_id, 'username': username, 'email': email, 'full_name': full_name}
+        }, 201)
+
+    except Exception as e:
+        print(f"Registration error: {e}")
+        return error(f'Registration failed: {str(e)}', 500)
+
+
+@app.post('/token')
+async def login(request: Request):
+    """User login (form fields username and password)"""
+    try:
+        if not await db.ensure_connection():
+            return error('Database connection failed', 500)
+
+        form = await request.form()
+        username = (form.get('username') or '').strip()
+        password = form.get('password') or ''
+        if not username or not password:
+            return error('Username and password required', 400)
+
+        user = await authenticate_user(db, username, password)
+        if not user:
+            print(f"Invalid credentials for: {username}")
+            return error('Invalid username or password', 401)
+
+        await db.update_last_login(user['id'])
+        print(f"Login successful: {username}")
+        return respond({
+            'access_token': issue_token(user['id'], user['username']),
+            'token_type': 'bearer',
+            'user': {
+                'id': user['id'],
+                'username': user['username'],
+                'email': user['email'],
+                'full_name': user['full_name'],
+                'is_admin': user.get('is_admin', False)
+            }
+        })
+
+    except Exception as e:
+        print(f" Login error: {e}")
+        return error(f'Login failed: {str(e)}', 500)
+
+
+@app.get('/me')
+async def get_me(current_user: User = Depends(get_current_user)):
+    """Get current user info"""
+    return respond({
+        'id': current_user['id'],
+        'username': current_user['username'],
+        'email': current_user['email'],
+        'full_name': current_user['full_name'],
+        'is_admin': current_user.get('is_admin', False),
+        'created_at': current_user['created_at'].isoformat() if current_user.get('created_at') else None,
+        'last_login': current_user['last_login'].isoformat() if current_user.get('last_login') else None
+    })
+
+
+@app.put('/me/update')
+async def update_profile(request: Request, current_user: User = Depends(get_current_user)):
+    """Update user profile"""
+    try:
+        data = await json_body(request)
+        if not data:
+            return error('No data provided', 400)
+
+        full_name = data.get('full_name')
+        email = data.get('email')
+
+        if email and email != current_user['email']:
+            existing = await db.get_user_by_email(email)
+            if existing and existing['id'] != current_user['id']:
+                return error('Email already in use', 400)
+
+        if await db.update_user_profile(current_user['id'], full_name, email):
+            updated_user = await db.get_user_by_id(current_user['id'])
+            print(f" Profile updated for: {current_user['username']}")
+            return respond({
+                'message': 'Profile updated successfully',
+                'user': {
+                    'id': updated_user['id'],
+                    'username': updated_user['username'],
+                    'email': updated_user['email'],
+                    'full_name': updated_user['full_name']
+                }
+            })
+
+        return error('Failed to update profile', 500)
+
+    except Exception as e:
+        print(f" Profile update error: {e}")
+        return error(str(e), 500)
+
+
+@app.post('/forgot-password')
+async def forgot_password(request: Request):
+    """Request password reset"""
+    try:
+        data = await json_body(request)
+        if not data:
+            return error('No data provided', 400)
+
+        email = data.get('email', '').strip()
+        if not email:
+            return error('Email is required', 400)
+
+        user = await db.get_user_by_email(email)
+        # Always return success to prevent email enumeration
+        if user:
+            token = await db.create_reset_token(user['id'])
+            print(f" Password reset token generated for: {email}")
+            return respond({
+                'message': 'Password reset instructions sent',
+                'reset_token': token  # Remove this in production!
+            })
+
+        return respond({'message': 'If email exists, reset instructions have been sent'})
+
+    except Exception as e:
+        print(f" Forgot password error: {e}")
+        return error(str(e), 500)
+
+
+@app.post('/reset-password')
+async def reset_password(request: Request):
+    """Reset password with token"""
+    try:
+        data = await json_body(request)
+        if not data:
+            return error('No data provided', 400)
+
+        token = data.get('token', '').strip()
+        new_password = data.get('new_password', '')
+        if not token or not new_password:
+            return error('Token and new password required', 400)
+        if len(new_password) < 8:
+            return error('Password must be at least 8 characters', 400)
+
+        token_data = await db.verify_reset_token(token)
+        if not token_data:
+            return error('Invalid or expired token', 400)
+
+        if await db.update_password(token_data['user_id'], new_password):
+            await db.use_reset_token(token)
+            print(f"Password reset successful for user ID: {token_data['user_id']}")
+            return respond({'message': 'Password reset successful'})
+
+        return error('Failed to reset password', 500)
+
+    except Exception as e:
+        print(f" Reset password error: {e}")
+        return error(str(e), 500)
+
+
+# ============= PREDICTION ENDPOINTS =============
+@app.post('/predict')
+async def predict_single(request: Request, current_user: User = Depends(get_current_user)):
+    """Single loan prediction"""
+    try:
+        predictor = models.current()
+        if not predictor.is_loaded():
+            return error('Model not loaded', 500)
+
+        data = await json_body(request)
+        with STAGE_SECONDS.time('validation'):
+            if not data:
+                return error('No data provided', 400)
+
+            try:
+                features = {
+                    'annual_income': float(data.get('annual_income', 0)),
+                    'debt_to_income_ratio': float(data.get('debt_to_income_ratio', 0)),
+                    'credit_score': int(data.get('credit_score', 0)),
+                    'loan_amount': float(data.get('loan_amount', 0)),
+                    'interest_rate': float(data.get('interest_rate', 0)),
+                    'gender': str(data.get('gender', 'Male')),
+                    'marital_status': str(data.get('marital_status', 'Single')),
+                    'education_level': str(data.get('education_level', 'High School')),
+                    'employment_status': str(data.get('employment_status', 'Employed')),
+                    'loan_purpose': str(data.get('loan_purpose', 'Other')),
+                    'grade_subgrade': str(data.get('grade_subgrade', 'C1'))
+                }
+            except (ValueError, TypeError) as e:
+                return error(f'Invalid data format: {str(e)}', 400)
+
+        # The coalescer scores on its own thread; awaiting its future keeps the loop free
+        if coalescer:
+            try:
+                future = coalescer.submit(features, predictor)
+                result = await asyncio.wait_for(asyncio.wrap_future(future), coalescer.timeout)
+            except asyncio.TimeoutError:
+                coalescer.abandon(future)
+                return error(f'No prediction within {coalescer.timeout}s, retry shortly', 503)
+            except CoalescerBusy as e:
+                return error(f'{e}, retry shortly', 503)
+        else:
+            result = await run_blocking(predictor.predict_single, features)
+        PREDICTIONS.inc('single', 'approved' if result['prediction'] == 1 else 'rejected')
+
+        prediction_data = {
+            'applicant_name': data.get('applicant_name', 'Unknown'),
+            **features,
+            'prediction': result['prediction'],
+            'probability': result['probability'],
+            'risk_score': result.get('risk_score'),
+            'rejection_reasons': result.get('rejection_reasons'),
+            'model_version': predictor.model_version
+        }
+
+        with STAGE_SECONDS.time('db_write'):
+            if prediction_writer:
+                try:
+                    prediction_id = await run_blocking(prediction_writer.submit, current_user['id'], prediction_data)
+                except WriterBusy as e:
+                    return error(f'{e}, retry shortly', 503)
+            else:
+                prediction_id = await db.save_prediction(current_user['id'], prediction_data)
+
+        if audit_log:
+            audit_log.log_single(current_user['id'], prediction_id, prediction_data)
+
+        return respond({
+            'prediction': result['prediction'],
+            'probability': result['probability'],
+            'status': result['status'],
+            'threshold': result['threshold'],
+            'model_version': predictor.model_version,
+            'risk_score': result.get('risk_score'),
+            'rejection_reasons': result.get('rejection_reasons'),
+            'prediction_id': prediction_id
+        })
+
+    except Exception as e:
+        print(f" Prediction error: {e}")
+        return error(f'Prediction failed: {str(e)}', 500)
+
+
+def store_chunk(user_id, batch_id, predictor, df, row_offset):
+    """Score one chunk and store its rows (runs in the executor)"""
+    chunk = score_batch_chunk(predictor, df, row_offset=row_offset)
+    if len(chunk['scored']):
+        with STAGE_SECONDS.time('db_write'):
+            if not sync_db.save_batch_prediction_columns(batch_id, chunk['scored']):
+                raise RuntimeError(f'failed to save rows {row_offset + 1}-{row_offset + len(df)}')
+        if audit_log:
+            audit_log.log_batch(user_id, batch_id, chunk['scored'])
+    return chunk
+
+
+async def stream_batch(current_user, predictor, form, file, file_size_kb, start_time):
+    """NDJSON response for a batch upload read BATCH_CHUNK_ROWS rows at a time (see app.stream_batch)"""
+    try:
+        reader = await run_blocking(pd.read_csv, file.file, chunksize=BATCH_CHUNK_ROWS)
+        with STAGE_SECONDS.time('csv_read'):
+            first_chunk = await run_blocking(next, reader, None)
+    except Exception as e:
+        return error(f'Failed to read CSV: {str(e)}', 400)
+
+    if first_chunk is None or first_chunk.empty:
+        return error('CSV file is empty', 400)
+
+    batch_data = {
+        'batch_name': form.get('batch_name', file.filename),
+        'filename': file.filename,
+        'file_size_kb': file_size_kb,
+        'total_applications': 0,
+        'approved_applications': 0,
+        'rejected_applications': 0,
+        'approval_rate': 0,
+        'processing_time_seconds': 0
+    }
+    with STAGE_SECONDS.time('db_write'):
+        batch_id = await run_blocking(sync_db.save_batch_prediction, current_user['id'], batch_data)
+    if not batch_id:
+        return error('Failed to save batch', 500)
+
+    async def generate():
+        total_applications = approved_count = rejected_count = error_count = 0
+        threshold = predictor.threshold
+        failure = None
+
+        yield json.dumps({
+            'type': 'batch',
+            'batch_id': batch_id,
+            'model_version': predictor.model_version,
+            'chunk_rows': BATCH_CHUNK_ROWS
+        }) + '\n'
+
+        try:
+            df = first_chunk
+            while df is not None:
+                chunk = await run_blocking(store_chunk, current_user['id'], batch_id, predictor, df,
+                                           total_applications)
+                total_applications += len(df)
+                approved_count += chunk['approved']
+                rejected_count += chunk['rejected']
+                error_count += chunk['errors']
+                threshold = chunk['threshold']
+                yield ''.join(json.dumps({'type': 'result', **result}) + '\n' for result in chunk['results'])
+
+                with STAGE_SECONDS.time('csv_read'):
+                    df = await run_blocking(next, reader, None)
+        except Exception as e:
+            print(f" Streaming batch error: {e}")
+            failure = str(e)
+        finally:
+            await file.close()
+
+        processing_time = round(time.time() - start_time, 3)
+        successful_predictions = approved_count + rejected_count
+        approval_rate = round((approved_count / successful_predictions * 100), 2) if successful_predictions > 0 else 0
+        batch_data.update({
+            'total_applications': total_applications,
+            'approved_applications': approved_count,
+            'rejected_applications': rejected_count,
+            'approval_rate': approval_rate,
+            'processing_time_seconds': processing_time
+        })
+        await run_blocking(sync_db.update_batch_prediction, batch_id, batch_data)
+
+        if failure:
+            yield json.dumps({'type': 'error', 'batch_id': batch_id, 'detail': f'Batch processing failed: {failure}',
+                              'rows_processed': total_applications}) + '\n'
+            return
+
+        yield json.dumps({
+            'type': 'summary',
+            'batch_id': batch_id,
+            'total_applications': total_applications,
+            'approved_applications': approved_count,
+            'rejected_applications': rejected_count,
+            'error_count': error_count,
+            'approval_rate': f"{approval_rate}%",
+            'threshold': threshold,
+            'model_version': predictor.model_version,
+            'processing_time_seconds': processing_time,
+            'file_size_kb': file_size_kb
+        }) + '\n'
+
+    return StreamingResponse(generate(), media_type='application/x-ndjson')
+
+
+def score_file(user_id, predictor, file, batch_name, file_size_kb, start_time):
+    """Read, score and store a whole CSV upload (runs in the executor); (response body, status)"""
+    try:
+        with STAGE_SECONDS.time('csv_read'):
+            df = pd.read_csv(file.file)
+    except Exception as e:
+        return {'detail': f'Failed to read CSV: {str(e)}'}, 400
+    if df.empty:
+        return {'detail': 'CSV file is empty'}, 400
+
+    chunk = score_batch_chunk(predictor, df)
+    scored = chunk['scored']
+    approved_count = chunk['approved']
+    rejected_count = chunk['rejected']
+    processing_time = round(time.time() - start_time, 3)
+    successful_predictions = approved_count + rejected_count
+    approval_rate = round((approved_count / successful_predictions * 100), 2) if successful_predictions > 0 else 0
+
+    with STAGE_SECONDS.time('db_write'):
+        batch_id = sync_db.save_batch_prediction(user_id, {
+            'batch_name': batch_name,
+            'filename': file.filename,
+            'file_size_kb': file_size_kb,
+            'total_applications': len(df),
+            'approved_applications': approved_count,
+            'rejected_applications': rejected_count,
+            'approval_rate': approval_rate,
+            'processing_time_seconds': processing_time
+        })
+        if not batch_id:
+            return {'detail': 'Failed to save batch'}, 500
+        # A failure part-way removes the whole batch (see app.predict_batch)
+        if len(scored) and not sync_db.save_batch_prediction_columns(batch_id, scored):
+            if not sync_db.delete_batch_prediction(batch_id):
+                print(f" Batch {batch_id} is partially stored and could not be removed")
+            return {'detail': 'Failed to save batch results'}, 500
+    if audit_log:
+        audit_log.log_batch(user_id, batch_id, scored)
+
+    return {
+        'batch_id': batch_id,
+        'results': chunk['results'],
+        'total_applications': len(df),
+        'approved_applications': approved_count,
+        'rejected_applications': rejected_count,
+        'error_count': chunk['errors'],
+        'approval_rate': f"{approval_rate}%",
+        'threshold': chunk['threshold'],
+        'model_version': predictor.model_version,
+        'processing_time_seconds': processing_time,
+        'file_size_kb': file_size_kb
+    }, 200
+
+
+@app.post('/predict/batch')
+async def predict_batch(request: Request, current_user: User = Depends(get_current_user)):
+    """Batch loan predictions from CSV"""
+    try:
+        predictor = models.current()
+        if not predictor.is_loaded():
+            return error('Model not loaded', 500)
+
+        start_time = time.time()
+        form, file = await csv_upload(request)
+        if form is None:
+            return file
+
+        file_size_kb = round(file.size / 1024, 2) if file.size is not None else 0
+
+        if request.query_params.get('stream', '').lower() in ('1', 'true') or \
+                'application/x-ndjson' in request.headers.get('accept', ''):
+            return await stream_batch(current_user, predictor, form, file, file_size_kb, start_time)
+
+        print(f" Processing batch upload for {current_user['username']}")
+        body, status_code = await run_blocking(score_file, current_user['id'], predictor, file,
+                                               form.get('batch_name', file.filename), file_size_kb, start_time)
+        return respond(body, status_code)
+
+    except Exception as e:
+        print(f" Batch prediction error: {e}")
+        return error(f'Batch processing failed: {str(e)}', 500)
+
+
+@app.post('/predict/batch/jobs')
+async def submit_batch_job(request: Request, current_user: User = Depends(get_current_user)):
+    """Queue a CSV for background scoring; returns a job id straight away"""
+    try:
+        if batch_jobs is None:
+            return error('Batch jobs are disabled', 503)
+
+        form, file = await csv_upload(request)
+        if form is None:
+            return file
+
+        store = get_job_store()
+        try:
+            job_id = await run_blocking(batch_jobs.submit, store, current_user['id'], SavedUpload(file),
+                                        form.get('batch_name', file.filename))
+        except ValueError as e:
+            return error(str(e), 400)
+        if not job_id:
+            return error('Failed to queue batch job', 500)
+
+        job = describe_job(await get_batch_job_row(job_id))
+        job['status_url'] = f'/predict/batch/jobs/{job_id}'
+        return respond(job, 202)
+
+    except Exception as e:
+        print(f" Batch job submit error: {e}")
+        return error(f'Failed to queue batch job: {str(e)}', 500)
+
+
+async def get_batch_job_row(job_id):
+    return job_store.get_batch_job(job_id) if job_store else await db.get_batch_job(job_id)
+
+
+@app.get('/predict/batch/jobs')
+async def get_batch_jobs(request: Request, current_user: User = Depends(get_current_user)):
+    """Get user's batch jobs with their progress"""
+    limit = int_arg(request, 'limit', 20)
+    if limit < 1 or limit > 50:
+        limit = 20
+
+    if job_store:
+        rows = job_store.get_user_batch_jobs(current_user['id'], limit)
+    else:
+        rows = await db.get_user_batch_jobs(current_user['id'], limit)
+    jobs = [describe_job(job) for job in rows]
+    return respond({'jobs': jobs, 'total': len(jobs), 'limit': limit})
+
+
+@app.get('/predict/batch/jobs/{job_id:int}')
+async def get_batch_job(job_id: int, current_user: User = Depends(get_current_user)):
+    """Status, rows processed, throughput and ETA of one batch job"""
+    job = await get_batch_job_row(job_id)
+    if not job:
+        return error('Job not found', 404)
+    if job['user_id'] != current_user['id']:
+        return error('Access denied', 403)
+    return respond(describe_job(job))
+
+
+# ============= HISTORY ENDPOINTS =============
+@app.get('/history/predictions')
+async def get_prediction_history(request: Request, current_user: User = Depends(get_current_user)):
+    """Get user's prediction history"""
+    limit = int_arg(request, 'limit', 50)
+    if limit < 1 or limit > 100:
+        limit = 50
+
+    try:
+        cursor = request.query_params.get('cursor')
+        after = decode_cursor(cursor, 'predictions', datetime, int) if cursor else None
+        outcome = parse_outcome(request.query_params.get('outcome'))
+    except ValueError as e:
+        return error(str(e), 400)
+
+    # One extra row tells whether another page exists
+    predictions = await db.get_user_predictions(current_user['id'], limit + 1, after=after, outcome=outcome)
+    next_cursor = None
+    if len(predictions) > limit:
+        predictions = predictions[:limit]
+        next_cursor = encode_cursor('predictions', predictions[-1]['created_at'], predictions[-1]['id'])
+
+    for pred in predictions:
+        to_isoformat(pred, ['created_at'])
+        to_float(pred, ['annual_income', 'debt_to_income_ratio', 'loan_amount', 'interest_rate',
+                        'probability', 'risk_score'])
+
+    return respond({'predictions': predictions, 'total': len(predictions), 'limit': limit,
+                    'next_cursor': next_cursor})
+
+
+@app.get('/history/batch')
+async def get_batch_history(request: Request, current_user: User = Depends(get_current_user)):
+    """Get user's batch prediction history"""
+    limit = int_arg(request, 'limit', 20)
+    if limit < 1 or limit > 50:
+        limit = 20
+
+    try:
+        cursor = request.query_params.get('cursor')
+        after = decode_cursor(cursor, 'batches', datetime, int) if cursor else None
+    except ValueError as e:
+        return error(str(e), 400)
+
+    batches = await db.get_user_batch_predictions(current_user['id'], limit + 1, after=after)
+    next_cursor = None
+    if len(batches) > limit:
+        batches = batches[:limit]
+        next_cursor = encode_cursor('batches', batches[-1]['processed_at'], batches[-1]['id'])
+
+    for batch in batches:
+        to_isoformat(batch, ['processed_at'])
+        to_float(batch, ['approval_rate', 'processing_time_seconds', 'file_size_kb'])
+
+    return respond({'batches': batches, 'total': len(batches), 'limit': limit, 'next_cursor': next_cursor})
+
+
+@app.get('/history/batch/{batch_id:int}')
+async def get_batch_details(batch_id: int, request: Request, current_user: User = Depends(get_current_user)):
+    """Get details of a specific batch prediction"""
+    batch = await db.get_batch_prediction_by_id(batch_id)
+    if not batch:
+        return error('Batch not found', 404)
+    if batch['user_id'] != current_user['id']:
+        return error('Access denied', 403)
+
+    limit = int_arg(request, 'limit', 500)
+    if limit < 1 or limit > 5000:
+        limit = 500
+
+    try:
+        cursor = request.query_params.get('cursor')
+        after = decode_cursor(cursor, f'batch-{batch_id}', int)[0] if cursor else None
+        outcome = parse_outcome(request.query_params.get('outcome'))
+    except ValueError as e:
+        return error(str(e), 400)
+
+    details = await db.get_batch_prediction_details(batch_id, limit + 1, after=after, outcome=outcome)
+    next_cursor = None
+    if len(details) > limit:
+        details = details[:limit]
+        next_cursor = encode_cursor(f'batch-{batch_id}', details[-1]['row_number'])
+
+    to_isoformat(batch, ['processed_at'])
+    to_float(batch, ['approval_rate', 'processing_time_seconds', 'file_size_kb'])
+    for detail in details:
+        to_float(detail, ['annual_income', 'loan_amount', 'interest_rate', 'debt_to_income_ratio',
+                          'probability', 'risk_score'])
+
+    return respond({'batch': batch, 'details': details, 'total_details': len(details), 'limit': limit,
+                    'next_cursor': next_cursor})
+
+
+# ============= STATISTICS ENDPOINTS =============
+@app.get('/statistics')
+async def get_statistics(current_user: User = Depends(get_current_user)):
+    """Get user's prediction statistics"""
+    counters = await db.get_user_counters(current_user['id'])
+    if counters is None:
+        return error('Statistics not available', 500)
+
+    total_predictions = int(counters['single_predictions'])
+    approved = int(counters['single_approved'])
+    rejected = int(counters['single_rejected'])
+    total_batches = int(counters['batch_predictions'])
+    total_batch_applications = int(counters['batch_applications'])
+    total_batch_approved = int(counters['batch_approved'])
+    total_batch_rejected = int(counters['batch_rejected'])
+
+    return respond({
+        'single_predictions': {
+            'total': total_predictions,
+            'approved': approved,
+            'rejected': rejected,
+            'approval_rate': round((approved / total_predictions * 100), 2) if total_predictions > 0 else 0
+        },
+        'batch_predictions': {
+            'total_batches': total_batches,
+            'total_applications': total_batch_applications,
+            'total_approved': total_batch_approved,
+            'total_rejected': total_batch_rejected,
+            'approval_rate': round((total_batch_approved / total_batch_applications * 100), 2) if total_batch_applications > 0 else 0
+        },
+        'overall': {
+            'total_predictions': total_predictions + total_batch_applications,
+            'total_approved': approved + total_batch_approved,
+            'total_rejected': rejected + total_batch_rejected
+        }
+    })
+
+
+@app.get('/statistics/user')
+async def get_user_stats(current_user: User = Depends(get_current_user)):
+    """Get comprehensive user statistics from view"""
+    stats = await db.get_user_statistics(current_user['id'])
+    if not stats:
+        return error('Statistics not available', 404)
+
+    to_isoformat(stats, ['created_at', 'last_login'])
+    to_int(stats, ['total_applications_processed', 'total_approved', 'total_rejected'])
+    return respond(stats)
+
+
+@app.get('/statistics/credit-score')
+async def get_credit_score_analysis(current_user: User = Depends(get_current_user)):
+    """Get approval rates by credit score ranges"""
+    analysis = await db.get_approval_by_credit_score()
+    for item in analysis:
+        to_float(item, ['total_applications', 'approved', 'rejected', 'approval_rate'])
+    return respond({'credit_score_analysis': analysis, 'total_ranges': len(analysis)})
+
+
+@app.get('/statistics/recent')
+async def get_recent_predictions(request: Request, current_user: User = Depends(get_current_user)):
+    """Get recent predictions summary"""
+    limit = int_arg(request, 'limit', 50)
+    if limit < 1 or limit > 100:
+        limit = 50
+
+    try:
+        cursor = request.query_params.get('cursor')
+        before = decode_cursor(cursor, 'recent', datetime, str, int) if cursor else None
+        if before and before[1] not in RECENT_ACTIVITY_TYPES:
+            raise ValueError('Invalid cursor')
+    except ValueError as e:
+        return error(str(e), 400)
+    user_id = int_arg(request, 'user_id', None)
+
+    recent = await db.get_recent_predictions_summary(limit + 1, before=before, user_id=user_id)
+    next_cursor = None
+    if len(recent) > limit:
+        recent = recent[:limit]
+        last = recent[-1]
+        next_cursor = encode_cursor('recent', last['prediction_date'], last['prediction_type'], last['id'])
+
+    for item in recent:
+        to_isoformat(item, ['prediction_date'])
+        to_float(item, ['loan_amount', 'probability'])
+
+    return respond({'recent_predictions': recent, 'total': len(recent), 'limit': limit, 'next_cursor': next_cursor})
+
+
+# ============= ADMIN ENDPOINTS =============
+@app.get('/admin/users')
+async def admin_get_users(request: Request, current_user: User = Depends(get_current_admin_user)):
+    """Get all users (admin only)"""
+    include_inactive = request.query_params.get('include_inactive', 'false').lower() == 'true'
+    users = await db.get_all_users(include_inactive)
+    for user in users:
+        user.pop('hashed_password', None)
+        user.pop('reset_token', None)
+        to_isoformat(user, ['created_at', 'updated_at', 'last_login', 'reset_token_expiry'])
+    return respond({'users': users, 'total': len(users)})
+
+
+@app.post('/admin/users/{user_id:int}/deactivate')
+async def admin_deactivate_user(user_id: int, current_user: User = Depends(get_current_admin_user)):
+    """Deactivate a user (admin only)"""
+    if user_id == current_user['id']:
+        return error('Cannot deactivate your own account', 400)
+    if await db.deactivate_user(user_id):
+        print(f" User {user_id} deactivated by admin {current_user['username']}")
+        return respond({'message': 'User deactivated successfully'})
+    return error('Failed to deactivate user', 500)
+
+
+@app.post('/admin/users/{user_id:int}/activate')
+async def admin_activate_user(user_id: int, current_user: User = Depends(get_current_admin_user)):
+    """Activate a user (admin only)"""
+    if await db.activate_user(user_id):
+        print(f" User {user_id} activated by admin {current_user['username']}")
+        return respond({'message': 'User activated successfully'})
+    return error('Failed to activate user', 500)
+
+
+@app.get('/admin/statistics')
+async def admin_get_statistics(current_user: User = Depends(get_current_admin_user)):
+    """Get statistics for all users (admin only)"""
+    all_stats = await db.get_all_users_statistics()
+    for stats in all_stats:
+        to_isoformat(stats, ['created_at', 'last_login'])
+        to_int(stats, ['total_applications_processed', 'total_approved', 'total_rejected'])
+    return respond({'user_statistics': all_stats, 'total_users': len(all_stats)})
+
+
+@app.get('/admin/models')
+async def admin_get_models(current_user: User = Depends(get_current_admin_user)):
+    """List registered model versions and reload status (admin only)"""
+    return respond(models.get_status())
+
+
+@app.post('/admin/models/{version}/activate')
+async def admin_activate_model(version: str, current_user: User = Depends(get_current_admin_user)):
+    """Load a registered model version in the background and swap it in (admin only)"""
+    try:
+        models.activate(version)
+    except ValueError as e:
+        return error(str(e), 404)
+    except RuntimeError as e:
+        return error(str(e), 409)
+    print(f" Model version {version} activation started by admin {current_user['username']}")
+    return respond({
+        'message': 'Model activation started',
+        'version': version,
+        'active_version': models.current().model_version
+    }, 202)
+
+
+# ============= ERROR HANDLERS =============
+ERROR_BODIES = {
+    404: {'detail': 'Endpoint not found', 'error': '404 Not Found'},
+    405: {'detail': 'Method not allowed', 'error': '405 Method Not Allowed'}
+}
+
+
+@app.exception_handler(StarletteHTTPException)
+async def http_error(request, exc):
+    # Routing errors get app.py's bodies; errors raised by handlers keep their detail
+    if exc.status_code in ERROR_BODIES and exc.detail in ('Not Found', 'Method Not Allowed'):
+        return JSONResponse(ERROR_BODIES[exc.status_code], status_code=exc.status_code)
+    return JSONResponse({'detail': exc.detail}, status_code=exc.status_code, headers=getattr(exc, 'headers', None))
+
+
+@app.exception_handler(Exception)
+async def internal_error(request, exc):
+    print(f" Unhandled error on {request.url.path}: {exc}")
+    return JSONResponse({'detail': 'Internal server error', 'error': '500 Internal Server Error'}, status_code=500)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print(" Starting Loan Payback Prediction API (asyncio)...")
+    uvicorn.run(app, host=os.environ.get('ASYNC_HOST', '127.0.0.1'), port=int(os.environ.get('ASYNC_PORT', 5001)),
+                timeout_keep_alive=15, log_level='warning')
@@ -0,0 +1,351 @@
+"""Asyncio access to the loan_payback database through an aiomysql pool.
+
+AsyncDatabase serves the request path of async_app.py: users, single
+predictions, history, statistics and admin queries. Its methods mirror
+Database's names and return values (None, False or [] on error), and the
+paged and rollup queries come from the same builders in database.py, so
+both APIs read and write the schema identically. Bulk batch writes stay
+on Database, run in executor threads next to the scoring.
+"""
+import asyncio
+import hashlib
+import os
+import secrets
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import aiomysql
+
+from cache import TTLCache, SharedInvalidations
+from database import (PREDICTION_COLUMNS, USER_COUNTER_COLUMNS, USER_INVALIDATIONS_PATH, CREDIT_BAND_UPSERT,
+                      AUTO_INCREMENT_SESSION, _credit_band_counts, credit_band_rows, user_counter_upsert,
+                      prediction_history_query, batch_history_query, batch_details_query, recent_activity_query)
+
+
+class AsyncDatabase:
+    """MySQL data access for asyncio handlers"""
+
+    def __init__(self):
+        self.host = "localhost"
+        self.user = "root"
+        self.password = ""
+        self.database = "loan_payback"
+        self.pool_size = int(os.environ.get('DB_POOL_SIZE', 10))
+        self.pool_timeout = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+        self.pool = None
+        self._connect_lock = asyncio.Lock()
+        self.user_cache = TTLCache(
+            max_entries=int(os.environ.get('USER_CACHE_SIZE', 10000)),
+            ttl_seconds=float(os.environ.get('USER_CACHE_TTL', 30))
+        )
+        self._user_generations = {}
+        self._user_cache_epoch = 0
+        self.user_invalidations = SharedInvalidations(USER_INVALIDATIONS_PATH, max_age=self.user_cache.ttl)
+        self.checkout_timeouts = 0
+
+    async def connect(self):
+        """Open the pool (once); False if MySQL is unreachable"""
+        async with self._connect_lock:
+            if self.pool is not None:
+                return True
+            try:
+                self.pool = await aiomysql.create_pool(
+                    host=self.host,
+                    user=self.user,
+                    password=self.password,
+                    db=self.database,
+                    minsize=1,
+                    maxsize=self.pool_size,
+                    autocommit=True,
+                    pool_recycle=3600,
+                    # Odd ids, as Database's connections get (write-behind reserves even ones)
+                    init_command=AUTO_INCREMENT_SESSION
+                )
+                print("🟢 Database pool connected!")
+                return True
+            except Exception as e:
+                print(f"🔴 Error connecting to database: {e}")
+                return False
+
+    async def ensure_connection(self):
+        return self.pool is not None or await self.connect()
+
+    async def disconnect(self):
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+            print("Database pool closed!")
+
+    def get_pool_metrics(self):
+        if self.pool is None:
+            return {'size': self.pool_size, 'open': 0, 'in_use': 0, 'idle': 0, 'checkout_timeouts': self.checkout_timeouts}
+        in_use = self.pool.size - self.pool.freesize
+        return {
+            'size': self.pool.maxsize,
+            'open': self.pool.size,
+            'in_use': in_use,
+            'idle': self.pool.freesize,
+            'utilization': round(in_use / self.pool.maxsize, 4),
+            'checkout_timeouts': self.checkout_timeouts
+        }
+
+    @asynccontextmanager
+    async def cursor(self, dictionary=True, transaction=False):
+        """A cursor on a pooled connection, waiting at most pool_timeout for one.
+
+        With transaction=True the block runs in one transaction, committed
+        on exit and rolled back if it raises.
+        """
+        if not await self.ensure_connection():
+            raise ConnectionError('Database connection failed')
+        try:
+            connection = await asyncio.wait_for(self.pool.acquire(), self.pool_timeout)
+        except asyncio.TimeoutError:
+            self.checkout_timeouts += 1
+            raise ConnectionError(f'No database connection free after {self.pool_timeout}s')
+
+        try:
+            if transaction:
+                await connection.begin()
+            async with connection.cursor(aiomysql.DictCursor if dictionary else aiomysql.Cursor) as cursor:
+                yield cursor
+            if transaction:
+                await connection.commit()
+        except BaseException:
+            if transaction:
+                await connection.rollback()
+            raise
+        finally:
+            self.pool.release(connection)
+
+    async def _fetchone(self, action, query, params=()):
+        try:
+            async with self.cursor() as cursor:
+                await cursor.execute(query, params)
+                return await cursor.fetchone()
+        except Exception as e:
+            print(f"Error {action}: {e}")
+            return None
+
+    async def _fetchall(self, action, query, params=()):
+        try:
+            async with self.cursor() as cursor:
+                await cursor.execute(query, params)
+                return list(await cursor.fetchall())
+        except Exception as e:
+            print(f"Error {action}: {e}")
+            return []
+
+    async def _execute(self, action, query, params=()):
+        """Run one statement in its own transaction; the cursor's lastrowid, or None on error"""
+        try:
+            async with self.cursor(dictionary=False, transaction=True) as cursor:
+                await cursor.execute(query, params)
+                return cursor.lastrowid
+        except Exception as e:
+            print(f"Error {action}: {e}")
+            return None
+
+    #  USER MANAGEMENT
+
+    @staticmethod
+    def hash_password(password):
+        """Hash password using SHA-256 (the scheme of Database.hash_password)"""
+        return hashlib.sha256(password.encode()).hexdigest()
+
+    async def create_user(self, username, email, password, full_name=None):
+        return await self._execute("creating user", """
+            INSERT INTO users (username, email, hashed_password, full_name)
+            VALUES (%s, %s, %s, %s)
+        """, (username, email, self.hash_password(password), full_name))
+
+    async def get_user_by_username(self, username):
+        return await self._fetchone("fetching user", "SELECT * FROM users WHERE username = %s AND is_active = TRUE",
+                                    (username,))
+
+    async def get_user_by_email(self, email):
+        return await self._fetchone("fetching user", "SELECT * FROM users WHERE email = %s AND is_active = TRUE",
+                                    (email,))
+
+    async def get_user_by_id(self, user_id):
+        return await self._fetchone("fetching user", "SELECT * FROM users WHERE id = %s AND is_active = TRUE",
+                                    (user_id,))
+
+    async def get_user_by_id_cached(self, user_id):
+        """get_user_by_id served from the user cache when possible"""
+        self._apply_user_invalidations()
+        user = self.user_cache.get(user_id)
+        if user is None:
+            generation = self._user_generation(user_id)
+            user = await self.get_user_by_id(user_id)
+            # Skip the store if the user changed while we were reading it
+            if user and self._user_generation(user_id) == generation:
+                self.user_cache.put(user_id, user)
+        return dict(user) if user else None
+
+    def _user_generation(self, user_id):
+        return self._user_cache_epoch, self._user_generations.get(user_id, 0)
+
+    def _drop_cached_user(self, user_id):
+        self._user_generations[user_id] = self._user_generations.get(user_id, 0) + 1
+        self.user_cache.invalidate(user_id)
+
+    def _apply_user_invalidations(self):
+        """Drop users that any process (Flask workers included) changed since the last lookup"""
+        if self.user_cache.max_entries <= 0:
+            return
+        changed = self.user_invalidations.changes()
+        if changed is None:
+            self._user_cache_epoch += 1
+            self.user_cache.clear()
+            return
+        for user_id in changed:
+            self._drop_cached_user(int(user_id))
+
+    def invalidate_user(self, user_id):
+        """Drop a user's cached record after it changes, in this and every other process"""
+        self._drop_cached_user(user_id)
+        self.user_invalidations.publish(user_id)
+
+    def get_user_cache_metrics(self):
+        return self.user_cache.get_metrics()
+
+    async def verify_password(self, username, password):
+        user = await self.get_user_by_username(username)
+        return bool(user) and secrets.compare_digest(user['hashed_password'], self.hash_password(password))
+
+    async def update_last_login(self, user_id):
+        return await self._execute("updating last login", "UPDATE users SET last_login = NOW() WHERE id = %s",
+                                   (user_id,)) is not None
+
+    async def update_user_profile(self, user_id, full_name=None, email=None):
+        updates = {'full_name': full_name, 'email': email}
+        updates = {column: value for column, value in updates.items() if value is not None}
+        if not updates:
+            return False
+        query = f"UPDATE users SET {', '.join(f'{column} = %s' for column in updates)} WHERE id = %s"
+        updated = await self._execute("updating user profile", query, tuple(updates.values()) + (user_id,))
+        self.invalidate_user(user_id)
+        return updated is not None
+
+    #  PASSWORD RESET
+
+    async def create_reset_token(self, user_id):
+        token = secrets.token_urlsafe(32)
+        created = await self._execute("creating reset token", """
+            INSERT INTO password_reset_tokens (user_id, token, expires_at, is_used)
+            VALUES (%s, %s, %s, 0)
+        """, (user_id, token, datetime.now() + timedelta(hours=24)))
+        return token if created is not None else None
+
+    async def verify_reset_token(self, token):
+        return await self._fetchone("verifying token", """
+            SELECT * FROM password_reset_tokens
+            WHERE token = %s AND is_used = 0 AND expires_at > NOW()
+        """, (token,))
+
+    async def use_reset_token(self, token):
+        return await self._execute("using token", """
+            UPDATE password_reset_tokens SET is_used = 1, used_at = NOW() WHERE token = %s
+        """, (token,)) is not None
+
+    async def update_password(self, user_id, new_password):
+        updated = await self._execute("updating password", "UPDATE users SET hashed_password = %s WHERE id = %s",
+                                      (self.hash_password(new_password), user_id))
+        self.invalidate_user(user_id)
+        return updated is not None
+
+    #  SINGLE PREDICTIONS
+
+    async def save_prediction(self, user_id, prediction_data):
+        """Save a single prediction and update the user's counters and credit band in one transaction"""
+        columns = ('user_id',) + PREDICTION_COLUMNS
+        row = dict(prediction_data, user_id=user_id)
+        approved = 1 if prediction_data.get('prediction') == 1 else 0
+        counts = _credit_band_counts([prediction_data.get('credit_score')], [prediction_data.get('prediction')])
+        try:
+            async with self.cursor(dictionary=False, transaction=True) as cursor:
+                await cursor.execute(f"""
+                    INSERT INTO single_predictions ({', '.join(columns)})
+                    VALUES ({', '.join(['%s'] * len(columns))})
+                """, tuple(row.get(column) for column in columns))
+                prediction_id = cursor.lastrowid
+                await cursor.execute(*user_counter_upsert(user_id, {
+                    'single_predictions': 1,
+                    'single_approved': approved,
+                    'single_rejected': 1 - approved
+                }))
+                await cursor.executemany(CREDIT_BAND_UPSERT, credit_band_rows(counts))
+            return prediction_id
+        except Exception as e:
+            print(f"Error saving prediction: {e}")
+            return None
+
+    async def get_user_predictions(self, user_id, limit=50, after=None, outcome=None):
+        return await self._fetchall("fetching predictions", *prediction_history_query(user_id, limit, after, outcome))
+
+    #  BATCH PREDICTIONS AND JOBS
+
+    async def get_user_batch_predictions(self, user_id, limit=20, after=None):
+        return await self._fetchall("fetching batch predictions", *batch_history_query(user_id, limit, after))
+
+    async def get_batch_prediction_details(self, batch_id, limit=None, after=None, outcome=None):
+        return await self._fetchall("fetching batch details", *batch_details_query(batch_id, limit, after, outcome))
+
+    async def get_batch_prediction_by_id(self, batch_id):
+        return await self._fetchone("fetching batch", "SELECT * FROM batch_predictions WHERE id = %s", (batch_id,))
+
+    async def get_batch_job(self, job_id):
+        return await self._fetchone("fetching batch job", "SELECT * FROM batch_jobs WHERE id = %s", (job_id,))
+
+    async def get_user_batch_jobs(self, user_id, limit=20):
+        return await self._fetchall("fetching batch jobs", """
+            SELECT * FROM batch_jobs WHERE user_id = %s ORDER BY id DESC LIMIT %s
+        """, (user_id, limit))
+
+    #  STATISTICS & ANALYTICS
+
+    async def get_user_counters(self, user_id):
+        """Running prediction totals for one user (zeros if they have none)"""
+        try:
+            async with self.cursor() as cursor:
+                await cursor.execute(f"""
+                    SELECT {', '.join(USER_COUNTER_COLUMNS)} FROM user_prediction_counters WHERE user_id = %s
+                """, (user_id,))
+                return await cursor.fetchone() or dict.fromkeys(USER_COUNTER_COLUMNS, 0)
+        except Exception as e:
+            print(f"Error fetching user counters: {e}")
+            return None
+
+    async def get_user_statistics(self, user_id):
+        return await self._fetchone("fetching user statistics", "SELECT * FROM user_statistics WHERE id = %s",
+                                    (user_id,))
+
+    async def get_approval_by_credit_score(self):
+        return await self._fetchall("fetching credit score analysis", "SELECT * FROM approval_by_credit_score")
+
+    async def get_recent_predictions_summary(self, limit=50, before=None, user_id=None):
+        return await self._fetchall("fetching recent predictions", *recent_activity_query(limit, before, user_id))
+
+    async def get_all_users_statistics(self):
+        return await self._fetchall("fetching all user statistics",
+                                    "SELECT * FROM user_statistics ORDER BY created_at DESC")
+
+    #  ADMIN FUNCTIONS
+
+    async def get_all_users(self, include_inactive=False):
+        where = "" if include_inactive else "WHERE is_active = TRUE "
+        return await self._fetchall("fetching all users", f"SELECT * FROM users {where}ORDER BY created_at DESC")
+
+    async def deactivate_user(self, user_id):
+        updated = await self._execute("deactivating user", "UPDATE users SET is_active = FALSE WHERE id = %s",
+                                      (user_id,))
+        self.invalidate_user(user_id)
+        return updated is not None
+
+    async def activate_user(self, user_id):
+        updated = await self._execute("activating user", "UPDATE users SET is_active = TRUE WHERE id = %s",
+                                      (user_id,))
+        self.invalidate_user(user_id)
+        return updated is not None
@@ -0,0 +1,259 @@
+"""Buffered, rotating audit log of every prediction served.
+
+AuditLog.log_single() and log_batch() only append to an in-memory buffer;
+a background thread writes it out every flush_seconds (or sooner once
+max_buffer_rows are waiting). Records have a fixed, typed schema
+(AUDIT_SCHEMA), one column per input feature, and are written as
+gzip-compressed CSV segments: each flush appends one gzip member, so a
+segment is readable up to its last completed flush even after a crash. A
+segment is closed after max_bytes or rotate_seconds, and segment names
+carry the start time and process id, so several workers can log into the
+same directory.
+
+read_audit_log() streams segments back as DataFrames with the schema's
+dtypes:
+
+    python audit_log.py summary
+"""
+import glob
+import gzip
+import io
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+AUDIT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'audit')
+
+# Column order and reader dtypes of every audit record
+AUDIT_SCHEMA = {
+    'timestamp': 'datetime64[ns]',
+    'source': 'string',
+    'user_id': 'Int64',
+    'prediction_id': 'Int64',
+    'batch_id': 'Int64',
+    'row_number': 'Int64',
+    'model_version': 'string',
+    'applicant_name': 'string',
+    'annual_income': 'float64',
+    'debt_to_income_ratio': 'float64',
+    'credit_score': 'Int64',
+    'loan_amount': 'float64',
+    'interest_rate': 'float64',
+    'gender': 'string',
+    'marital_status': 'string',
+    'education_level': 'string',
+    'employment_status': 'string',
+    'loan_purpose': 'string',
+    'grade_subgrade': 'string',
+    'prediction': 'Int8',
+    'probability': 'float64',
+    'risk_score': 'float64',
+    'rejection_reasons': 'string'
+}
+AUDIT_COLUMNS = tuple(AUDIT_SCHEMA)
+
+
+class AuditLog:
+    """Prediction audit records buffered in memory and flushed by a background thread"""
+
+    def __init__(self, directory=AUDIT_DIR, flush_seconds=1.0, max_buffer_rows=50000,
+                 max_bytes=64 * 1024 * 1024, rotate_seconds=3600.0):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self.max_buffer_rows = max_buffer_rows
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._singles = []
+        self._frames = []
+        self._buffered_rows = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._segment = None
+        self._segment_started = 0.0
+        self._flush_times = deque(maxlen=4096)
+        self.records_logged = 0
+        self.records_written = 0
+        self.flushes = 0
+        self.bytes_written = 0
+        self.segments = 0
+        self.write_errors = 0
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='audit-log', daemon=True)
+        self._thread.start()
+        return self
+
+    def log_single(self, user_id, prediction_id, prediction_data):
+        """Record one /predict result (prediction_data as stored in single_predictions)"""
+        record = {column: prediction_data.get(column) for column in AUDIT_COLUMNS}
+        record.update(timestamp=datetime.now(), source='single', user_id=user_id, prediction_id=prediction_id)
+        self._append(singles=[record], rows=1)
+
+    def log_batch(self, user_id, batch_id, scored):
+        """Record the scored rows of a batch (a DataFrame of batch_prediction_details columns)"""
+        if not len(scored):
+            return
+        frame = scored.reindex(columns=AUDIT_COLUMNS)
+        frame['timestamp'] = datetime.now()
+        frame['source'] = 'batch'
+        frame['user_id'] = user_id
+        frame['batch_id'] = batch_id
+        self._append(frames=[frame], rows=len(frame))
+
+    def _append(self, singles=(), frames=(), rows=0):
+        with self._lock:
+            self._singles.extend(singles)
+            self._frames.extend(frames)
+            self._buffered_rows += rows
+            self.records_logged += rows
+            full = self._buffered_rows >= self.max_buffer_rows
+        if full:
+            self._wake.set()
+
+    def close(self, timeout=30.0):
+        """Write out everything still buffered"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """Write the buffer as one gzip member of the current segment"""
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            singles, self._singles = self._singles, []
+            frames, self._frames = self._frames, []
+            self._buffered_rows = 0
+        if singles:
+            frames.append(pd.DataFrame(singles, columns=AUDIT_COLUMNS))
+        if not frames:
+            return
+
+        started = time.perf_counter()
+        try:
+            records = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+            path, new_segment = self._current_segment()
+            buffer = io.StringIO()
+            records.to_csv(buffer, columns=AUDIT_COLUMNS, header=new_segment, index=False,
+                           date_format='%Y-%m-%dT%H:%M:%S.%f')
+            payload = gzip.compress(buffer.getvalue().encode('utf-8'), compresslevel=6)
+            with open(path, 'ab') as f:
+                f.write(payload)
+        except Exception as e:
+            with self._lock:
+                self.write_errors += 1
+            print(f" Audit log write failed, {sum(len(frame) for frame in frames)} records lost: {e}")
+            return
+
+        with self._lock:
+            self.flushes += 1
+            self.records_written += len(records)
+            self.bytes_written += len(payload)
+            self._flush_times.append(time.perf_counter() - started)
+
+    def _current_segment(self):
+        """(path, is_new) of the segment to append to, rotating by size and age"""
+        if self._segment is not None:
+            too_big = os.path.getsize(self._segment) >= self.max_bytes
+            too_old = time.monotonic() - self._segment_started >= self.rotate_seconds
+            if not (too_big or too_old):
+                return self._segment, False
+        stamp = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+        self._segment = os.path.join(self.directory, f'predictions-{stamp}-{os.getpid()}.csv.gz')
+        self._segment_started = time.monotonic()
+        self.segments += 1
+        return self._segment, True
+
+    def get_metrics(self):
+        """Buffer depth, throughput and flush latency"""
+        with self._lock:
+            flush_ms = np.asarray(self._flush_times) * 1000
+            return {
+                'buffered_records': self._buffered_rows,
+                'records_logged': self.records_logged,
+                'records_written': self.records_written,
+                'flushes': self.flushes,
+                'bytes_written': self.bytes_written,
+                'segments_opened': self.segments,
+                'current_segment': os.path.basename(self._segment) if self._segment else None,
+                'write_errors': self.write_errors,
+                'flush_p50_ms': round(float(np.percentile(flush_ms, 50)), 3) if flush_ms.size else 0,
+                'flush_max_ms': round(float(flush_ms.max()), 3) if flush_ms.size else 0
+            }
+
+
+def audit_segments(directory=AUDIT_DIR):
+    """Segment paths, oldest first"""
+    return sorted(glob.glob(os.path.join(directory, 'predictions-*.csv.gz')))
+
+
+def read_audit_log(directory=AUDIT_DIR, start=None, end=None, columns=None, chunksize=100000):
+    """Yield DataFrames of audit records, oldest segment first.
+
+    start/end (datetimes) keep records with start <= timestamp < end;
+    segments that began at or after `end` are not opened. columns limits
+    the columns parsed.
+    """
+    usecols = list(columns) if columns else list(AUDIT_COLUMNS)
+    if (start or end) and 'timestamp' not in usecols:
+        usecols.append('timestamp')
+    dtypes = {column: AUDIT_SCHEMA[column] for column in usecols if column != 'timestamp'}
+
+    for path in audit_segments(directory):
+        opened_at = datetime.strptime(os.path.basename(path).split('-')[1], '%Y%m%dT%H%M%S%f')
+        if end is not None and opened_at >= end:
+            break
+        reader = pd.read_csv(path, compression='gzip', usecols=usecols, dtype=dtypes,
+                             parse_dates=['timestamp'] if 'timestamp' in usecols else False,
+                             chunksize=chunksize)
+        for chunk in reader:
+            if start is not None:
+                chunk = chunk[chunk['timestamp'] >= start]
+            if end is not None:
+                chunk = chunk[chunk['timestamp'] < end]
+            if len(chunk):
+                yield chunk.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['summary'])
+    parser.add_argument('--dir', default=AUDIT_DIR)
+    parser.add_argument('--since', type=datetime.fromisoformat, help='ISO timestamp')
+    args = parser.parse_args()
+
+    records = approved = 0
+    sources = {}
+    for chunk in read_audit_log(args.dir, start=args.since, columns=['source', 'prediction']):
+        records += len(chunk)
+        approved += int((chunk['prediction'] == 1).sum())
+        for source, count in chunk['source'].value_counts().items():
+            sources[source] = sources.get(source, 0) + int(count)
+    print(json.dumps({
+        'segments': len(audit_segments(args.dir)),
+        'records': records,
+        'by_source': sources,
+        'approval_rate': round(approved / records * 100, 2) if records else 0
+    }, indent=2))
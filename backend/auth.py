@@ -1,27 +1,31 @@
 # auth.py
+"""FastAPI authentication dependencies for async_app.py.
+
+Tokens are the ones app.py issues (HS256, a user_id claim, same secret), so a
+client can log in against either API and call the other.
+"""
 from datetime import datetime, timedelta
-from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from typing import Any, Dict, Optional
+import jwt
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
 from pydantic import BaseModel
 import secrets
 import string
 
-from database import get_db, User
-
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from async_db import AsyncDatabase
+from metrics import STAGE_SECONDS
 
-# JWT settings
-SECRET_KEY = "your-secret-key-here-change-in-production"  # Change this in production!
+# JWT settings (the same key and lifetime as app.py)
+SECRET_KEY = "your-secret-key-change-in-production-2024"
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+ACCESS_TOKEN_EXPIRE_MINUTES = 24 * 60
+
+# OAuth2 scheme; a missing token is reported by get_current_user like app.py does
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
-# OAuth2 scheme
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# A row of the users table, as returned by AsyncDatabase
+User = Dict[str, Any]
 
 # Pydantic models
 class Token(BaseModel):
@@ -29,7 +33,7 @@ class Token(BaseModel):
     token_type: str
 
 class TokenData(BaseModel):
-    username: Optional[str] = None
+    user_id: Optional[int] = None
 
 class UserBase(BaseModel):
     username: str
@@ -60,25 +64,30 @@ class ChangePasswordRequest(BaseModel):
     old_password: str
     new_password: str
 
+# Database dependency
+def get_db(request: Request) -> AsyncDatabase:
+    """The AsyncDatabase opened by async_app.py at startup"""
+    return request.app.state.db
+
 # Password functions
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a plain password against a hashed password"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return secrets.compare_digest(get_password_hash(plain_password), hashed_password or '')
 
 def get_password_hash(password: str) -> str:
-    """Hash a password"""
-    return pwd_context.hash(password)
+    """Hash a password (SHA-256, as stored by Database.create_user)"""
+    return AsyncDatabase.hash_password(password)
 
 # Token functions
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
-    """Create a JWT access token"""
+    """Create a JWT access token; data carries user_id (and username)"""
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    
-    to_encode.update({"exp": expire, "type": "access"})
+
+    to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -88,59 +97,55 @@ def generate_reset_token(length: int = 32) -> str:
     return ''.join(secrets.choice(alphabet) for _ in range(length))
 
 # Authentication functions
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
+async def authenticate_user(db: AsyncDatabase, username: str, password: str) -> Optional[User]:
     """Authenticate a user with username/email and password"""
     # Try username first
-    user = db.query(User).filter(User.username == username).first()
-    
+    user = await db.get_user_by_username(username)
+
     # If not found, try email
     if not user:
-        user = db.query(User).filter(User.email == username).first()
-    
+        user = await db.get_user_by_email(username)
+
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    if not verify_password(password, user['hashed_password']):
         return None
-    
+
     return user
 
 async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    token: Optional[str] = Depends(oauth2_scheme),
+    db: AsyncDatabase = Depends(get_db)
 ) -> User:
     """Get current user from JWT token"""
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
+    if not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token is missing")
+
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        
-        # Check token type
-        token_type = payload.get("type")
-        if token_type != "access":
-            raise credentials_exception
-            
-        token_data = TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.username == token_data.username).first()
+        with STAGE_SECONDS.time('jwt_decode'):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        token_data = TokenData(user_id=payload.get("user_id"))
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has expired")
+    except (jwt.InvalidTokenError, ValueError):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+    if token_data.user_id is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+    # Inactive users are not returned, as in app.py
+    with STAGE_SECONDS.time('user_lookup'):
+        user = await db.get_user_by_id_cached(token_data.user_id)
     if user is None:
-        raise credentials_exception
-    
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+
     return user
 
 async def get_current_active_user(
     current_user: User = Depends(get_current_user)
 ) -> User:
     """Get current active user"""
-    if not current_user.is_active:
+    if not current_user.get('is_active', True):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Inactive user"
@@ -151,48 +156,29 @@ async def get_current_admin_user(
     current_user: User = Depends(get_current_user)
 ) -> User:
     """Get current admin user"""
-    if not current_user.is_admin:
+    if not current_user.get('is_admin'):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not enough permissions"
+            detail="Admin access required"
         )
     return current_user
 
 # Utility functions
-def get_user_by_email(db: Session, email: str) -> Optional[User]:
+async def get_user_by_email(db: AsyncDatabase, email: str) -> Optional[User]:
     """Get user by email"""
-    return db.query(User).filter(User.email == email).first()
+    return await db.get_user_by_email(email)
 
-def get_user_by_username(db: Session, username: str) -> Optional[User]:
+async def get_user_by_username(db: AsyncDatabase, username: str) -> Optional[User]:
     """Get user by username"""
-    return db.query(User).filter(User.username == username).first()
+    return await db.get_user_by_username(username)
 
-def create_user(db: Session, user_data: UserCreate) -> User:
-    """Create a new user"""
+async def create_user(db: AsyncDatabase, user_data: UserCreate) -> Optional[int]:
+    """Create a new user; returns its id"""
     # Check if user already exists
-    existing_user = db.query(User).filter(
-        (User.email == user_data.email) | (User.username == user_data.username)
-    ).first()
-    
-    if existing_user:
+    if await db.get_user_by_username(user_data.username) or await db.get_user_by_email(user_data.email):
         raise ValueError("User with this email or username already exists")
-    
-    hashed_password = get_password_hash(user_data.password)
-    db_user = User(
-        email=user_data.email,
-        username=user_data.username,
-        hashed_password=hashed_password,
-        full_name=user_data.full_name,
-        is_active=True,
-        is_verified=False,
-        is_admin=False
-    )
-    
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    
-    return db_user
+
+    return await db.create_user(user_data.username, user_data.email, user_data.password, user_data.full_name)
 
 # Password validation
 def validate_password_strength(password: str) -> bool:
@@ -205,4 +191,4 @@ def validate_password_strength(password: str) -> bool:
         return False
     if not any(char.islower() for char in password):
         return False
-    return True
\ No newline at end of file
+    return True
@@ -0,0 +1,477 @@
+"""Background batch scoring jobs.
+
+POST /predict/batch/jobs stores the upload under BATCH_JOB_DIR, records a
+queued row in batch_jobs and returns straight away. Worker threads claim
+queued jobs, score the file chunk by chunk and record the rows processed
+after every chunk. Job rows live in MySQL next to batch_predictions, so
+jobs queued before a restart are picked up again.
+
+A worker claims a job under a random token and a JobClaim thread refreshes
+the job's heartbeat every stale_seconds / 4, however long a chunk takes.
+Only a job whose heartbeat is older than stale_seconds (its process died
+or lost the database) is requeued. A worker whose claim was requeued stops
+before its next write and leaves the job to whoever claims it next.
+
+InMemoryJobStore implements the storage methods the jobs use without MySQL,
+for tests and local runs (BATCH_JOB_STORE=memory).
+"""
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from metrics import PREDICTIONS
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+JOB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads', 'jobs')
+
+
+class JobClaimLost(Exception):
+    """Raised in a worker whose job was requeued while it ran"""
+
+
+def score_batch_chunk(predictor, df, row_offset=0):
+    """Score one DataFrame of a batch upload.
+
+    Returns the rows to store (a DataFrame of batch_prediction_details
+    columns), the per-row API results in file order (failed rows reported
+    in place) and the approved/rejected/error counts.
+    """
+    scores = predictor.score_batch(df)
+    features = scores['features']
+    valid = scores['valid']
+
+    row_numbers = np.arange(row_offset + 1, row_offset + len(df) + 1)
+    if 'applicant_name' in df.columns:
+        applicant_names = df['applicant_name'].astype(str).to_numpy()
+    else:
+        applicant_names = np.array([f'Applicant {n}' for n in row_numbers], dtype=object)
+
+    predictions = scores['prediction'][valid]
+    approved_count = int(np.count_nonzero(predictions == 1))
+
+    # For database storage
+    scored = features[valid].reset_index(drop=True)
+    scored.insert(0, 'applicant_name', applicant_names[valid])
+    scored.insert(0, 'row_number', row_numbers[valid])
+    scored['prediction'] = predictions
+    scored['probability'] = scores['probability'][valid]
+    scored['risk_score'] = None
+    scored['rejection_reasons'] = None
+    scored['model_version'] = predictor.model_version
+
+    # For API response
+    response_rows = scored[['row_number', 'applicant_name', 'prediction', 'probability',
+                            'credit_score', 'debt_to_income_ratio']].copy()
+    response_rows['status'] = np.where(predictions == 1, 'Approved', 'Rejected')
+    response_rows['risk_score'] = None
+    response_rows['rejection_reasons'] = None
+
+    results = [None] * len(df)
+    for i, record in zip(np.flatnonzero(valid), response_rows.to_dict('records')):
+        results[i] = record
+    for i in np.flatnonzero(~valid):
+        results[i] = {
+            'row_number': int(row_numbers[i]),
+            'applicant_name': str(applicant_names[i]),
+            'error': scores['errors'][i]
+        }
+
+    rejected_count = int(predictions.size) - approved_count
+    error_count = len(df) - int(predictions.size)
+    PREDICTIONS.inc('batch', 'approved', amount=approved_count)
+    PREDICTIONS.inc('batch', 'rejected', amount=rejected_count)
+    PREDICTIONS.inc('batch', 'invalid', amount=error_count)
+
+    return {
+        'scored': scored,
+        'results': results,
+        'approved': approved_count,
+        'rejected': rejected_count,
+        'errors': error_count,
+        'threshold': scores['threshold']
+    }
+
+
+def count_csv_rows(path):
+    """Data rows in a CSV file (lines after the header), without parsing it"""
+    lines = 0
+    last = b'\n'
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        lines += 1
+    return max(lines - 1, 0)
+
+
+def describe_job(job):
+    """API view of a job row with progress, throughput and ETA"""
+    total = job.get('total_rows') or 0
+    processed = job.get('rows_processed') or 0
+    started_at = job.get('started_at')
+    finished_at = job.get('finished_at')
+
+    rows_per_second = None
+    eta_seconds = None
+    if started_at:
+        elapsed = ((finished_at or datetime.now()) - started_at).total_seconds()
+        if elapsed > 0 and processed:
+            rows_per_second = round(processed / elapsed, 1)
+            if job['status'] == 'running':
+                eta_seconds = round(max(total - processed, 0) / rows_per_second, 1)
+
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'batch_name': job.get('batch_name'),
+        'file_name': job.get('file_name'),
+        'file_size_kb': float(job['file_size_kb']) if job.get('file_size_kb') is not None else None,
+        'total_rows': total,
+        'rows_processed': processed,
+        'progress_percent': round(processed / total * 100, 2) if total else (100.0 if job['status'] == 'done' else 0.0),
+        'rows_per_second': rows_per_second,
+        'eta_seconds': eta_seconds,
+        'batch_id': job.get('batch_id'),
+        'error': job.get('error_message'),
+        'created_at': job['created_at'].isoformat() if job.get('created_at') else None,
+        'started_at': started_at.isoformat() if started_at else None,
+        'finished_at': finished_at.isoformat() if finished_at else None
+    }
+
+
+class InMemoryJobStore:
+    """Process-local stand-in for the Database methods used by batch jobs"""
+
+    JOB_FIELDS = ('status', 'rows_processed', 'total_rows', 'batch_id', 'error_message',
+                  'started_at', 'finished_at')
+
+    def __init__(self):
+        self.jobs = {}
+        self.batches = {}
+        self.details = {}
+        self._lock = threading.Lock()
+
+    def ensure_connection(self):
+        return True
+
+    def create_batch_job(self, user_id, job_data):
+        with self._lock:
+            job_id = len(self.jobs) + 1
+            now = datetime.now()
+            self.jobs[job_id] = {
+                'id': job_id,
+                'user_id': user_id,
+                'batch_name': job_data.get('batch_name'),
+                'file_name': job_data.get('filename'),
+                'file_path': job_data.get('file_path'),
+                'file_size_kb': job_data.get('file_size_kb'),
+                'status': 'queued',
+                'total_rows': job_data.get('total_rows'),
+                'rows_processed': 0,
+                'batch_id': None,
+                'error_message': None,
+                'claim_token': None,
+                'created_at': now,
+                'started_at': None,
+                'finished_at': None,
+                'heartbeat_at': None,
+                'updated_at': now
+            }
+            return job_id
+
+    def get_batch_job(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def get_user_batch_jobs(self, user_id, limit=20):
+        with self._lock:
+            jobs = [dict(job) for job in self.jobs.values() if job['user_id'] == user_id]
+        return sorted(jobs, key=lambda job: job['id'], reverse=True)[:limit]
+
+    def claim_next_batch_job(self, claim_token):
+        with self._lock:
+            for job in self.jobs.values():
+                if job['status'] == 'queued':
+                    now = datetime.now()
+                    job.update({'status': 'running', 'rows_processed': 0, 'started_at': now, 'finished_at': None,
+                                'claim_token': claim_token, 'heartbeat_at': now, 'updated_at': now})
+                    return dict(job)
+        return None
+
+    def heartbeat_batch_job(self, job_id, claim_token):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job['status'] != 'running' or job['claim_token'] != claim_token:
+                return False
+            job['heartbeat_at'] = datetime.now()
+            return True
+
+    def update_batch_job(self, job_id, updates):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return False
+            job.update({k: v for k, v in updates.items() if k in self.JOB_FIELDS})
+            job['updated_at'] = datetime.now()
+            return True
+
+    def requeue_stale_batch_jobs(self, stale_seconds):
+        cutoff = datetime.now() - timedelta(seconds=stale_seconds)
+        with self._lock:
+            stale = [job for job in self.jobs.values()
+                     if job['status'] == 'running' and (job['heartbeat_at'] or job['updated_at']) < cutoff]
+            for job in stale:
+                job.update({'status': 'queued', 'claim_token': None, 'updated_at': datetime.now()})
+            return len(stale)
+
+    def save_batch_prediction(self, user_id, batch_data):
+        with self._lock:
+            batch_id = len(self.batches) + 1
+            self.batches[batch_id] = dict(batch_data, user_id=user_id)
+            self.details[batch_id] = []
+            return batch_id
+
+    def update_batch_prediction(self, batch_id, batch_data):
+        with self._lock:
+            self.batches[batch_id].update(batch_data)
+            return True
+
+    def save_batch_prediction_columns(self, batch_id, columns, row_count=None):
+        with self._lock:
+            self.details[batch_id].extend(pd.DataFrame(columns).to_dict('records'))
+            return True
+
+    def delete_batch_prediction_details(self, batch_id):
+        with self._lock:
+            self.details[batch_id] = []
+            return True
+
+    def delete_batch_prediction(self, batch_id):
+        with self._lock:
+            self.batches.pop(batch_id, None)
+            self.details.pop(batch_id, None)
+            return True
+
+
+class JobClaim:
+    """A worker's hold on a running job, kept alive by a heartbeat thread until released"""
+
+    def __init__(self, store, job, interval):
+        self.job_id = job['id']
+        self.lost = threading.Event()
+        self._released = threading.Event()
+        self._thread = threading.Thread(target=self._beat, args=(store, job['claim_token'], interval),
+                                        name=f'batch-job-heartbeat-{job["id"]}', daemon=True)
+        self._thread.start()
+
+    def _beat(self, store, claim_token, interval):
+        while not self._released.wait(interval):
+            try:
+                held = store.heartbeat_batch_job(self.job_id, claim_token)
+            except Exception as e:
+                print(f" Batch job {self.job_id} heartbeat error: {e}")
+                continue
+            # None is a database error: keep going, the job's own writes will fail if it persists
+            if held is False:
+                self.lost.set()
+                return
+
+    def check(self):
+        """Raise JobClaimLost if the job was requeued since it was claimed"""
+        if self.lost.is_set():
+            raise JobClaimLost(f'Batch job {self.job_id} was requeued')
+
+    def release(self):
+        self._released.set()
+        self._thread.join()
+
+
+class BatchJobRunner:
+    """Worker threads that claim and score queued batch jobs"""
+
+    def __init__(self, store_factory, predictor_source, job_dir=JOB_DIR, workers=1,
+                 chunk_rows=10000, poll_seconds=2.0, stale_seconds=300, audit_log=None):
+        self.store_factory = store_factory
+        self.predictor_source = predictor_source
+        self.audit_log = audit_log
+        self.job_dir = job_dir
+        self.workers = workers
+        self.chunk_rows = chunk_rows
+        self.poll_seconds = poll_seconds
+        self.stale_seconds = stale_seconds
+        self.jobs_completed = 0
+        self.jobs_failed = 0
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        os.makedirs(self.job_dir, exist_ok=True)
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'batch-job-worker-{n}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, store, user_id, file, batch_name):
+        """Store an uploaded file and queue a job for it; returns the job id.
+
+        Raises ValueError if the file has no data rows.
+        """
+        os.makedirs(self.job_dir, exist_ok=True)
+        path = os.path.join(self.job_dir, f"{uuid.uuid4().hex}.csv")
+        file.save(path)
+
+        total_rows = count_csv_rows(path)
+        if total_rows == 0:
+            os.remove(path)
+            raise ValueError('CSV file is empty')
+
+        job_id = store.create_batch_job(user_id, {
+            'batch_name': batch_name,
+            'filename': file.filename,
+            'file_path': path,
+            'file_size_kb': round(os.path.getsize(path) / 1024, 2),
+            'total_rows': total_rows
+        })
+        if not job_id:
+            os.remove(path)
+            return None
+
+        self._wakeup.set()
+        return job_id
+
+    def _run(self):
+        store = self.store_factory()
+        next_requeue = 0
+        while not self._stop.is_set():
+            job = None
+            try:
+                if time.monotonic() >= next_requeue:
+                    requeued = store.requeue_stale_batch_jobs(self.stale_seconds)
+                    if requeued:
+                        print(f" Requeued {requeued} stalled batch job(s)")
+                    next_requeue = time.monotonic() + self.stale_seconds / 4
+                claim_token = uuid.uuid4().hex
+                job = store.claim_next_batch_job(claim_token)
+            except Exception as e:
+                print(f" Batch job queue error: {e}")
+
+            if job is None:
+                self._wakeup.wait(self.poll_seconds)
+                self._wakeup.clear()
+                continue
+
+            job['claim_token'] = claim_token
+            claim = JobClaim(self.store_factory(), job, self.stale_seconds / 4)
+            try:
+                self._process(store, job, claim)
+                self.jobs_completed += 1
+            except Exception as e:
+                if claim.lost.is_set():
+                    # Another worker owns the job (and its batch) now
+                    print(f" Batch job {job['id']} was requeued while running here; stopped")
+                    continue
+                print(f" Batch job {job['id']} failed: {e}")
+                self.jobs_failed += 1
+                store.update_batch_job(job['id'], {
+                    'status': 'failed',
+                    'error_message': str(e),
+                    'batch_id': None,
+                    'finished_at': datetime.now()
+                })
+                self._discard(store, job)
+            finally:
+                claim.release()
+
+    def _process(self, store, job, claim):
+        predictor = self.predictor_source()
+        if not predictor.is_loaded():
+            raise RuntimeError('Model not loaded')
+
+        batch_id = job.get('batch_id')
+        if batch_id:
+            # Retry of a job interrupted part-way: drop the rows it already stored
+            store.delete_batch_prediction_details(batch_id)
+        else:
+            batch_id = store.save_batch_prediction(job['user_id'], {
+                'batch_name': job['batch_name'],
+                'filename': job['file_name'],
+                'file_size_kb': job['file_size_kb'],
+                'total_applications': 0,
+                'approved_applications': 0,
+                'rejected_applications': 0,
+                'approval_rate': 0,
+                'processing_time_seconds': 0
+            })
+            if not batch_id:
+                raise RuntimeError('Failed to save batch')
+            store.update_batch_job(job['id'], {'batch_id': batch_id})
+        job['batch_id'] = batch_id
+
+        print(f" Batch job {job['id']} started ({job['total_rows']} rows, batch {batch_id})")
+        start_time = time.time()
+        processed = approved_count = rejected_count = 0
+        for df in pd.read_csv(job['file_path'], chunksize=self.chunk_rows):
+            chunk = score_batch_chunk(predictor, df, row_offset=processed)
+            claim.check()
+            if len(chunk['scored']) and not store.save_batch_prediction_columns(batch_id, chunk['scored']):
+                raise RuntimeError('Failed to save batch details')
+            if self.audit_log:
+                self.audit_log.log_batch(job['user_id'], batch_id, chunk['scored'])
+            processed += len(df)
+            approved_count += chunk['approved']
+            rejected_count += chunk['rejected']
+            store.update_batch_job(job['id'], {'rows_processed': processed})
+
+        claim.check()
+        successful_predictions = approved_count + rejected_count
+        store.update_batch_prediction(batch_id, {
+            'total_applications': processed,
+            'approved_applications': approved_count,
+            'rejected_applications': rejected_count,
+            'approval_rate': round((approved_count / successful_predictions * 100), 2) if successful_predictions > 0 else 0,
+            'processing_time_seconds': round(time.time() - start_time, 3)
+        })
+        store.update_batch_job(job['id'], {
+            'status': 'done',
+            'total_rows': processed,
+            'finished_at': datetime.now()
+        })
+        os.remove(job['file_path'])
+        print(f" Batch job {job['id']} done: {approved_count} approved, {rejected_count} rejected")
+
+    def _discard(self, store, job):
+        """Remove a failed job's upload and the partial batch it stored"""
+        try:
+            if job.get('batch_id') and not store.delete_batch_prediction(job['batch_id']):
+                print(f" Batch job {job['id']}: could not remove partial batch {job['batch_id']}")
+        except Exception as e:
+            print(f" Batch job {job['id']}: error removing partial batch: {e}")
+        try:
+            os.remove(job['file_path'])
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f" Batch job {job['id']}: error removing upload: {e}")
+
+    def get_metrics(self):
+        return {
+            'workers': len(self._threads),
+            'jobs_completed': self.jobs_completed,
+            'jobs_failed': self.jobs_failed
+        }
@@ -0,0 +1,1251 @@
+"""Performance benchmarks.
+
+Usage: python benchmark.py <name> [options]
+Each benchmark prints its results as JSON.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from model import LoanPredictionModel, CATEGORICAL_DEFAULTS, DEFAULT_BUNDLE_PATH
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def synthetic_applicants(predictor, rows, seed=0):
+    """Random applicants drawn around the scaler's training statistics"""
+    rng = np.random.default_rng(seed)
+    mean = dict(zip(predictor.feature_names, predictor._scale_mean))
+    std = dict(zip(predictor.feature_names, predictor._scale_scale))
+
+    df = pd.DataFrame({
+        'annual_income': rng.normal(mean['annual_income'], std['annual_income'], rows).clip(1000),
+        'debt_to_income_ratio': rng.normal(mean['debt_to_income_ratio'], std['debt_to_income_ratio'], rows).clip(0, 1),
+        'credit_score': rng.normal(mean['credit_score'], std['credit_score'], rows).clip(300, 850).astype(int),
+        'loan_amount': rng.normal(mean['loan_amount'], std['loan_amount'], rows).clip(500),
+        'interest_rate': rng.normal(mean['interest_rate'], std['interest_rate'], rows).clip(0, 100)
+    })
+    for col in CATEGORICAL_DEFAULTS:
+        df[col] = rng.choice(predictor.category_classes[col], rows)
+    return df
+
+
+def field_bounds(field):
+    """(low, high) allowed by a pydantic field's gt/ge/le/lt constraints, None where open"""
+    low = high = None
+    for constraint in field.metadata:
+        if getattr(constraint, 'ge', None) is not None:
+            low = constraint.ge
+        elif getattr(constraint, 'gt', None) is not None:
+            low = np.nextafter(constraint.gt, np.inf)
+        if getattr(constraint, 'le', None) is not None:
+            high = constraint.le
+        elif getattr(constraint, 'lt', None) is not None:
+            high = np.nextafter(constraint.lt, -np.inf)
+    return low, high
+
+
+def schema_applicants(predictor, rows, seed=0, validate=1000):
+    """Random applicants inside the SinglePredictionRequest domains of schemas.py
+
+    Numeric columns follow the scaler's training statistics (income and loan
+    amount log-normal) clipped to the fields' bounds; categorical columns are
+    drawn from the schema's allowed values. `validate` random rows are checked
+    against the schema, which raises if the generator drifts from it.
+    """
+    from schemas import (SinglePredictionRequest, GENDERS, MARITAL_STATUSES, EDUCATION_LEVELS,
+                         EMPLOYMENT_STATUSES, LOAN_PURPOSES, GRADE_SUBGRADES)
+
+    rng = np.random.default_rng(seed)
+    fields = SinglePredictionRequest.model_fields
+    mean = dict(zip(predictor.feature_names, predictor._scale_mean))
+    std = dict(zip(predictor.feature_names, predictor._scale_scale))
+
+    def draw(column, log_normal=False):
+        if log_normal:
+            sigma = np.sqrt(np.log1p((std[column] / mean[column]) ** 2))
+            values = rng.lognormal(np.log(mean[column]) - sigma ** 2 / 2, sigma, rows)
+        else:
+            values = rng.normal(mean[column], std[column], rows)
+        return values.clip(*field_bounds(fields[column]))
+
+    df = pd.DataFrame({
+        'applicant_name': np.char.add('Applicant ', np.arange(rows).astype(str)),
+        'annual_income': draw('annual_income', log_normal=True).round(2),
+        'loan_amount': draw('loan_amount', log_normal=True).round(2),
+        'interest_rate': draw('interest_rate').round(2),
+        'debt_to_income_ratio': draw('debt_to_income_ratio').round(3),
+        'credit_score': draw('credit_score').round().astype(int)
+    })
+    for col, domain in [('gender', GENDERS), ('marital_status', MARITAL_STATUSES),
+                        ('education_level', EDUCATION_LEVELS), ('employment_status', EMPLOYMENT_STATUSES),
+                        ('loan_purpose', LOAN_PURPOSES), ('grade_subgrade', GRADE_SUBGRADES)]:
+        df[col] = rng.choice(domain, rows)
+
+    for record in df.iloc[rng.choice(rows, min(validate, rows), replace=False)].to_dict('records'):
+        SinglePredictionRequest(**record)
+    return df
+
+
+def latency_summary(latencies, elapsed):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        'requests': int(latencies.size),
+        'throughput_rps': round(latencies.size / elapsed, 1),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+        'max_ms': round(float(latencies.max()), 3)
+    }
+
+
+def timed(function, repeat):
+    """Best and median seconds of `repeat` calls to function()"""
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - started)
+    return {'runs': repeat, 'best_seconds': round(min(seconds), 6), 'median_seconds': round(float(np.median(seconds)), 6)}
+
+
+def run_concurrent(predict, records, threads):
+    """Call predict(record) from `threads` threads; returns latency summary"""
+    latencies = []
+    lock = threading.Lock()
+    chunks = np.array_split(np.arange(len(records)), threads)
+
+    def worker(indices):
+        local = []
+        for i in indices:
+            started = time.perf_counter()
+            predict(records[i])
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    pool = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return latency_summary(latencies, time.perf_counter() - started)
+
+
+def bench_coalescer(args):
+    """Direct predict_single vs micro-batched predictions under concurrency"""
+    from coalescer import PredictionCoalescer
+
+    predictor = LoanPredictionModel(engine=args.engine)
+    records = synthetic_applicants(predictor, args.requests).to_dict('records')
+    coalescer = PredictionCoalescer(predictor, max_wait_ms=args.wait_ms, max_batch_size=args.batch_size)
+
+    return {
+        'threads': args.threads,
+        'direct': run_concurrent(predictor.predict_single, records, args.threads),
+        'coalesced': run_concurrent(coalescer.predict, records, args.threads),
+        'coalescer_metrics': coalescer.get_metrics()
+    }
+
+
+STARTUP_SNIPPET = """
+import json, time, warnings
+warnings.filterwarnings('ignore')
+started = time.perf_counter()
+from model import LoanPredictionModel
+imported = time.perf_counter()
+predictor = LoanPredictionModel(engine={engine!r}, bundle_path={bundle_path!r})
+loaded = time.perf_counter()
+assert predictor.is_loaded(), predictor.load_error
+print(json.dumps({{'import_s': imported - started, 'load_s': loaded - imported}}))
+"""
+
+
+def bench_startup(args):
+    """Cold model load time in fresh processes: joblib pickles vs the mapped bundle"""
+    configs = {
+        'pickles_lightgbm': ('lightgbm', None),
+        'bundle_lightgbm': ('lightgbm', DEFAULT_BUNDLE_PATH),
+        'bundle_native': ('native', DEFAULT_BUNDLE_PATH)
+    }
+
+    results = {}
+    for name, (engine, bundle_path) in configs.items():
+        runs = []
+        for _ in range(args.repeat):
+            snippet = STARTUP_SNIPPET.format(engine=engine, bundle_path=bundle_path)
+            output = subprocess.run([sys.executable, '-c', snippet], cwd=BACKEND_DIR,
+                                    capture_output=True, text=True, check=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        results[name] = {
+            'load_ms_median': round(float(np.median([r['load_s'] for r in runs])) * 1000, 2),
+            'import_ms_median': round(float(np.median([r['import_s'] for r in runs])) * 1000, 2)
+        }
+    return {'repeat': args.repeat, 'results': results}
+
+
+def bench_reload(args):
+    """p50/p99 of concurrent predictions before and during a hot model swap"""
+    import shutil
+    import tempfile
+    from model_bundle import convert_pickles
+    from model_registry import ModelRegistry, ModelManager
+
+    workdir = tempfile.mkdtemp(prefix='loan-registry-')
+    try:
+        registry = ModelRegistry(os.path.join(workdir, 'registry'))
+        registry.set_active(registry.register(DEFAULT_BUNDLE_PATH))
+        candidate = os.path.join(workdir, 'candidate.bundle')
+        convert_pickles(output=candidate, version='benchmark-candidate')
+        registry.register(candidate)
+
+        models = ModelManager(registry, engine=args.engine, cache_memory_mb=0)
+        records = synthetic_applicants(models.current(), 1000).to_dict('records')
+        samples = []
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def worker(offset):
+            local = []
+            i = offset
+            while not stop.is_set():
+                started = time.perf_counter()
+                models.current().predict_single(records[i % len(records)])
+                local.append((started, time.perf_counter() - started))
+                i += 1
+            with lock:
+                samples.extend(local)
+
+        pool = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+        load_started = time.perf_counter()
+        for thread in pool:
+            thread.start()
+        time.sleep(args.duration / 2)
+        reload_started = time.perf_counter()
+        models.activate('benchmark-candidate', wait=True)
+        reload_finished = time.perf_counter()
+        time.sleep(args.duration / 2)
+        stop.set()
+        load_finished = time.perf_counter()
+        for thread in pool:
+            thread.join()
+
+        def window(start, end):
+            latencies = [latency for started, latency in samples if start <= started < end]
+            return latency_summary(latencies, end - start) if latencies else None
+
+        return {
+            'threads': args.threads,
+            'before_reload': window(load_started, reload_started),
+            'during_reload': window(reload_started, reload_finished),
+            'after_reload': window(reload_finished, load_finished),
+            'reload': models.last_reload
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_engines(args):
+    """Per-call latency of the LightGBM Booster and the native evaluator at 1..1000 rows"""
+    predictor = LoanPredictionModel(engine='lightgbm', cache_memory_mb=0)
+    predictor.set_engine('native')
+    X = predictor.scale(predictor.encode(synthetic_applicants(predictor, 1000)))
+
+    results = {}
+    for rows in (1, 10, 100, 1000):
+        calls = max(args.requests // rows, 20)
+        for name, predict in [('lightgbm', predictor.booster.predict),
+                              ('native', lambda X: predictor.ensemble.predict_proba(X)[:, 1])]:
+            batches = [X[i % (len(X) - rows + 1):][:rows] for i in range(calls)]
+            predict(batches[0])
+            latencies = []
+            for batch in batches:
+                started = time.perf_counter()
+                predict(batch)
+                latencies.append(time.perf_counter() - started)
+            results[f'{name}[{rows}]'] = latency_summary(latencies, sum(latencies))
+    return {'trees': predictor.ensemble.n_trees, 'results': results}
+
+
+def bench_sharded(args):
+    """Rows/sec of scoring a large matrix in-process vs sharded across 1..N worker processes
+
+    Every pool is forked before a model is loaded, as the servers do. The
+    in-process baseline is the predictor's own engine (LightGBM uses all
+    cores); the sharded runs use one single-threaded Booster per worker.
+    """
+    from parallel_scoring import ScoringPool, ShardedScorer
+
+    pools = {workers: ScoringPool(workers) for workers in range(1, args.workers + 1)}
+    predictor = LoanPredictionModel(engine=args.engine, cache_memory_mb=0)
+    X = predictor.scale(predictor.encode(synthetic_applicants(predictor, args.rows)))
+    local = lambda X: predictor.score(X)[1]
+
+    def timed(score):
+        score(X[:args.shard_size + 1])  # workers build their model first
+        started = time.perf_counter()
+        probabilities = score(X)
+        elapsed = time.perf_counter() - started
+        return probabilities, {'seconds': round(elapsed, 3), 'rows_per_sec': round(len(X) / elapsed, 1)}
+
+    try:
+        baseline, in_process = timed(local)
+        results = {'in_process': in_process}
+        for workers, pool in pools.items():
+            scorer = ShardedScorer(predictor.model_version, predictor._lightgbm_model_text(), local,
+                                   shard_size=args.shard_size, pool=pool)
+            probabilities, result = timed(scorer.predict_proba)
+            scorer.close()
+            result['speedup'] = round(in_process['seconds'] / result['seconds'], 2)
+            result['matches_in_process'] = bool(np.array_equal(probabilities, baseline))
+            results[f'workers_{workers}'] = result
+    finally:
+        for pool in pools.values():
+            pool.close()
+
+    return {'rows': args.rows, 'shard_size': args.shard_size, 'engine': args.engine,
+            'cpu_count': os.cpu_count(), 'results': results}
+
+
+def drop_benchmark_batch(db, user_id, batch_id):
+    """Delete a batch made by a benchmark, keeping the rollups consistent"""
+    db.delete_batch_prediction_details(batch_id)
+    with db.session() as connection:
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM batch_predictions WHERE id = %s", (batch_id,))
+        db._bump_user_counters(cursor, user_id, {'batch_predictions': -1})
+        connection.commit()
+        cursor.close()
+
+
+def bench_bulk_insert(args):
+    """Rows/sec writing batch_prediction_details: per-row loop vs executemany vs LOAD DATA"""
+    from batch_jobs import score_batch_chunk
+    from database import Database, BATCH_DETAIL_COLUMNS
+
+    predictor = LoanPredictionModel(cache_memory_mb=0)
+    scored = score_batch_chunk(predictor, synthetic_applicants(predictor, args.rows))['scored']
+
+    # Open the connection with LOAD DATA LOCAL allowed; each strategy then picks its method
+    os.environ['DB_BULK_INSERT_METHOD'] = 'load_data'
+    db = Database()
+    if not db.ensure_connection():
+        return {'error': 'Database connection failed'}
+    db.bulk_insert_rows = args.batch_rows
+
+    def row_loop(batch_id, frame):
+        # The previous implementation: one execute per row, one transaction
+        query = f"""
+            INSERT INTO batch_prediction_details (batch_id, {', '.join(f'`{c}`' for c in BATCH_DETAIL_COLUMNS)})
+            VALUES ({', '.join(['%s'] * (len(BATCH_DETAIL_COLUMNS) + 1))})
+        """
+        with db.session() as connection:
+            cursor = connection.cursor()
+            for detail in frame.to_dict('records'):
+                cursor.execute(query, (batch_id,) + tuple(detail.get(c) for c in BATCH_DETAIL_COLUMNS))
+            connection.commit()
+            cursor.close()
+
+    def bulk(method):
+        def insert(batch_id, frame):
+            db.bulk_insert_method = method
+            if not db.save_batch_prediction_columns(batch_id, frame):
+                raise RuntimeError(f'{method} insert failed')
+        return insert
+
+    with db.session() as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT id FROM users ORDER BY id LIMIT 1")
+        user = cursor.fetchone()
+        cursor.close()
+    if not user:
+        return {'error': 'No user to own the benchmark batch'}
+    batch_id = db.save_batch_prediction(user[0], {'batch_name': 'benchmark', 'filename': 'benchmark.csv',
+                                                  'total_applications': 0, 'approved_applications': 0,
+                                                  'rejected_applications': 0})
+
+    results = {}
+    try:
+        for name, insert in [('row_loop', row_loop), ('executemany', bulk('executemany')),
+                             ('load_data', bulk('load_data'))]:
+            started = time.perf_counter()
+            try:
+                insert(batch_id, scored)
+            except Exception as e:
+                results[name] = {'error': str(e)}
+                continue
+            finally:
+                elapsed = time.perf_counter() - started
+                db.delete_batch_prediction_details(batch_id)
+            results[name] = {'seconds': round(elapsed, 3), 'rows_per_sec': round(len(scored) / elapsed, 1)}
+    finally:
+        drop_benchmark_batch(db, user[0], batch_id)
+
+    return {'rows': len(scored), 'commit_every': args.batch_rows, 'results': results}
+
+
+# The approval_by_credit_score view before it read credit_score_band_counts
+LEGACY_CREDIT_SCORE_QUERY = """
+    SELECT CASE WHEN credit_score < 580 THEN 'Poor (300-579)' WHEN credit_score < 670 THEN 'Fair (580-669)'
+                WHEN credit_score < 740 THEN 'Good (670-739)' WHEN credit_score < 800 THEN 'Very Good (740-799)'
+                ELSE 'Excellent (800-850)' END AS credit_score_range,
+        COUNT(*) AS total_applications,
+        SUM(CASE WHEN prediction = 1 THEN 1 ELSE 0 END) AS approved,
+        SUM(CASE WHEN prediction = 0 THEN 1 ELSE 0 END) AS rejected,
+        ROUND(AVG(CASE WHEN prediction = 1 THEN 1 ELSE 0 END) * 100, 2) AS approval_rate
+    FROM (SELECT credit_score, prediction FROM single_predictions
+          UNION ALL
+          SELECT credit_score, prediction FROM batch_prediction_details) AS combined
+    GROUP BY credit_score_range
+    ORDER BY MIN(credit_score)
+"""
+
+
+def bench_credit_bands(args):
+    """/statistics/credit-score latency as batch_prediction_details grows
+
+    A benchmark batch is topped up to each --sizes row count through
+    save_batch_prediction_columns, then the endpoint (served from the band
+    rollup) and the old full-scan query are timed --repeat times.
+    """
+    import jwt
+    from datetime import datetime, timedelta
+
+    os.environ.setdefault('BATCH_JOB_WORKERS', '0')
+    os.environ['DB_BULK_INSERT_METHOD'] = 'load_data'
+    import app as api
+
+    db = api.db
+    if not db.ensure_connection():
+        return {'error': 'Database connection failed'}
+    user = db.get_all_users()[:1]
+    if not user:
+        return {'error': 'No user to own the benchmark batch'}
+    user_id = user[0]['id']
+
+    token = jwt.encode({'user_id': user_id, 'exp': datetime.utcnow() + timedelta(hours=1)},
+                       api.app.config['SECRET_KEY'], algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+    client = api.app.test_client()
+
+    def endpoint():
+        response = client.get('/statistics/credit-score', headers=headers)
+        if response.status_code != 200:
+            raise RuntimeError(f'/statistics/credit-score returned {response.status_code}')
+        return response.get_json()['credit_score_analysis']
+
+    def legacy():
+        with db.session() as connection:
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute(LEGACY_CREDIT_SCORE_QUERY)
+            rows = cursor.fetchall()
+            cursor.close()
+        return rows
+
+    def timed(query):
+        latencies = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            rows = query()
+            latencies.append((time.perf_counter() - started) * 1000)
+        return rows, {'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+                      'max_ms': round(max(latencies), 3)}
+
+    batch_id = db.save_batch_prediction(user_id, {'batch_name': 'benchmark', 'filename': 'benchmark.csv',
+                                                  'total_applications': 0, 'approved_applications': 0,
+                                                  'rejected_applications': 0})
+    rng = np.random.default_rng(0)
+    stored = 0
+    results = []
+    try:
+        for size in sorted(int(size) for size in args.sizes.split(',')):
+            if size > stored:
+                rows = size - stored
+                if not db.save_batch_prediction_columns(batch_id, {
+                    'credit_score': rng.integers(300, 851, rows),
+                    'prediction': rng.integers(0, 2, rows),
+                    'row_number': np.arange(stored + 1, size + 1)
+                }):
+                    return {'error': 'Could not insert benchmark rows'}
+                stored = size
+
+            rollup_rows, rollup = timed(endpoint)
+            legacy_rows, scan = timed(legacy)
+            matches = [(r['credit_score_range'], int(r['approved']), int(r['rejected'])) for r in rollup_rows] == \
+                [(r['credit_score_range'], int(r['approved']), int(r['rejected'])) for r in legacy_rows]
+            results.append({'benchmark_rows': stored, 'endpoint': rollup, 'legacy_scan': scan,
+                            'results_match': matches})
+    finally:
+        drop_benchmark_batch(db, user_id, batch_id)
+
+    return {'repeat': args.repeat, 'results': results}
+
+
+def bench_recent_activity(args):
+    """/statistics/recent query: merged top-K vs the recent_predictions_summary view
+
+    Seeds --rows single predictions and --rows / 100 batches spread over a
+    year for the first user (removed afterwards), then times the first
+    page, a page ten pages deep and a per-user page --repeat times each.
+    """
+    from datetime import datetime, timedelta
+    from database import Database
+
+    db = Database()
+    if not db.ensure_connection():
+        return {'error': 'Database connection failed'}
+    user = db.get_all_users()[:1]
+    if not user:
+        return {'error': 'No user to own the benchmark rows'}
+    user_id = user[0]['id']
+
+    rng = np.random.default_rng(0)
+    start = datetime.now() - timedelta(days=365)
+
+    def stamps(count):
+        return [start + timedelta(seconds=int(offset)) for offset in rng.integers(0, 365 * 86400, count)]
+
+    # Seeded rows are those past each table's current last id, tagged 'benchmark'
+    tables = {'single_predictions': 'applicant_name', 'batch_predictions': 'file_name'}
+    seeded_after = {}
+    with db.session() as connection:
+        cursor = connection.cursor()
+        for table, (columns, count) in {
+            'single_predictions': ('user_id, applicant_name, credit_score, prediction, created_at', args.rows),
+            'batch_predictions': ('user_id, file_name, total_applications, processed_at', max(args.rows // 100, 1))
+        }.items():
+            cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+            seeded_after[table] = cursor.fetchone()[0]
+            for chunk_start in range(0, count, 10000):
+                chunk = stamps(min(10000, count - chunk_start))
+                rows = [(user_id, 'benchmark', 700, 1, stamp) if table == 'single_predictions'
+                        else (user_id, 'benchmark', 0, stamp) for stamp in chunk]
+                cursor.executemany(f"INSERT INTO {table} ({columns}) VALUES ({', '.join(['%s'] * len(rows[0]))})", rows)
+                connection.commit()
+        cursor.close()
+
+    def view_page(limit):
+        with db.session() as connection:
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute("SELECT * FROM recent_predictions_summary LIMIT %s", (limit,))
+            rows = cursor.fetchall()
+            cursor.close()
+        return rows
+
+    def timed(query):
+        latencies = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            rows = query()
+            latencies.append((time.perf_counter() - started) * 1000)
+        return rows, {'p50_ms': round(float(np.percentile(latencies, 50)), 3), 'max_ms': round(max(latencies), 3)}
+
+    limit = 50
+    try:
+        first_rows, first = timed(lambda: db.get_recent_predictions_summary(limit))
+        view_rows, view = timed(lambda: view_page(limit))
+        before = None
+        for _ in range(10):
+            page = db.get_recent_predictions_summary(limit, before=before)
+            before = (page[-1]['prediction_date'], page[-1]['prediction_type'], page[-1]['id'])
+        _, deep = timed(lambda: db.get_recent_predictions_summary(limit, before=before))
+        _, deep_view = timed(lambda: view_page(limit * 11))
+        _, per_user = timed(lambda: db.get_recent_predictions_summary(limit, user_id=user_id))
+        dates = [row['prediction_date'] for row in first_rows]
+        result = {
+            'single_rows': args.rows,
+            'batch_rows': max(args.rows // 100, 1),
+            'page_size': limit,
+            'first_page': {'top_k': first, 'view': view},
+            'eleventh_page': {'top_k': deep, 'view_offset_equivalent': deep_view},
+            'per_user_page': per_user,
+            'dates_match_view': dates == [row['prediction_date'] for row in view_rows]
+        }
+    finally:
+        with db.session() as connection:
+            cursor = connection.cursor()
+            for table, tag_column in tables.items():
+                cursor.execute(f"DELETE FROM {table} WHERE id > %s AND user_id = %s AND {tag_column} = 'benchmark'",
+                               (seeded_after[table], user_id))
+            connection.commit()
+            cursor.close()
+
+    return result
+
+
+def bench_write_behind(args):
+    """Per-request cost of storing a single prediction: synchronous vs write-behind
+
+    Stores --requests real predictions for the first user each way, from
+    --threads threads, and reports caller latency plus the writer's group
+    commit metrics once its queue has drained.
+    """
+    import tempfile
+    from database import Database
+    from prediction_writer import PredictionWriter
+
+    db = Database()
+    if not db.ensure_connection():
+        return {'error': 'Database connection failed'}
+    user = db.get_all_users()[:1]
+    if not user:
+        return {'error': 'No user to own the benchmark predictions'}
+    user_id = user[0]['id']
+
+    predictor = LoanPredictionModel(cache_memory_mb=0)
+    records = synthetic_applicants(predictor, args.requests).to_dict('records')
+    rows = [dict(record, credit_score=int(record['credit_score']), applicant_name='benchmark', prediction=1,
+                 probability=0.5) for record in records]
+
+    results = {'synchronous': run_concurrent(lambda row: db.save_prediction(user_id, row), rows, args.threads)}
+
+    with tempfile.TemporaryDirectory() as spool_dir:
+        writer = PredictionWriter(db, spool_path=os.path.join(spool_dir, 'predictions.jsonl')).start()
+        results['write_behind'] = run_concurrent(lambda row: writer.submit(user_id, row), rows, args.threads)
+        started = time.perf_counter()
+        writer.close()
+        results['write_behind']['drain_seconds'] = round(time.perf_counter() - started, 3)
+        results['write_behind']['writer'] = writer.get_metrics()
+
+    return {'requests': args.requests, 'threads': args.threads, 'results': results}
+
+
+def process_memory_mb(pid):
+    """Rss, Pss and private (unshared) memory of a process, from /proc (Linux)"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {
+        'rss_mb': round(fields.get('Rss', 0), 1),
+        'pss_mb': round(fields.get('Pss', 0), 1),
+        'private_mb': round(fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0), 1)
+    }
+
+
+def free_port():
+    import socket
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def predict_requests(count):
+    """Headers and JSON bodies for `count` /predict calls as the first user"""
+    import jwt
+    from datetime import datetime, timedelta
+
+    os.environ.setdefault('BATCH_JOB_WORKERS', '0')
+    os.environ.setdefault('AUDIT_LOG', '0')
+    import app as api
+
+    if not api.db.ensure_connection():
+        return {'error': 'Database connection failed'}
+    user = api.db.get_all_users()[:1]
+    if not user:
+        return {'error': 'No user to authenticate as'}
+    token = jwt.encode({'user_id': user[0]['id'], 'exp': datetime.utcnow() + timedelta(hours=1)},
+                       api.app.config['SECRET_KEY'], algorithm='HS256')
+    records = synthetic_applicants(api.models.current(), count).to_dict('records')
+    return {
+        'headers': {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'},
+        'bodies': [json.dumps(dict(record, credit_score=int(record['credit_score']))) for record in records]
+    }
+
+
+def bench_serve(args):
+    """/predict throughput of serve.py with 1..N pre-forked workers, and per-worker memory
+
+    Starts the server once per count in --worker-counts, waits for every
+    worker to be ready, then posts --requests predictions for the first
+    user from --threads keep-alive clients. Pss counts shared pages
+    divided among the processes sharing them, so with the model shared
+    copy-on-write a worker's Pss falls well below its Rss as workers are added.
+    """
+    import http.client
+
+    fixture = predict_requests(args.requests)
+    if 'error' in fixture:
+        return fixture
+    headers, bodies = fixture['headers'], fixture['bodies']
+    port = free_port()
+
+    results = {}
+    for workers in [int(n) for n in args.worker_counts.split(',')]:
+        server = subprocess.Popen([sys.executable, 'serve.py', '--workers', str(workers), '--bind', f'127.0.0.1:{port}'],
+                                  cwd=BACKEND_DIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        try:
+            started = time.perf_counter()
+            for line in server.stdout:
+                if 'workers ready' in line:
+                    break
+            else:
+                return {'error': f'serve.py exited with {server.wait()}'}
+            ready_seconds = time.perf_counter() - started
+            threading.Thread(target=server.stdout.read, daemon=True).start()
+
+            local = threading.local()
+            failures = []
+
+            def post(body):
+                if not hasattr(local, 'connection'):
+                    local.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                local.connection.request('POST', '/predict', body=body, headers=headers)
+                response = local.connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    failures.append(response.status)
+
+            summary = run_concurrent(post, bodies, args.threads)
+            with open(f'/proc/{server.pid}/task/{server.pid}/children') as f:
+                pids = [int(pid) for pid in f.read().split()]
+            worker_memory = [process_memory_mb(pid) for pid in pids]
+            results[workers] = dict(
+                summary,
+                failures=len(failures),
+                ready_seconds=round(ready_seconds, 2),
+                parent_memory=process_memory_mb(server.pid),
+                worker_pss_mb=round(float(np.mean([m['pss_mb'] for m in worker_memory])), 1),
+                worker_rss_mb=round(float(np.mean([m['rss_mb'] for m in worker_memory])), 1),
+                worker_private_mb=round(float(np.mean([m['private_mb'] for m in worker_memory])), 1)
+            )
+        finally:
+            server.terminate()
+            server.communicate(timeout=60)
+
+    return {'requests': args.requests, 'threads': args.threads, 'cpus': os.cpu_count(), 'results': results}
+
+
+def bench_db_pool(args):
+    """Concurrency stress of the connection pool: many threads, checked results"""
+    from database import Database
+
+    db = Database()
+    if not db.ensure_connection():
+        return {'error': 'Database connection failed'}
+
+    in_use = set()
+    guard = threading.Lock()
+    failures = []
+
+    def query(token):
+        with db.session() as connection:
+            if connection is None:
+                failures.append('no connection')
+                return
+            cursor = connection.cursor()
+            cursor.execute("SELECT %s, CONNECTION_ID()", (token,))
+            echoed, connection_id = cursor.fetchone()
+            cursor.close()
+            with guard:
+                if connection_id in in_use:
+                    failures.append(f'connection {connection_id} shared between threads')
+                in_use.add(connection_id)
+            # Hold the connection briefly so checkouts overlap
+            time.sleep(0.001)
+            with guard:
+                in_use.discard(connection_id)
+            if echoed != token:
+                failures.append(f'expected {token}, got {echoed}')
+
+    tokens = [f'token-{i}' for i in range(args.requests)]
+    summary = run_concurrent(query, tokens, args.threads)
+    return {
+        'threads': args.threads,
+        'queries': summary,
+        'failures': len(failures),
+        'first_failures': failures[:5],
+        'pool': db.get_pool_metrics()
+    }
+
+
+def bench_user_cache(args):
+    """Database work per authenticated /predict call with and without the user cache
+
+    Each call stores a real prediction for the first active user.
+    """
+    import jwt
+    from datetime import datetime, timedelta
+
+    os.environ.setdefault('BATCH_JOB_WORKERS', '0')
+    import app as api
+
+    if not api.db.ensure_connection():
+        return {'error': 'Database connection failed'}
+    user = api.db.get_all_users()[:1]
+    if not user:
+        return {'error': 'No user to authenticate as'}
+
+    token = jwt.encode({'user_id': user[0]['id'], 'exp': datetime.utcnow() + timedelta(hours=1)},
+                       api.app.config['SECRET_KEY'], algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+    records = synthetic_applicants(api.models.current(), args.requests).to_dict('records')
+    for record in records:
+        record['credit_score'] = int(record['credit_score'])
+
+    lookups = []
+    get_user_by_id = api.db.get_user_by_id
+
+    def counting_get_user_by_id(user_id):
+        lookups.append(user_id)
+        return get_user_by_id(user_id)
+
+    api.db.get_user_by_id = counting_get_user_by_id
+    client = api.app.test_client()
+    cache = api.db.user_cache
+    max_entries = cache.max_entries
+
+    results = {}
+    for name, entries in [('uncached', 0), ('cached', max_entries)]:
+        cache.clear()
+        cache.max_entries = entries
+        lookups.clear()
+        checkouts = api.db.pool.checkouts
+        latencies = []
+        started = time.perf_counter()
+        for record in records:
+            request_started = time.perf_counter()
+            response = client.post('/predict', json=record, headers=headers)
+            latencies.append(time.perf_counter() - request_started)
+            if response.status_code != 200:
+                return {'error': f'/predict returned {response.status_code}: {response.get_json()}'}
+        results[name] = dict(latency_summary(latencies, time.perf_counter() - started),
+                             user_queries_per_call=round(len(lookups) / len(records), 3),
+                             connection_checkouts_per_call=round((api.db.pool.checkouts - checkouts) / len(records), 3))
+
+    cache.max_entries = max_entries
+    api.db.get_user_by_id = get_user_by_id
+    return {'results': results, 'user_cache': api.db.get_user_cache_metrics()}
+
+
+def bench_async(args):
+    """The Flask (serve.py, one worker) and asyncio (async_app.py) servers side by side
+
+    Each server runs as one process and first takes --requests /predict
+    calls from --threads keep-alive clients. It then takes the same load
+    while --slow-clients more connections each trickle one /predict body
+    over --slow-seconds, as clients on slow mobile links do. The threaded
+    server parks a thread on every slow connection; the event loop only
+    a socket. Server threads and memory are sampled during that phase.
+    """
+    import asyncio
+    import http.client
+    import resource
+
+    fixture = predict_requests(args.requests)
+    if 'error' in fixture:
+        return fixture
+    headers, bodies = fixture['headers'], fixture['bodies']
+    port = free_port()
+
+    # Every slow client holds a socket in this process too
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, min(hard, args.slow_clients + 1024)), hard))
+
+    async def slow_client(statuses):
+        body = bodies[0].encode()
+        head = ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f'POST /predict HTTP/1.1\r\nHost: 127.0.0.1\r\n{head}'
+                         f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode())
+            pieces = 5
+            step = -(-len(body) // pieces)
+            for start in range(0, len(body), step):
+                await asyncio.sleep(args.slow_seconds / pieces)
+                writer.write(body[start:start + step])
+                await writer.drain()
+            status = (await asyncio.wait_for(reader.readline(), 60)).split()[1].decode()
+            writer.close()
+        except Exception as e:
+            status = type(e).__name__
+        statuses[status] = statuses.get(status, 0) + 1
+
+    def run_slow_clients(statuses):
+        async def main():
+            await asyncio.gather(*(slow_client(statuses) for _ in range(args.slow_clients)))
+        asyncio.run(main())
+
+    def thread_count(pid):
+        with open(f'/proc/{pid}/status') as f:
+            return int(next(line.split()[1] for line in f if line.startswith('Threads:')))
+
+    servers = {
+        'flask': ([sys.executable, 'serve.py', '--workers', '1', '--bind', f'127.0.0.1:{port}'], {}),
+        'asyncio': ([sys.executable, 'async_app.py'], {'ASYNC_PORT': str(port)})
+    }
+    results = {}
+    for name, (command, env) in servers.items():
+        server = subprocess.Popen(command, cwd=BACKEND_DIR, env=dict(os.environ, **env),
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            deadline = time.monotonic() + 120
+            while True:
+                try:
+                    probe = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+                    probe.request('GET', '/ready')
+                    if probe.getresponse().status == 200:
+                        break
+                except OSError:
+                    pass
+                if server.poll() is not None or time.monotonic() > deadline:
+                    return {'error': f'{name} server did not get ready'}
+                time.sleep(0.2)
+            # serve.py answers from its worker, the asyncio server from itself
+            pid = server.pid
+            if name == 'flask':
+                with open(f'/proc/{server.pid}/task/{server.pid}/children') as f:
+                    pid = int(f.read().split()[0])
+
+            local = threading.local()
+            failures = []
+
+            def post(body):
+                if not hasattr(local, 'connection'):
+                    local.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                local.connection.request('POST', '/predict', body=body, headers=headers)
+                response = local.connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    failures.append(response.status)
+
+            fast = run_concurrent(post, bodies, args.threads)
+            fast_failures = len(failures)
+            failures.clear()
+            local = threading.local()
+
+            statuses = {}
+            slow = threading.Thread(target=run_slow_clients, args=(statuses,))
+            slow.start()
+            # Let the slow clients connect and start sending before the fast load
+            time.sleep(min(1.0, args.slow_seconds / 2))
+            peak = {'threads': thread_count(pid), 'memory': process_memory_mb(pid)}
+            loaded = run_concurrent(post, bodies, args.threads)
+            slow.join()
+
+            results[name] = {
+                'fast_clients': dict(fast, failures=fast_failures),
+                'with_slow_clients': dict(loaded, failures=len(failures)),
+                'slow_client_statuses': statuses,
+                'server_threads': peak['threads'],
+                'server_memory': peak['memory']
+            }
+        finally:
+            server.terminate()
+            server.wait(timeout=60)
+
+    return {
+        'requests': args.requests,
+        'threads': args.threads,
+        'slow_clients': args.slow_clients,
+        'slow_seconds': args.slow_seconds,
+        'cpus': os.cpu_count(),
+        'results': results
+    }
+
+
+def bench_metrics(args):
+    """Cost of recording metrics: per call, and per /predict with recording on and off
+
+    /predict runs through the Flask test client for the first user, as in
+    user_cache. Scrape time is measured with every stage and endpoint series populated.
+    """
+    import jwt
+    from datetime import datetime, timedelta
+
+    os.environ.setdefault('BATCH_JOB_WORKERS', '0')
+    os.environ.setdefault('AUDIT_LOG', '0')
+    import app as api
+    from metrics import REGISTRY, STAGE_SECONDS, PREDICTIONS
+
+    calls = 200000
+    started = time.perf_counter()
+    for _ in range(calls):
+        with STAGE_SECONDS.time('benchmark'):
+            pass
+    timer_ns = (time.perf_counter() - started) / calls * 1e9
+    started = time.perf_counter()
+    for _ in range(calls):
+        PREDICTIONS.inc('benchmark', 'approved')
+    counter_ns = (time.perf_counter() - started) / calls * 1e9
+
+    if not api.db.ensure_connection():
+        return {'error': 'Database connection failed'}
+    user = api.db.get_all_users()[:1]
+    if not user:
+        return {'error': 'No user to authenticate as'}
+    token = jwt.encode({'user_id': user[0]['id'], 'exp': datetime.utcnow() + timedelta(hours=1)},
+                       api.app.config['SECRET_KEY'], algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+    records = synthetic_applicants(api.models.current(), args.requests).to_dict('records')
+    for record in records:
+        record['credit_score'] = int(record['credit_score'])
+
+    client = api.app.test_client()
+    results = {}
+    # Alternate so drift in database speed affects both settings alike
+    for repeat in range(args.repeat):
+        for name, enabled in [('metrics_off', False), ('metrics_on', True)]:
+            REGISTRY.enabled = enabled
+            latencies = []
+            started = time.perf_counter()
+            for record in records:
+                request_started = time.perf_counter()
+                response = client.post('/predict', json=record, headers=headers)
+                latencies.append(time.perf_counter() - request_started)
+                if response.status_code != 200:
+                    return {'error': f'/predict returned {response.status_code}: {response.get_json()}'}
+            summary = latency_summary(latencies, time.perf_counter() - started)
+            if name not in results or summary['p50_ms'] < results[name]['p50_ms']:
+                results[name] = summary
+    REGISTRY.enabled = True
+
+    started = time.perf_counter()
+    text = REGISTRY.render()
+    return {
+        'timer_ns': round(timer_ns, 1),
+        'counter_ns': round(counter_ns, 1),
+        'predict': results,
+        'p50_overhead_ms': round(results['metrics_on']['p50_ms'] - results['metrics_off']['p50_ms'], 4),
+        'scrape_ms': round((time.perf_counter() - started) * 1000, 3),
+        'scrape_lines': text.count('\n')
+    }
+
+
+def run_metadata(args, predictor, sizes):
+    """What a suite run measured: commit, interpreter, machine and settings"""
+    def git(*command):
+        try:
+            return subprocess.run(['git', *command], cwd=BACKEND_DIR, capture_output=True,
+                                  text=True, timeout=10).stdout.strip() or None
+        except Exception:
+            return None
+
+    commit = git('rev-parse', 'HEAD')
+    return {
+        'commit': commit,
+        'dirty': bool(git('status', '--porcelain')) if commit else None,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'engine': predictor.engine,
+        'model_version': predictor.model_version,
+        'sizes': sizes,
+        'repeat': args.repeat
+    }
+
+
+def compare_results(baseline, results):
+    """Change of each case's headline number (p50_ms, else best_seconds, else seconds) against a saved run"""
+    comparison = {}
+    for case, values in results.items():
+        old = baseline.get('results', {}).get(case)
+        if not old:
+            continue
+        metric = next((m for m in ('p50_ms', 'best_seconds', 'seconds') if m in values and m in old), None)
+        if metric is None or not old[metric]:
+            continue
+        comparison[case] = {
+            'metric': metric,
+            'baseline': old[metric],
+            'current': values[metric],
+            'change_pct': round((values[metric] - old[metric]) / old[metric] * 100, 1)
+        }
+    return comparison
+
+
+def bench_suite(args):
+    """Model, preprocessing, route and database microbenchmarks, for comparing commits
+
+    Applicants come from schema_applicants at each of --suite-sizes rows.
+    Model cases report the best and median of --repeat runs on a predictor
+    with its cache off; per-call cases time one call per applicant of the
+    smallest size. Route and database cases run as the first user, as in
+    user_cache, and are listed under `skipped` when MySQL is unreachable.
+    Batches they store are deleted again; single predictions stay in that
+    user's history. --output saves the JSON, and --baseline adds the change
+    against a saved run.
+    """
+    from batch_jobs import score_batch_chunk
+
+    sizes = [int(size) for size in args.suite_sizes.split(',')]
+    predictor = LoanPredictionModel(engine=args.engine, cache_memory_mb=0)
+    predictor.load_model()
+
+    results = {}
+    skipped = {}
+    applicants = {}
+    for size in sizes:
+        applicants[size] = schema_applicants(predictor, size, seed=size)
+        stats = timed(lambda: schema_applicants(predictor, size, seed=size, validate=0), args.repeat)
+        results[f'generate[{size}]'] = dict(stats, rows_per_sec=round(size / stats['best_seconds'], 1))
+
+    records = applicants[sizes[0]].to_dict('records')
+    for record in records:
+        record['credit_score'] = int(record['credit_score'])
+
+    def per_call(name, function):
+        latencies = []
+        started = time.perf_counter()
+        for record in records:
+            call_started = time.perf_counter()
+            function(record)
+            latencies.append(time.perf_counter() - call_started)
+        results[name] = latency_summary(latencies, time.perf_counter() - started)
+
+    # ---- model ----
+    per_call('preprocess_data[single]', predictor.preprocess_data)
+    per_call('predict_single', predictor.predict_single)
+    for size in sizes:
+        df = applicants[size]
+        for name, function in [('preprocess_data', lambda: predictor.preprocess_data(df)),
+                               ('predict_batch', lambda: predictor.predict_batch(df))]:
+            stats = timed(function, args.repeat)
+            results[f'{name}[{size}]'] = dict(stats, rows_per_sec=round(size / stats['best_seconds'], 1))
+
+    # ---- routes and database ----
+    import jwt
+    from datetime import datetime, timedelta
+
+    os.environ.setdefault('BATCH_JOB_WORKERS', '0')
+    import app as api
+
+    connected = api.db.ensure_connection()
+    user = api.db.get_all_users()[:1] if connected else []
+    if not user:
+        reason = 'No user to authenticate as' if connected else 'Database connection failed'
+        skipped = {'routes': reason, 'database': reason}
+    else:
+        user_id = user[0]['id']
+        token = jwt.encode({'user_id': user_id, 'exp': datetime.utcnow() + timedelta(hours=1)},
+                           api.app.config['SECRET_KEY'], algorithm='HS256')
+        headers = {'Authorization': f'Bearer {token}'}
+        client = api.app.test_client()
+
+        def post_predict(record):
+            response = client.post('/predict', json=record, headers=headers)
+            if response.status_code != 200:
+                raise RuntimeError(f'/predict returned {response.status_code}: {response.get_json()}')
+
+        per_call('route_predict', post_predict)
+        for size in sizes:
+            upload = applicants[size].to_csv(index=False).encode()
+            started = time.perf_counter()
+            response = client.post('/predict/batch', headers=headers, content_type='multipart/form-data',
+                                   data={'file': (io.BytesIO(upload), 'benchmark.csv'), 'batch_name': 'benchmark'})
+            elapsed = time.perf_counter() - started
+            if response.status_code != 200:
+                raise RuntimeError(f'/predict/batch returned {response.status_code}: {response.get_json()}')
+            drop_benchmark_batch(api.db, user_id, response.get_json()['batch_id'])
+            results[f'route_predict_batch[{size}]'] = {'seconds': round(elapsed, 6), 'rows_per_sec': round(size / elapsed, 1),
+                                                       'upload_mb': round(len(upload) / 1e6, 2)}
+
+        def save_prediction(record):
+            if api.db.save_prediction(user_id, dict(record, prediction=1, probability=0.9,
+                                                    model_version='benchmark')) is None:
+                raise RuntimeError('save_prediction failed')
+
+        per_call('db_save_prediction', save_prediction)
+
+        for size in sizes:
+            scored = score_batch_chunk(predictor, applicants[size])['scored']
+            batch_id = api.db.save_batch_prediction(user_id, {'batch_name': 'benchmark', 'filename': 'benchmark.csv',
+                                                              'total_applications': size, 'approved_applications': 0,
+                                                              'rejected_applications': 0})
+            try:
+                started = time.perf_counter()
+                if not api.db.save_batch_prediction_columns(batch_id, scored):
+                    raise RuntimeError('save_batch_prediction_columns failed')
+                elapsed = time.perf_counter() - started
+                results[f'db_save_batch_columns[{size}]'] = {'seconds': round(elapsed, 6),
+                                                             'rows_per_sec': round(size / elapsed, 1)}
+                for name, after in [('first', None), ('last', max(size - 500, 0))]:
+                    latencies = []
+                    for _ in range(20):
+                        started = time.perf_counter()
+                        api.db.get_batch_prediction_details(batch_id, 500, after=after)
+                        latencies.append(time.perf_counter() - started)
+                    results[f'db_read_batch_details_{name}_page[{size}]'] = latency_summary(latencies, sum(latencies))
+            finally:
+                drop_benchmark_batch(api.db, user_id, batch_id)
+
+        for name, read in [('user_predictions', lambda: api.db.get_user_predictions(user_id, 50)),
+                           ('user_batches', lambda: api.db.get_user_batch_predictions(user_id, 20)),
+                           ('user_statistics', lambda: api.db.get_user_statistics(user_id)),
+                           ('credit_score_bands', api.db.get_approval_by_credit_score),
+                           ('recent_activity', lambda: api.db.get_recent_predictions_summary(50))]:
+            latencies = []
+            for _ in range(100):
+                started = time.perf_counter()
+                read()
+                latencies.append(time.perf_counter() - started)
+            results[f'db_read_{name}'] = latency_summary(latencies, sum(latencies))
+
+    report = {'meta': run_metadata(args, predictor, sizes), 'results': results, 'skipped': skipped}
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['comparison'] = compare_results(json.load(f), results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+BENCHMARKS = {
+    'suite': bench_suite,
+    'metrics': bench_metrics,
+    'serve': bench_serve,
+    'async': bench_async,
+    'credit_bands': bench_credit_bands,
+    'recent_activity': bench_recent_activity,
+    'write_behind': bench_write_behind,
+    'user_cache': bench_user_cache,
+    'db_pool': bench_db_pool,
+    'bulk_insert': bench_bulk_insert,
+    'coalescer': bench_coalescer,
+    'engines': bench_engines,
+    'sharded': bench_sharded,
+    'startup': bench_startup,
+    'reload': bench_reload
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('name', choices=sorted(BENCHMARKS))
+    parser.add_argument('--engine', default='lightgbm')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--wait-ms', type=float, default=2.0)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--duration', type=float, default=6.0, help='seconds of load to generate')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--shard-size', type=int, default=50000)
+    parser.add_argument('--batch-rows', type=int, default=5000, help='rows per bulk insert commit')
+    parser.add_argument('--worker-counts', default='1,2,4', help='serve.py worker counts for serve')
+    parser.add_argument('--slow-clients', type=int, default=1000, help='connections sending slowly for async')
+    parser.add_argument('--slow-seconds', type=float, default=10.0, help='seconds each slow client takes to send')
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='detail table sizes for credit_bands')
+    parser.add_argument('--suite-sizes', default='1000,100000,1000000', help='applicant counts for suite')
+    parser.add_argument('--output', help='file to save the suite results to')
+    parser.add_argument('--baseline', help='saved suite results to compare with')
+    args = parser.parse_args()
+
+    print(json.dumps(BENCHMARKS[args.name](args), indent=2))
@@ -0,0 +1,217 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ttl_seconds"""
+
+    def __init__(self, max_entries=10000, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _lookup(self, key, now, default):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        value, expires_at = entry
+        if expires_at <= now:
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _store(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        """Return the cached value, or default on a miss"""
+        with self._lock:
+            return self._lookup(key, time.monotonic(), default)
+
+    def get_many(self, keys, default=None):
+        """Look up several keys under one lock acquisition"""
+        now = time.monotonic()
+        with self._lock:
+            return [self._lookup(key, now, default) for key in keys]
+
+    def put(self, key, value):
+        """Store a value, evicting least recently used entries past max_entries"""
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._store(key, value, time.monotonic() + self.ttl)
+
+    def put_many(self, items):
+        """Store several (key, value) pairs under one lock acquisition"""
+        if self.max_entries <= 0:
+            return
+
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in items:
+                self._store(key, value, expires_at)
+
+    def invalidate(self, key):
+        """Drop one entry if present"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_metrics(self):
+        """Hit/miss/eviction counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0
+            }
+
+
+class SharedInvalidations:
+    """Cache keys invalidated by any process on this host, through an append-only file.
+
+    publish() appends a key; changes() returns the keys appended since its
+    previous call, by any process, and costs one os.stat when there are none.
+    A process only needs what was published after it started, since its
+    cache starts empty. The file's first line is a random id, so a file that
+    was deleted and recreated is told apart from the one read before.
+
+    With max_age (the cache TTL), publish() replaces a file whose last key is
+    older than that with an empty one: every entry those keys invalidated has
+    expired by then. Readers see a new file and drop everything, once, which
+    also covers a key appended to the old file while it was being replaced.
+    """
+
+    # '#', a uuid4 hex and a newline
+    ID_LINE_BYTES = 34
+
+    def __init__(self, path, max_age=None):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._signature = self._stat()
+        self._file_id, self._offset = None, 0
+        if self._signature is not None:
+            self._file_id = self._read_file_id()
+            self._offset = self._signature[1]
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _read_file_id(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return f.readline()
+        except FileNotFoundError:
+            return None
+
+    def _create(self, replace=False):
+        """Create the file with its id line, unless another process already has (or replace it)"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(f'#{uuid.uuid4().hex}\n'.encode())
+        if replace:
+            os.replace(temp_path, self.path)
+            return
+        try:
+            os.link(temp_path, self.path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp_path)
+
+    def publish(self, key):
+        for _ in range(3):
+            try:
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+            except FileNotFoundError:
+                try:
+                    self._create()
+                except OSError as e:
+                    print(f" Cache invalidation publish error: {e}")
+                    return
+                continue
+            except OSError as e:
+                print(f" Cache invalidation publish error: {e}")
+                return
+            try:
+                if self._expired(os.fstat(fd)):
+                    self._create(replace=True)
+                    continue
+                # One small O_APPEND write, so lines from several processes never interleave
+                os.write(fd, f'{key}\n'.encode())
+            except OSError as e:
+                print(f" Cache invalidation publish error: {e}")
+            finally:
+                os.close(fd)
+            return
+
+    def _expired(self, stat):
+        """Whether the file holds keys and the newest is older than max_age"""
+        return (self.max_age is not None and stat.st_size > self.ID_LINE_BYTES
+                and time.time() - stat.st_mtime > self.max_age)
+
+    def changes(self):
+        """Keys published since the last call, or None if the file was replaced (drop everything)"""
+        signature = self._stat()
+        if signature == self._signature or signature is None:
+            return []
+        with self._lock:
+            try:
+                with open(self.path, 'rb') as f:
+                    file_id = f.readline()
+                    if self._file_id is not None and (file_id != self._file_id or signature[1] < self._offset):
+                        # Keys written to the old file since the last read are lost
+                        self._file_id, self._offset, self._signature = file_id, signature[1], signature
+                        return None
+                    if self._file_id is None:
+                        # Created since this process started: every key in it is new
+                        self._file_id, self._offset = file_id, len(file_id)
+                    f.seek(self._offset)
+                    data = f.read(signature[1] - self._offset)
+            except OSError as e:
+                print(f" Cache invalidation read error: {e}")
+                return []
+            # A line still being written is picked up by the next call
+            complete = data[:data.rfind(b'\n') + 1]
+            self._offset += len(complete)
+            self._signature = signature if len(complete) == len(data) else None
+            return complete.decode().split()
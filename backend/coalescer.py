@@ -0,0 +1,169 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import numpy as np
+
+from metrics import STAGE_SECONDS
+
+
+class CoalescerBusy(Exception):
+    """Raised when the queue is full, the coalescer is stopped, or no result arrives within its timeout"""
+
+
+class PredictionCoalescer:
+    """Gathers concurrent single predictions into one model call.
+
+    Requests arriving within max_wait_ms of the first queued request (or
+    until max_batch_size is reached) are scored together; each caller
+    blocks on its own Future and gets its own result back. A request may
+    name the predictor it was submitted against, so calls that started
+    before a model swap are still scored by the old model.
+
+    At most max_queue_size requests wait; past that, and once stop() is
+    called, submit() raises CoalescerBusy instead of blocking. predict()
+    raises it too when no result arrives within timeout seconds, and the
+    abandoned request is skipped if it has not been scored yet.
+    """
+
+    def __init__(self, predictor, max_wait_ms=2.0, max_batch_size=64, max_queue_size=1000, timeout=1.0):
+        self.predictor = predictor
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.max_queue_size = max_queue_size
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stop = threading.Event()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'requests': 0,
+            'rejected': 0,
+            'timed_out': 0,
+            'batches': 0,
+            'max_batch_size_seen': 0,
+            'total_wait_seconds': 0.0,
+            'max_wait_seconds': 0.0
+        }
+        self._worker = threading.Thread(target=self._run, name='prediction-coalescer', daemon=True)
+        self._worker.start()
+
+    def submit(self, data, predictor=None):
+        """Queue one applicant dict; returns a Future resolving to the prediction result"""
+        if self._stop.is_set():
+            raise CoalescerBusy('Prediction coalescer is stopped')
+        future = Future()
+        try:
+            self._queue.put_nowait((data, future, time.perf_counter(), predictor or self.predictor))
+        except queue.Full:
+            with self._metrics_lock:
+                self._metrics['rejected'] += 1
+            raise CoalescerBusy(f'Prediction queue is full ({self.max_queue_size} requests)')
+        return future
+
+    def predict(self, data, predictor=None, timeout=None):
+        """Blocking equivalent of LoanPredictionModel.predict_single (timeout defaults to self.timeout)"""
+        timeout = self.timeout if timeout is None else timeout
+        future = self.submit(data, predictor)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            self.abandon(future)
+            raise CoalescerBusy(f'No prediction within {timeout}s')
+
+    def abandon(self, future):
+        """Give up on a submitted request (its caller timed out)"""
+        future.cancel()
+        with self._metrics_lock:
+            self._metrics['timed_out'] += 1
+
+    def stop(self, timeout=5.0):
+        """Refuse new requests and score the queued ones before the thread exits"""
+        self._stop.set()
+        self._worker.join(timeout)
+
+    def _collect(self):
+        """Block briefly for a first request, then gather more until the window closes"""
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                if self._stop.is_set():
+                    return
+                continue
+            started = time.perf_counter()
+
+            groups = {}
+            for data, future, _, predictor in batch:
+                groups.setdefault(id(predictor), (predictor, []))[1].append((data, future))
+
+            for predictor, requests in groups.values():
+                self._score(predictor, requests)
+
+            waits = [started - queued_at for _, _, queued_at, _ in batch]
+            with self._metrics_lock:
+                self._metrics['requests'] += len(batch)
+                self._metrics['batches'] += 1
+                self._metrics['max_batch_size_seen'] = max(self._metrics['max_batch_size_seen'], len(batch))
+                self._metrics['total_wait_seconds'] += sum(waits)
+                self._metrics['max_wait_seconds'] = max(self._metrics['max_wait_seconds'], max(waits))
+
+    def _score(self, predictor, requests):
+        # Encode individually so one bad record only fails its own caller
+        rows = []
+        futures = []
+        with STAGE_SECONDS.time('preprocessing'):
+            for data, future in requests:
+                # False when its caller gave up waiting
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    rows.append(predictor.encode(data))
+                    futures.append(future)
+                except Exception as e:
+                    future.set_exception(e)
+
+        if not rows:
+            return
+
+        try:
+            with STAGE_SECONDS.time('inference'):
+                predictions, probabilities = predictor.predict_encoded(np.vstack(rows))
+            for future, prediction, probability in zip(futures, predictions, probabilities):
+                future.set_result(predictor.format_result(prediction, probability))
+        except Exception as e:
+            print(f" Coalesced prediction error: {e}")
+            for future in futures:
+                future.set_exception(e)
+
+    def get_metrics(self):
+        """Batch size, queue wait and queue depth counters"""
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+
+        batches = metrics['batches']
+        requests = metrics['requests']
+        metrics['avg_batch_size'] = round(requests / batches, 2) if batches else 0
+        metrics['avg_wait_ms'] = round(metrics.pop('total_wait_seconds') / requests * 1000, 3) if requests else 0
+        metrics['max_wait_ms'] = round(metrics.pop('max_wait_seconds') * 1000, 3)
+        metrics['queue_depth'] = self._queue.qsize()
+        metrics['max_wait_window_ms'] = self.max_wait * 1000
+        metrics['max_batch_size'] = self.max_batch_size
+        return metrics
@@ -2,56 +2,402 @@ import mysql.connector
 from mysql.connector import Error
 from datetime import datetime, timedelta
 import hashlib
+import io
+import math
+import os
 import secrets
+import tempfile
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+import numpy as np
+
+from cache import TTLCache, SharedInvalidations
+from db_pool import ConnectionPool, PoolError
+
+# Users changed by any process on this host (pre-fork workers, the asyncio API) are
+# listed here, so every process drops them from its user cache on its next lookup
+USER_INVALIDATIONS_PATH = os.environ.get('USER_INVALIDATIONS_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'logs', 'user_cache', 'invalidations.log'))
+
+# Columns written to batch_prediction_details after batch_id, in insert order
+BATCH_DETAIL_COLUMNS = (
+    'applicant_name', 'annual_income', 'loan_amount', 'interest_rate',
+    'debt_to_income_ratio', 'credit_score', 'gender', 'marital_status',
+    'education_level', 'employment_status', 'loan_purpose', 'grade_subgrade',
+    'prediction', 'probability', 'risk_score', 'rejection_reasons', 'row_number',
+    'model_version'
+)
+
+# Columns written to single_predictions after user_id, in insert order
+PREDICTION_COLUMNS = (
+    'applicant_name', 'annual_income', 'debt_to_income_ratio', 'credit_score',
+    'loan_amount', 'interest_rate', 'gender', 'marital_status', 'education_level',
+    'employment_status', 'loan_purpose', 'grade_subgrade', 'prediction',
+    'probability', 'risk_score', 'rejection_reasons', 'model_version'
+)
+
+# Columns returned by the paginated history endpoints
+PREDICTION_HISTORY_COLUMNS = (
+    'id', 'applicant_name', 'annual_income', 'loan_amount', 'interest_rate',
+    'debt_to_income_ratio', 'credit_score', 'prediction', 'probability',
+    'risk_score', 'created_at', 'model_version'
+)
+BATCH_HISTORY_COLUMNS = (
+    'id', 'batch_name', 'file_name', 'file_size_kb', 'total_applications',
+    'approved_applications', 'rejected_applications', 'approval_rate',
+    'processed_at', 'processing_time_seconds'
+)
+BATCH_DETAIL_PAGE_COLUMNS = (
+    '`row_number`', 'applicant_name', 'annual_income', 'loan_amount', 'interest_rate',
+    'debt_to_income_ratio', 'credit_score', 'prediction', 'probability',
+    'risk_score', 'rejection_reasons', 'model_version'
+)
+
+# Running totals kept per user in user_prediction_counters
+USER_COUNTER_COLUMNS = (
+    'single_predictions', 'single_approved', 'single_rejected', 'batch_predictions',
+    'batch_applications', 'batch_approved', 'batch_rejected'
+)
+
+# Sources of the recent activity feed, in tie-break order for equal timestamps:
+# (prediction_type, table alias, date column, SELECT with the feed's columns)
+RECENT_ACTIVITY_SOURCES = (
+    ('Single', 'sp', 'sp.created_at', """
+        SELECT 'Single' AS prediction_type, sp.id AS id, u.username AS username,
+            sp.applicant_name AS applicant_name, sp.loan_amount AS loan_amount,
+            sp.credit_score AS credit_score, sp.prediction AS prediction,
+            sp.probability AS probability, sp.created_at AS prediction_date
+        FROM single_predictions sp JOIN users u ON u.id = sp.user_id
+    """),
+    ('Batch', 'bp', 'bp.processed_at', """
+        SELECT 'Batch' AS prediction_type, bp.id AS id, u.username AS username,
+            bp.file_name AS applicant_name, NULL AS loan_amount, NULL AS credit_score,
+            NULL AS prediction, NULL AS probability, bp.processed_at AS prediction_date
+        FROM batch_predictions bp JOIN users u ON u.id = bp.user_id
+    """)
+)
+RECENT_ACTIVITY_TYPES = tuple(source[0] for source in RECENT_ACTIVITY_SOURCES)
+
+# Bands of credit_score_band_counts as (band, label, exclusive upper bound);
+# a missing score falls in the last band, as in the original view
+CREDIT_SCORE_BANDS = (
+    (1, 'Poor (300-579)', 580),
+    (2, 'Fair (580-669)', 670),
+    (3, 'Good (670-739)', 740),
+    (4, 'Very Good (740-799)', 800),
+    (5, 'Excellent (800-850)', None)
+)
+
+
+def _column_values(column, row_count):
+    """Python values of one column (array, Series or list), NaN as None"""
+    if isinstance(column, str) or not hasattr(column, '__len__'):
+        return [column] * row_count
+    values = column.tolist() if hasattr(column, 'tolist') else list(column)
+    return [None if isinstance(value, float) and math.isnan(value) else value for value in values]
+
+
+def pooled(method):
+    """Run a Database method on a connection checked out for the call"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.session():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _column_list():
+    return ', '.join(f'`{column}`' for column in BATCH_DETAIL_COLUMNS)
+
+
+def _credit_band_case(column, field=0):
+    """SQL CASE mapping a credit score column to a band number (field=0) or label (field=1)"""
+    branches = ' '.join(
+        f"WHEN {column} < {bound} THEN {band[field]!r}" for *band, bound in CREDIT_SCORE_BANDS[:-1]
+    )
+    return f"CASE {branches} ELSE {CREDIT_SCORE_BANDS[-1][field]!r} END"
+
+
+def _credit_band_counts(credit_scores, predictions):
+    """{band: [approved, rejected]} for parallel lists of scores and predictions"""
+    scores = np.array(credit_scores, dtype=float)
+    outcomes = np.array(predictions, dtype=float)
+    bounds = [bound for _, _, bound in CREDIT_SCORE_BANDS[:-1]]
+    # NaN sorts past every bound, so missing scores land in the last band
+    bands = np.searchsorted(bounds, scores, side='right') + 1
+    counts = {}
+    for band, _, _ in CREDIT_SCORE_BANDS:
+        in_band = bands == band
+        approved = int(np.count_nonzero(in_band & (outcomes == 1)))
+        rejected = int(np.count_nonzero(in_band & (outcomes == 0)))
+        if approved or rejected:
+            counts[band] = [approved, rejected]
+    return counts
+
+
+def prediction_history_query(user_id, limit, after=None, outcome=None):
+    """(query, params) for one page of a user's single predictions, newest first"""
+    conditions = ["user_id = %s"]
+    params = [user_id]
+    
+    if outcome is not None:
+        conditions.append("prediction = %s")
+        params.append(outcome)
+    
+    if after is not None:
+        conditions.append("(created_at < %s OR (created_at = %s AND id < %s))")
+        params.extend([after[0], after[0], after[1]])
+    
+    query = f"""
+        SELECT {', '.join(PREDICTION_HISTORY_COLUMNS)} FROM single_predictions 
+        WHERE {' AND '.join(conditions)} 
+        ORDER BY created_at DESC, id DESC 
+        LIMIT %s
+    """
+    return query, tuple(params) + (limit,)
+
+
+def batch_history_query(user_id, limit, after=None):
+    """(query, params) for one page of a user's batches, newest first"""
+    conditions = ["user_id = %s"]
+    params = [user_id]
+    
+    if after is not None:
+        conditions.append("(processed_at < %s OR (processed_at = %s AND id < %s))")
+        params.extend([after[0], after[0], after[1]])
+    
+    query = f"""
+        SELECT {', '.join(BATCH_HISTORY_COLUMNS)} FROM batch_predictions 
+        WHERE {' AND '.join(conditions)} 
+        ORDER BY processed_at DESC, id DESC 
+        LIMIT %s
+    """
+    return query, tuple(params) + (limit,)
+
+
+def batch_details_query(batch_id, limit=None, after=None, outcome=None):
+    """(query, params) for one page of a batch's rows in file order"""
+    conditions = ["batch_id = %s"]
+    params = [batch_id]
+    
+    if outcome is not None:
+        conditions.append("prediction = %s")
+        params.append(outcome)
+    
+    if after is not None:
+        conditions.append("`row_number` > %s")
+        params.append(after)
+    
+    query = f"""
+        SELECT {', '.join(BATCH_DETAIL_PAGE_COLUMNS)} FROM batch_prediction_details 
+        WHERE {' AND '.join(conditions)} 
+        ORDER BY `row_number` ASC
+    """
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    return query, tuple(params)
+
+
+def recent_activity_query(limit, before=None, user_id=None):
+    """(query, params) merging the newest rows of each RECENT_ACTIVITY_SOURCES table"""
+    parts = []
+    params = []
+    for rank, (prediction_type, alias, date_column, select) in enumerate(RECENT_ACTIVITY_SOURCES):
+        conditions = []
+        if user_id is not None:
+            conditions.append(f"{alias}.user_id = %s")
+            params.append(user_id)
+        
+        if before is not None:
+            before_rank = RECENT_ACTIVITY_TYPES.index(before[1])
+            if rank < before_rank:
+                conditions.append(f"{date_column} < %s")
+                params.append(before[0])
+            elif rank > before_rank:
+                conditions.append(f"{date_column} <= %s")
+                params.append(before[0])
+            else:
+                conditions.append(f"({date_column} < %s OR ({date_column} = %s AND {alias}.id < %s))")
+                params.extend([before[0], before[0], before[2]])
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        parts.append(f"""
+            SELECT * FROM ({select} {where}
+                ORDER BY {date_column} DESC, {alias}.id DESC LIMIT %s) AS {alias}_recent
+        """)
+        params.append(limit)
+    
+    query = " UNION ALL ".join(parts) + """
+        ORDER BY prediction_date DESC, prediction_type DESC, id DESC
+        LIMIT %s
+    """
+    return query, tuple(params) + (limit,)
+
+
+def user_counter_upsert(user_id, deltas):
+    """(query, params) adding deltas to a user's row of user_prediction_counters"""
+    columns = [column for column in USER_COUNTER_COLUMNS if column in deltas]
+    query = f"""
+        INSERT INTO user_prediction_counters (user_id, {', '.join(columns)})
+        VALUES (%s, {', '.join(['%s'] * len(columns))})
+        ON DUPLICATE KEY UPDATE {', '.join(f'{column} = {column} + VALUES({column})' for column in columns)}
+    """
+    return query, (user_id,) + tuple(deltas[column] for column in columns)
+
+
+CREDIT_BAND_UPSERT = """
+    INSERT INTO credit_score_band_counts (band, credit_score_range, approved, rejected)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE approved = approved + VALUES(approved), rejected = rejected + VALUES(rejected)
+"""
+
+# Run on every connection: AUTO_INCREMENT hands this API odd ids only, so the
+# even ids write-behind reserves are never generated for another row. An
+# explicit id past AUTO_INCREMENT moves AUTO_INCREMENT with it, which would
+# otherwise hand a reserved, still queued id to the next synchronous insert.
+AUTO_INCREMENT_SESSION = "SET SESSION auto_increment_increment = 2, auto_increment_offset = 1"
+
+# Reserves %s even single_predictions ids past every stored id and leaves the
+# new next_id in LAST_INSERT_ID() (write-behind only; migration 006)
+PREDICTION_ID_RESERVE = """
+    UPDATE id_sequences
+    SET next_id = LAST_INSERT_ID((GREATEST(
+        next_id, (SELECT COALESCE(MAX(id), 0) + 1 FROM single_predictions)
+    ) + 1) DIV 2 * 2 + 2 * %s)
+    WHERE name = 'single_predictions'
+"""
+
+
+class PredictionIdConflict(Exception):
+    """Raised by save_predictions when a queued row's id is stored for a different prediction"""
+
+    def __init__(self, ids):
+        super().__init__(f"Prediction ids already used by other rows: {', '.join(map(str, ids))}")
+        self.ids = ids
+
+
+def credit_band_rows(counts):
+    """CREDIT_BAND_UPSERT rows for {band: [approved, rejected]}.
+    
+    Bands come in ascending order so concurrent writers lock them in the
+    same order and cannot deadlock.
+    """
+    labels = {band: label for band, label, _ in CREDIT_SCORE_BANDS}
+    return [(band, labels[band], approved, rejected) for band, (approved, rejected) in sorted(counts.items())]
+
+
+def _load_data_field(value):
+    """One LOAD DATA field: \\N for NULL, tabs/newlines/backslashes escaped"""
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
 
 class Database:
-    def __init__(self):
+    """MySQL data access through a connection pool.
+    
+    Each public method checks a connection out of the pool for its duration
+    (see pooled), so any number of threads can share one Database. Calls
+    made inside session() reuse that session's connection.
+    """
+    
+    def __init__(self, connect=True):
         self.host = "localhost"
         self.user = "root"
         self.password = ""
         self.database = "loan_payback"
-        self.connection = None
-        self.connect()
+        # 'executemany' (multi-row INSERT) or 'load_data' (LOAD DATA LOCAL INFILE)
+        self.bulk_insert_method = os.environ.get('DB_BULK_INSERT_METHOD', 'executemany')
+        self.bulk_insert_rows = int(os.environ.get('DB_BULK_INSERT_ROWS', 5000))
+        self.pool = ConnectionPool(
+            self._open_connection,
+            size=int(os.environ.get('DB_POOL_SIZE', 10)),
+            timeout=float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+            validate_idle_seconds=float(os.environ.get('DB_POOL_VALIDATE_IDLE', 30))
+        )
+        self._local = threading.local()
+        # Active user records for the auth decorators; writes to a user invalidate it
+        self.user_cache = TTLCache(
+            max_entries=int(os.environ.get('USER_CACHE_SIZE', 10000)),
+            ttl_seconds=float(os.environ.get('USER_CACHE_TTL', 30))
+        )
+        self._user_generations = {}
+        self._user_cache_epoch = 0
+        self._user_cache_lock = threading.Lock()
+        self.user_invalidations = SharedInvalidations(USER_INVALIDATIONS_PATH, max_age=self.user_cache.ttl)
+        if connect:
+            self.connect()
     
-    def connect(self):
-        """Create database connection"""
+    def _open_connection(self):
+        connection = mysql.connector.connect(
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            autocommit=False,
+            allow_local_infile=self.bulk_insert_method == 'load_data'
+        )
+        cursor = connection.cursor()
+        cursor.execute(AUTO_INCREMENT_SESSION)
+        cursor.close()
+        return connection
+    
+    @property
+    def connection(self):
+        """The connection checked out by the current thread, or None"""
+        return getattr(self._local, 'connection', None)
+    
+    @contextmanager
+    def session(self):
+        """Hold one pooled connection for every call made inside the block"""
+        local = self._local
+        if getattr(local, 'depth', 0):
+            local.depth += 1
+            try:
+                yield local.connection
+            finally:
+                local.depth -= 1
+            return
+        
         try:
-            if self.connection and self.connection.is_connected():
-                return True
-                
-            self.connection = mysql.connector.connect(
-                host=self.host,
-                user=self.user,
-                password=self.password,
-                database=self.database,
-                autocommit=False,
-                pool_name="mypool",
-                pool_size=5
-            )
-            
-            if self.connection.is_connected():
+            connection = self.pool.acquire()
+        except PoolError as e:
+            print(f"🔴 Error connecting to database: {e}")
+            connection = None
+        
+        local.connection, local.depth = connection, 1
+        try:
+            yield connection
+        finally:
+            local.connection, local.depth = None, 0
+            if connection is not None:
+                self.pool.release(connection)
+    
+    def connect(self):
+        """Check that the pool can open a connection"""
+        with self.session() as connection:
+            if connection is not None:
                 print("🟢 Database connected!")
                 return True
-        except Error as e:
-            print(f"🔴 Error connecting to database: {e}")
-            self.connection = None
             return False
     
     def ensure_connection(self):
-        """Ensure database connection is active"""
-        try:
-            if not self.connection or not self.connection.is_connected():
-                print("Database connection lost, reconnecting...")
-                return self.connect()
-            return True
-        except:
-            return self.connect()
+        """Whether a pooled connection is available to this thread"""
+        if getattr(self._local, 'depth', 0):
+            return self._local.connection is not None
+        with self.session() as connection:
+            return connection is not None
     
     def disconnect(self):
-        """Close database connection"""
-        if self.connection and self.connection.is_connected():
-            self.connection.close()
-            print("Database connection closed!")
+        """Close pooled connections"""
+        self.pool.close()
+        print("Database connection closed!")
+    
+    def get_pool_metrics(self):
+        return self.pool.get_metrics()
     
     def hash_password(self, password):
         """Hash password using SHA-256"""
@@ -59,6 +405,7 @@ class Database:
     
     #  USER MANAGEMENT 
     
+    @pooled
     def create_user(self, username, email, password, full_name=None):
         """Create new user"""
         if not self.ensure_connection():
@@ -83,6 +430,7 @@ class Database:
             print(f"Error creating user: {e}")
             return None
     
+    @pooled
     def get_user_by_username(self, username):
         """Get user by username"""
         if not self.ensure_connection():
@@ -99,6 +447,7 @@ class Database:
             print(f"Error fetching user: {e}")
             return None
     
+    @pooled
     def get_user_by_email(self, email):
         """Get user by email"""
         if not self.ensure_connection():
@@ -115,6 +464,7 @@ class Database:
             print(f"Error fetching user: {e}")
             return None
     
+    @pooled
     def get_user_by_id(self, user_id):
         """Get user by ID"""
         if not self.ensure_connection():
@@ -131,6 +481,48 @@ class Database:
             print(f"Error fetching user: {e}")
             return None
     
+    def get_user_by_id_cached(self, user_id):
+        """get_user_by_id served from the user cache when possible"""
+        self._apply_user_invalidations()
+        user = self.user_cache.get(user_id)
+        if user is None:
+            generation = self._user_generation(user_id)
+            user = self.get_user_by_id(user_id)
+            with self._user_cache_lock:
+                # Skip the store if the user changed while we were reading it
+                if user and self._user_generation(user_id) == generation:
+                    self.user_cache.put(user_id, user)
+        return dict(user) if user else None
+    
+    def _user_generation(self, user_id):
+        return self._user_cache_epoch, self._user_generations.get(user_id, 0)
+    
+    def _drop_cached_user(self, user_id):
+        with self._user_cache_lock:
+            self._user_generations[user_id] = self._user_generations.get(user_id, 0) + 1
+            self.user_cache.invalidate(user_id)
+    
+    def _apply_user_invalidations(self):
+        """Drop users that any process changed since the last lookup"""
+        if self.user_cache.max_entries <= 0:
+            return
+        changed = self.user_invalidations.changes()
+        if changed is None:
+            with self._user_cache_lock:
+                self._user_cache_epoch += 1
+                self.user_cache.clear()
+            return
+        for user_id in changed:
+            self._drop_cached_user(int(user_id))
+    
+    def invalidate_user(self, user_id):
+        """Drop a user's cached record after it changes, in this and every other process"""
+        self._drop_cached_user(user_id)
+        self.user_invalidations.publish(user_id)
+    
+    def get_user_cache_metrics(self):
+        return self.user_cache.get_metrics()
+    
     def verify_password(self, username, password):
         """Verify user password"""
         user = self.get_user_by_username(username)
@@ -139,6 +531,7 @@ class Database:
             return user['hashed_password'] == hashed_password
         return False
     
+    @pooled
     def update_last_login(self, user_id):
         """Update user's last login timestamp"""
         if not self.ensure_connection():
@@ -156,6 +549,7 @@ class Database:
             print(f"Error updating last login: {e}")
             return False
     
+    @pooled
     def update_user_profile(self, user_id, full_name=None, email=None):
         """Update user profile information"""
         if not self.ensure_connection():
@@ -182,6 +576,7 @@ class Database:
             
             cursor.execute(query, tuple(params))
             self.connection.commit()
+            self.invalidate_user(user_id)
             cursor.close()
             return True
         except Error as e:
@@ -191,6 +586,7 @@ class Database:
     
     #  PASSWORD RESET 
     
+    @pooled
     def create_reset_token(self, user_id):
         """Create password reset token"""
         if not self.ensure_connection():
@@ -215,6 +611,7 @@ class Database:
             print(f"Error creating reset token: {e}")
             return None
     
+    @pooled
     def verify_reset_token(self, token):
         """Verify password reset token"""
         if not self.ensure_connection():
@@ -234,6 +631,7 @@ class Database:
             print(f"Error verifying token: {e}")
             return None
     
+    @pooled
     def use_reset_token(self, token):
         """Mark reset token as used"""
         if not self.ensure_connection():
@@ -255,6 +653,7 @@ class Database:
             print(f"Error using token: {e}")
             return False
     
+    @pooled
     def update_password(self, user_id, new_password):
         """Update user password"""
         if not self.ensure_connection():
@@ -266,6 +665,7 @@ class Database:
             query = "UPDATE users SET hashed_password = %s WHERE id = %s"
             cursor.execute(query, (hashed_password, user_id))
             self.connection.commit()
+            self.invalidate_user(user_id)
             cursor.close()
             return True
         except Error as e:
@@ -275,6 +675,31 @@ class Database:
     
     # ==================== SINGLE PREDICTIONS ====================
     
+    @pooled
+    def reserve_prediction_ids(self, count):
+        """Reserve `count` single_predictions ids for write-behind; returns them as a range, or None.
+        
+        Needs the id_sequences table (migration 006). The ids are even, and
+        AUTO_INCREMENT gives this API's own inserts odd ones (see
+        AUTO_INCREMENT_SESSION), so a reserved id is never used by another row.
+        """
+        if not self.ensure_connection():
+            return None
+            
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(PREDICTION_ID_RESERVE, (count,))
+            cursor.execute("SELECT LAST_INSERT_ID()")
+            next_id = cursor.fetchone()[0]
+            self.connection.commit()
+            cursor.close()
+            return range(next_id - 2 * count, next_id, 2)
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error reserving prediction ids: {e}")
+            return None
+    
+    @pooled
     def save_prediction(self, user_id, prediction_data):
         """Save single prediction"""
         if not self.ensure_connection():
@@ -287,8 +712,8 @@ class Database:
                     user_id, applicant_name, annual_income, debt_to_income_ratio,
                     credit_score, loan_amount, interest_rate, gender, marital_status,
                     education_level, employment_status, loan_purpose, grade_subgrade,
-                    prediction, probability, risk_score, rejection_reasons
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    prediction, probability, risk_score, rejection_reasons, model_version
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             """
             cursor.execute(query, (
                 user_id,
@@ -307,11 +732,20 @@ class Database:
                 prediction_data.get('prediction'),
                 prediction_data.get('probability'),
                 prediction_data.get('risk_score'),
-                prediction_data.get('rejection_reasons')
+                prediction_data.get('rejection_reasons'),
+                prediction_data.get('model_version')
             ))
-            self.connection.commit()
-            
             prediction_id = cursor.lastrowid
+            approved = 1 if prediction_data.get('prediction') == 1 else 0
+            self._bump_user_counters(cursor, user_id, {
+                'single_predictions': 1,
+                'single_approved': approved,
+                'single_rejected': 1 - approved
+            })
+            self._bump_credit_bands(cursor, _credit_band_counts(
+                [prediction_data.get('credit_score')], [prediction_data.get('prediction')]
+            ))
+            self.connection.commit()
             cursor.close()
             return prediction_id
         except Error as e:
@@ -319,20 +753,84 @@ class Database:
             print(f"Error saving prediction: {e}")
             return None
     
-    def get_user_predictions(self, user_id, limit=50):
-        """Get user's prediction history"""
+    @pooled
+    def save_predictions(self, rows):
+        """Store queued single predictions in one transaction (group commit).
+        
+        Each row is a prediction_data dict plus its pre-allocated id, user_id
+        and created_at. Rows already stored (same id, user_id and created_at)
+        are skipped, so a batch can be replayed safely; an id stored for any
+        other row raises PredictionIdConflict and nothing is written.
+        Returns the number of rows inserted, or None on error.
+        """
+        if not self.ensure_connection():
+            return None
+        if not rows:
+            return 0
+            
+        try:
+            cursor = self.connection.cursor()
+            ids = [row['id'] for row in rows]
+            cursor.execute(
+                f"SELECT id, user_id, created_at FROM single_predictions WHERE id IN ({', '.join(['%s'] * len(ids))})",
+                tuple(ids)
+            )
+            stored = {found: (user_id, created_at) for found, user_id, created_at in cursor.fetchall()}
+            conflicts = [row['id'] for row in rows
+                         if row['id'] in stored and stored[row['id']] != (row['user_id'], row['created_at'])]
+            if conflicts:
+                self.connection.rollback()
+                cursor.close()
+                raise PredictionIdConflict(conflicts)
+            rows = [row for row in rows if row['id'] not in stored]
+            
+            if rows:
+                columns = ('id', 'user_id', 'created_at') + PREDICTION_COLUMNS
+                query = f"""
+                    INSERT INTO single_predictions ({', '.join(columns)})
+                    VALUES ({', '.join(['%s'] * len(columns))})
+                """
+                cursor.executemany(query, [tuple(row.get(column) for column in columns) for row in rows])
+                
+                counters = {}
+                for row in rows:
+                    approved = 1 if row.get('prediction') == 1 else 0
+                    deltas = counters.setdefault(row['user_id'], dict.fromkeys(
+                        ('single_predictions', 'single_approved', 'single_rejected'), 0
+                    ))
+                    deltas['single_predictions'] += 1
+                    deltas['single_approved'] += approved
+                    deltas['single_rejected'] += 1 - approved
+                # Users in id order, then bands, the same lock order as save_prediction
+                for user_id in sorted(counters):
+                    self._bump_user_counters(cursor, user_id, counters[user_id])
+                self._bump_credit_bands(cursor, _credit_band_counts(
+                    [row.get('credit_score') for row in rows], [row.get('prediction') for row in rows]
+                ))
+            
+            self.connection.commit()
+            cursor.close()
+            return len(rows)
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error saving predictions: {e}")
+            return None
+    
+    @pooled
+    def get_user_predictions(self, user_id, limit=50, after=None, outcome=None):
+        """Get user's prediction history, newest first.
+        
+        after is the (created_at, id) of the last row already returned;
+        outcome (0/1) filters on prediction. Both are served from the
+        (user_id, created_at, id) and (user_id, prediction, created_at, id)
+        indexes, so each page costs the same however deep it is.
+        """
         if not self.ensure_connection():
             return []
             
         try:
             cursor = self.connection.cursor(dictionary=True)
-            query = """
-                SELECT * FROM single_predictions 
-                WHERE user_id = %s 
-                ORDER BY created_at DESC 
-                LIMIT %s
-            """
-            cursor.execute(query, (user_id, limit))
+            cursor.execute(*prediction_history_query(user_id, limit, after, outcome))
             predictions = cursor.fetchall()
             cursor.close()
             return predictions
@@ -340,6 +838,7 @@ class Database:
             print(f"Error fetching predictions: {e}")
             return []
     
+    @pooled
     def get_prediction_by_id(self, prediction_id):
         """Get single prediction by ID"""
         if not self.ensure_connection():
@@ -358,6 +857,7 @@ class Database:
     
     # ==================== BATCH PREDICTIONS ====================
     
+    @pooled
     def save_batch_prediction(self, user_id, batch_data):
         """Save batch prediction summary"""
         if not self.ensure_connection():
@@ -384,8 +884,14 @@ class Database:
                 batch_data.get('approval_rate'),
                 batch_data.get('processing_time_seconds')
             ))
-            self.connection.commit()
             batch_id = cursor.lastrowid
+            self._bump_user_counters(cursor, user_id, {
+                'batch_predictions': 1,
+                'batch_applications': batch_data.get('total_applications') or 0,
+                'batch_approved': batch_data.get('approved_applications') or 0,
+                'batch_rejected': batch_data.get('rejected_applications') or 0
+            })
+            self.connection.commit()
             cursor.close()
             return batch_id
         except Error as e:
@@ -393,66 +899,135 @@ class Database:
             print(f"Error saving batch prediction: {e}")
             return None
     
-    def save_batch_prediction_details(self, batch_id, details):
-        """Save batch prediction details"""
+    @pooled
+    def update_batch_prediction(self, batch_id, batch_data):
+        """Update the totals of a batch summary saved before its rows were scored"""
         if not self.ensure_connection():
             return False
-            
+        
         try:
             cursor = self.connection.cursor()
+            cursor.execute("""
+                SELECT user_id, total_applications, approved_applications, rejected_applications
+                FROM batch_predictions WHERE id = %s FOR UPDATE
+            """, (batch_id,))
+            previous = cursor.fetchone()
+            if previous is None:
+                cursor.close()
+                return False
+            
             query = """
-                INSERT INTO batch_prediction_details (
-                    batch_id, applicant_name, annual_income, loan_amount, interest_rate,
-                    debt_to_income_ratio, credit_score, gender, marital_status,
-                    education_level, employment_status, loan_purpose, grade_subgrade,
-                    prediction, probability, risk_score, rejection_reasons, row_number
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                UPDATE batch_predictions
+                SET total_applications = %s, approved_applications = %s,
+                    rejected_applications = %s, approval_rate = %s,
+                    processing_time_seconds = %s
+                WHERE id = %s
             """
-            
-            for detail in details:
-                cursor.execute(query, (
-                    batch_id,
-                    detail.get('applicant_name'),
-                    detail.get('annual_income'),
-                    detail.get('loan_amount'),
-                    detail.get('interest_rate'),
-                    detail.get('debt_to_income_ratio'),
-                    detail.get('credit_score'),
-                    detail.get('gender'),
-                    detail.get('marital_status'),
-                    detail.get('education_level'),
-                    detail.get('employment_status'),
-                    detail.get('loan_purpose'),
-                    detail.get('grade_subgrade'),
-                    detail.get('prediction'),
-                    detail.get('probability'),
-                    detail.get('risk_score'),
-                    detail.get('rejection_reasons'),
-                    detail.get('row_number')
-                ))
-            
+            cursor.execute(query, (
+                batch_data.get('total_applications'),
+                batch_data.get('approved_applications'),
+                batch_data.get('rejected_applications'),
+                batch_data.get('approval_rate'),
+                batch_data.get('processing_time_seconds'),
+                batch_id
+            ))
+            user_id, total, approved, rejected = previous
+            self._bump_user_counters(cursor, user_id, {
+                'batch_applications': (batch_data.get('total_applications') or 0) - (total or 0),
+                'batch_approved': (batch_data.get('approved_applications') or 0) - (approved or 0),
+                'batch_rejected': (batch_data.get('rejected_applications') or 0) - (rejected or 0)
+            })
             self.connection.commit()
             cursor.close()
             return True
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error updating batch prediction: {e}")
+            return False
+
+    def save_batch_prediction_details(self, batch_id, details):
+        """Save batch prediction details from a list of dicts"""
+        columns = {column: [detail.get(column) for detail in details] for column in BATCH_DETAIL_COLUMNS}
+        return self.save_batch_prediction_columns(batch_id, columns, len(details))
+    
+    @pooled
+    def save_batch_prediction_columns(self, batch_id, columns, row_count=None):
+        """Bulk-insert batch prediction details from column arrays.
+        
+        columns maps each name in BATCH_DETAIL_COLUMNS to an array-like (a
+        DataFrame works); missing columns are stored as NULL. Rows are sent
+        bulk_insert_rows at a time with bulk_insert_method and committed per
+        chunk, so a large batch never holds one long transaction. Each chunk
+        adds its outcomes to the credit score bands in the same commit.
+        """
+        if not self.ensure_connection():
+            return False
+        
+        if row_count is None:
+            row_count = len(columns[next(iter(columns))]) if len(columns) else 0
+        if row_count == 0:
+            return True
+        
+        values = [[batch_id] * row_count]
+        for column in BATCH_DETAIL_COLUMNS:
+            values.append(_column_values(columns[column], row_count) if column in columns else [None] * row_count)
+        
+        insert = self._load_data_rows if self.bulk_insert_method == 'load_data' else self._executemany_rows
+        credit_scores = values[BATCH_DETAIL_COLUMNS.index('credit_score') + 1]
+        predictions = values[BATCH_DETAIL_COLUMNS.index('prediction') + 1]
+        try:
+            cursor = self.connection.cursor()
+            for start in range(0, row_count, self.bulk_insert_rows):
+                stop = min(start + self.bulk_insert_rows, row_count)
+                insert(cursor, list(zip(*(column[start:stop] for column in values))))
+                self._bump_credit_bands(cursor, _credit_band_counts(
+                    credit_scores[start:stop], predictions[start:stop]
+                ))
+                self.connection.commit()
+            cursor.close()
+            return True
         except Error as e:
             self.connection.rollback()
             print(f"Error saving batch details: {e}")
             return False
     
-    def get_user_batch_predictions(self, user_id, limit=20):
-        """Get user's batch prediction history"""
+    def _executemany_rows(self, cursor, rows):
+        # mysql.connector rewrites executemany INSERTs into one multi-row statement
+        query = f"""
+            INSERT INTO batch_prediction_details (batch_id, {_column_list()})
+            VALUES ({', '.join(['%s'] * (len(BATCH_DETAIL_COLUMNS) + 1))})
+        """
+        cursor.executemany(query, rows)
+    
+    def _load_data_rows(self, cursor, rows):
+        # LOAD DATA reads a file path, so the buffer is spooled to a temporary file
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(_load_data_field(value) for value in row))
+            buffer.write('\n')
+        
+        with tempfile.NamedTemporaryFile('w', suffix='.tsv', encoding='utf-8') as f:
+            f.write(buffer.getvalue())
+            f.flush()
+            cursor.execute(f"""
+                LOAD DATA LOCAL INFILE %s INTO TABLE batch_prediction_details
+                CHARACTER SET utf8mb4
+                FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n'
+                (batch_id, {_column_list()})
+            """, (f.name,))
+    
+    @pooled
+    def get_user_batch_predictions(self, user_id, limit=20, after=None):
+        """Get user's batch prediction history, newest first.
+        
+        after is the (processed_at, id) of the last batch already returned.
+        """
         if not self.ensure_connection():
             return []
             
         try:
             cursor = self.connection.cursor(dictionary=True)
-            query = """
-                SELECT * FROM batch_predictions 
-                WHERE user_id = %s 
-                ORDER BY processed_at DESC 
-                LIMIT %s
-            """
-            cursor.execute(query, (user_id, limit))
+            cursor.execute(*batch_history_query(user_id, limit, after))
             batches = cursor.fetchall()
             cursor.close()
             return batches
@@ -460,19 +1035,19 @@ class Database:
             print(f"Error fetching batch predictions: {e}")
             return []
     
-    def get_batch_prediction_details(self, batch_id):
-        """Get details of a specific batch prediction"""
+    @pooled
+    def get_batch_prediction_details(self, batch_id, limit=None, after=None, outcome=None):
+        """Get details of a specific batch prediction in file order.
+        
+        after is the row_number of the last row already returned; outcome
+        (0/1) filters on prediction. limit=None returns every row.
+        """
         if not self.ensure_connection():
             return []
             
         try:
             cursor = self.connection.cursor(dictionary=True)
-            query = """
-                SELECT * FROM batch_prediction_details 
-                WHERE batch_id = %s 
-                ORDER BY row_number ASC
-            """
-            cursor.execute(query, (batch_id,))
+            cursor.execute(*batch_details_query(batch_id, limit, after, outcome))
             details = cursor.fetchall()
             cursor.close()
             return details
@@ -480,6 +1055,7 @@ class Database:
             print(f"Error fetching batch details: {e}")
             return []
     
+    @pooled
     def get_batch_prediction_by_id(self, batch_id):
         """Get batch prediction by ID"""
         if not self.ensure_connection():
@@ -496,10 +1072,318 @@ class Database:
             print(f"Error fetching batch: {e}")
             return None
     
+    @pooled
+    def delete_batch_prediction_details(self, batch_id):
+        """Remove the stored rows of a batch (before re-running it)"""
+        if not self.ensure_connection():
+            return False
+            
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(f"""
+                SELECT {_credit_band_case('credit_score')} AS band,
+                    SUM(CASE WHEN prediction = 1 THEN 1 ELSE 0 END),
+                    SUM(CASE WHEN prediction = 0 THEN 1 ELSE 0 END)
+                FROM batch_prediction_details WHERE batch_id = %s
+                GROUP BY band
+            """, (batch_id,))
+            removed = {int(band): [-int(approved or 0), -int(rejected or 0)]
+                       for band, approved, rejected in cursor.fetchall()}
+            cursor.execute("DELETE FROM batch_prediction_details WHERE batch_id = %s", (batch_id,))
+            self._bump_credit_bands(cursor, removed)
+            self.connection.commit()
+            cursor.close()
+            return True
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error deleting batch details: {e}")
+            return False
+    
+    @pooled
+    def delete_batch_prediction(self, batch_id):
+        """Remove a batch summary and its rows (what a failed batch job stored)"""
+        if not self.delete_batch_prediction_details(batch_id):
+            return False
+            
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("""
+                SELECT user_id, total_applications, approved_applications, rejected_applications
+                FROM batch_predictions WHERE id = %s FOR UPDATE
+            """, (batch_id,))
+            batch = cursor.fetchone()
+            if batch is not None:
+                user_id, total, approved, rejected = batch
+                cursor.execute("DELETE FROM batch_predictions WHERE id = %s", (batch_id,))
+                self._bump_user_counters(cursor, user_id, {
+                    'batch_predictions': -1,
+                    'batch_applications': -(total or 0),
+                    'batch_approved': -(approved or 0),
+                    'batch_rejected': -(rejected or 0)
+                })
+            self.connection.commit()
+            cursor.close()
+            return True
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error deleting batch: {e}")
+            return False
+    
+    # ==================== BATCH JOBS ====================
+    
+    BATCH_JOB_FIELDS = ('status', 'rows_processed', 'total_rows', 'batch_id', 'error_message',
+                        'started_at', 'finished_at')
+    
+    @pooled
+    def create_batch_job(self, user_id, job_data):
+        """Queue a batch scoring job for an uploaded file"""
+        if not self.ensure_connection():
+            return None
+            
+        try:
+            cursor = self.connection.cursor()
+            query = """
+                INSERT INTO batch_jobs (
+                    user_id, batch_name, file_name, file_path, file_size_kb, total_rows
+                ) VALUES (%s, %s, %s, %s, %s, %s)
+            """
+            cursor.execute(query, (
+                user_id,
+                job_data.get('batch_name'),
+                job_data.get('filename'),
+                job_data.get('file_path'),
+                job_data.get('file_size_kb'),
+                job_data.get('total_rows')
+            ))
+            self.connection.commit()
+            job_id = cursor.lastrowid
+            cursor.close()
+            return job_id
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error creating batch job: {e}")
+            return None
+    
+    @pooled
+    def get_batch_job(self, job_id):
+        """Get batch job by ID"""
+        if not self.ensure_connection():
+            return None
+            
+        try:
+            cursor = self.connection.cursor(dictionary=True)
+            cursor.execute("SELECT * FROM batch_jobs WHERE id = %s", (job_id,))
+            job = cursor.fetchone()
+            cursor.close()
+            return job
+        except Error as e:
+            print(f"Error fetching batch job: {e}")
+            return None
+    
+    @pooled
+    def get_user_batch_jobs(self, user_id, limit=20):
+        """Get user's batch jobs, newest first"""
+        if not self.ensure_connection():
+            return []
+            
+        try:
+            cursor = self.connection.cursor(dictionary=True)
+            query = """
+                SELECT * FROM batch_jobs
+                WHERE user_id = %s
+                ORDER BY id DESC
+                LIMIT %s
+            """
+            cursor.execute(query, (user_id, limit))
+            jobs = cursor.fetchall()
+            cursor.close()
+            return jobs
+        except Error as e:
+            print(f"Error fetching batch jobs: {e}")
+            return []
+    
+    @pooled
+    def claim_next_batch_job(self, claim_token):
+        """Mark the oldest queued job as running under claim_token and return it, or None.
+        
+        The conditional UPDATE lets several workers or processes poll the
+        same table without two of them claiming one job.
+        """
+        if not self.ensure_connection():
+            return None
+            
+        try:
+            cursor = self.connection.cursor(dictionary=True)
+            while True:
+                cursor.execute("SELECT id FROM batch_jobs WHERE status = 'queued' ORDER BY id LIMIT 1")
+                row = cursor.fetchone()
+                self.connection.commit()
+                if not row:
+                    cursor.close()
+                    return None
+                
+                cursor.execute("""
+                    UPDATE batch_jobs
+                    SET status = 'running', rows_processed = 0, started_at = %s, finished_at = NULL,
+                        claim_token = %s, heartbeat_at = NOW()
+                    WHERE id = %s AND status = 'queued'
+                """, (datetime.now(), claim_token, row['id']))
+                claimed = cursor.rowcount == 1
+                self.connection.commit()
+                if claimed:
+                    cursor.execute("SELECT * FROM batch_jobs WHERE id = %s", (row['id'],))
+                    job = cursor.fetchone()
+                    cursor.close()
+                    return job
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error claiming batch job: {e}")
+            return None
+    
+    @pooled
+    def update_batch_job(self, job_id, updates):
+        """Update job status/progress"""
+        if not self.ensure_connection():
+            return False
+            
+        try:
+            cursor = self.connection.cursor()
+            fields = [field for field in updates if field in self.BATCH_JOB_FIELDS]
+            if not fields:
+                return False
+            
+            query = f"UPDATE batch_jobs SET {', '.join(f'{field} = %s' for field in fields)} WHERE id = %s"
+            cursor.execute(query, tuple(updates[field] for field in fields) + (job_id,))
+            self.connection.commit()
+            cursor.close()
+            return True
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error updating batch job: {e}")
+            return False
+    
+    @pooled
+    def heartbeat_batch_job(self, job_id, claim_token):
+        """Refresh a running job's heartbeat; False once the claim is lost (requeued), None on error"""
+        if not self.ensure_connection():
+            return None
+            
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("""
+                UPDATE batch_jobs SET heartbeat_at = NOW()
+                WHERE id = %s AND status = 'running' AND claim_token = %s
+            """, (job_id, claim_token))
+            held = cursor.rowcount == 1
+            if not held:
+                # rowcount is 0 as well when heartbeat_at already holds this second
+                cursor.execute("SELECT 1 FROM batch_jobs WHERE id = %s AND status = 'running' AND claim_token = %s",
+                               (job_id, claim_token))
+                held = cursor.fetchone() is not None
+            self.connection.commit()
+            cursor.close()
+            return held
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error refreshing batch job heartbeat: {e}")
+            return None
+    
+    @pooled
+    def requeue_stale_batch_jobs(self, stale_seconds):
+        """Put running jobs whose heartbeat is older than stale_seconds back in the queue"""
+        if not self.ensure_connection():
+            return 0
+            
+        try:
+            cursor = self.connection.cursor()
+            query = """
+                UPDATE batch_jobs SET status = 'queued', claim_token = NULL
+                WHERE status = 'running'
+                  AND COALESCE(heartbeat_at, updated_at) < NOW() - INTERVAL %s SECOND
+            """
+            cursor.execute(query, (int(stale_seconds),))
+            requeued = cursor.rowcount
+            self.connection.commit()
+            cursor.close()
+            return requeued
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error requeuing batch jobs: {e}")
+            return 0
+    
     #  STATISTICS & ANALYTICS 
     
+    def _bump_user_counters(self, cursor, user_id, deltas):
+        """Add deltas to a user's counters inside the caller's transaction"""
+        cursor.execute(*user_counter_upsert(user_id, deltas))
+    
+    @pooled
+    def get_user_counters(self, user_id):
+        """Running prediction totals for one user (zeros if they have none)"""
+        if not self.ensure_connection():
+            return None
+            
+        try:
+            cursor = self.connection.cursor(dictionary=True)
+            query = f"""
+                SELECT {', '.join(USER_COUNTER_COLUMNS)} FROM user_prediction_counters 
+                WHERE user_id = %s
+            """
+            cursor.execute(query, (user_id,))
+            counters = cursor.fetchone()
+            cursor.close()
+            return counters or dict.fromkeys(USER_COUNTER_COLUMNS, 0)
+        except Error as e:
+            print(f"Error fetching user counters: {e}")
+            return None
+    
+    @pooled
+    def rebuild_user_counters(self):
+        """Recompute every user's counters from the prediction tables.
+        
+        Runs as one transaction, so readers see either the old or the new
+        totals; predictions saved meanwhile wait for it to commit.
+        Returns the number of users with history, or None on error.
+        """
+        if not self.ensure_connection():
+            return None
+            
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("DELETE FROM user_prediction_counters")
+            query = f"""
+                INSERT INTO user_prediction_counters (user_id, {', '.join(USER_COUNTER_COLUMNS)})
+                SELECT u.id,
+                    COALESCE(sp.total, 0), COALESCE(sp.approved, 0), COALESCE(sp.rejected, 0),
+                    COALESCE(bp.total, 0), COALESCE(bp.applications, 0),
+                    COALESCE(bp.approved, 0), COALESCE(bp.rejected, 0)
+                FROM users u
+                LEFT JOIN (
+                    SELECT user_id, COUNT(*) AS total,
+                        SUM(CASE WHEN prediction = 1 THEN 1 ELSE 0 END) AS approved,
+                        SUM(CASE WHEN prediction = 1 THEN 0 ELSE 1 END) AS rejected
+                    FROM single_predictions GROUP BY user_id
+                ) sp ON sp.user_id = u.id
+                LEFT JOIN (
+                    SELECT user_id, COUNT(*) AS total, SUM(total_applications) AS applications,
+                        SUM(approved_applications) AS approved, SUM(rejected_applications) AS rejected
+                    FROM batch_predictions GROUP BY user_id
+                ) bp ON bp.user_id = u.id
+                WHERE sp.user_id IS NOT NULL OR bp.user_id IS NOT NULL
+            """
+            cursor.execute(query)
+            rebuilt = cursor.rowcount
+            self.connection.commit()
+            cursor.close()
+            return rebuilt
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error rebuilding user counters: {e}")
+            return None
+    
+    @pooled
     def get_user_statistics(self, user_id):
-        """Get comprehensive user statistics"""
+        """Get comprehensive user statistics (user_statistics reads the counters table)"""
         if not self.ensure_connection():
             return None
             
@@ -516,8 +1400,51 @@ class Database:
             print(f"Error fetching user statistics: {e}")
             return None
     
+    def _bump_credit_bands(self, cursor, counts):
+        """Add {band: [approved, rejected]} to the band rollup inside the caller's transaction"""
+        if counts:
+            cursor.executemany(CREDIT_BAND_UPSERT, credit_band_rows(counts))
+    
+    @pooled
+    def rebuild_credit_bands(self):
+        """Recompute the credit score band rollup from every stored prediction.
+        
+        Scans single_predictions and batch_prediction_details once, in one
+        transaction. Returns the number of non-empty bands, or None on error.
+        """
+        if not self.ensure_connection():
+            return None
+            
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("DELETE FROM credit_score_band_counts")
+            query = f"""
+                INSERT INTO credit_score_band_counts (band, credit_score_range, approved, rejected)
+                SELECT {_credit_band_case('credit_score')} AS band,
+                    -- One label per band; MIN() keeps ONLY_FULL_GROUP_BY satisfied
+                    MIN({_credit_band_case('credit_score', 1)}),
+                    SUM(CASE WHEN prediction = 1 THEN 1 ELSE 0 END),
+                    SUM(CASE WHEN prediction = 0 THEN 1 ELSE 0 END)
+                FROM (
+                    SELECT credit_score, prediction FROM single_predictions
+                    UNION ALL
+                    SELECT credit_score, prediction FROM batch_prediction_details
+                ) combined
+                GROUP BY band
+            """
+            cursor.execute(query)
+            rebuilt = cursor.rowcount
+            self.connection.commit()
+            cursor.close()
+            return rebuilt
+        except Error as e:
+            self.connection.rollback()
+            print(f"Error rebuilding credit score bands: {e}")
+            return None
+    
+    @pooled
     def get_approval_by_credit_score(self):
-        """Get approval rates grouped by credit score ranges"""
+        """Get approval rates grouped by credit score ranges (read from the band rollup)"""
         if not self.ensure_connection():
             return []
             
@@ -532,18 +1459,23 @@ class Database:
             print(f"Error fetching credit score analysis: {e}")
             return []
     
-    def get_recent_predictions_summary(self, limit=50):
-        """Get recent predictions summary from view"""
+    @pooled
+    def get_recent_predictions_summary(self, limit=50, before=None, user_id=None):
+        """Most recent single predictions and batches, newest first.
+        
+        Replaces a scan of the recent_predictions_summary view: each source
+        is read backwards through its date index (per-user index when
+        user_id is given) and cut to `limit` rows before the two are merged,
+        so the cost follows the page size rather than the table sizes.
+        before is the (prediction_date, prediction_type, id) of the last row
+        already returned; on equal timestamps singles come before batches.
+        """
         if not self.ensure_connection():
             return []
             
         try:
             cursor = self.connection.cursor(dictionary=True)
-            query = """
-                SELECT * FROM recent_predictions_summary 
-                LIMIT %s
-            """
-            cursor.execute(query, (limit,))
+            cursor.execute(*recent_activity_query(limit, before, user_id))
             results = cursor.fetchall()
             cursor.close()
             return results
@@ -551,6 +1483,7 @@ class Database:
             print(f"Error fetching recent predictions: {e}")
             return []
     
+    @pooled
     def get_all_users_statistics(self):
         """Get statistics for all users"""
         if not self.ensure_connection():
@@ -569,6 +1502,7 @@ class Database:
     
     # ==================== ADMIN FUNCTIONS ====================
     
+    @pooled
     def get_all_users(self, include_inactive=False):
         """Get all users (admin function)"""
         if not self.ensure_connection():
@@ -589,6 +1523,7 @@ class Database:
             print(f"Error fetching all users: {e}")
             return []
     
+    @pooled
     def deactivate_user(self, user_id):
         """Deactivate a user account"""
         if not self.ensure_connection():
@@ -599,6 +1534,7 @@ class Database:
             query = "UPDATE users SET is_active = FALSE WHERE id = %s"
             cursor.execute(query, (user_id,))
             self.connection.commit()
+            self.invalidate_user(user_id)
             cursor.close()
             return True
         except Error as e:
@@ -606,6 +1542,7 @@ class Database:
             print(f"Error deactivating user: {e}")
             return False
     
+    @pooled
     def activate_user(self, user_id):
         """Activate a user account"""
         if not self.ensure_connection():
@@ -616,6 +1553,7 @@ class Database:
             query = "UPDATE users SET is_active = TRUE WHERE id = %s"
             cursor.execute(query, (user_id,))
             self.connection.commit()
+            self.invalidate_user(user_id)
             cursor.close()
             return True
         except Error as e:
@@ -625,10 +1563,30 @@ class Database:
 
 
 if __name__ == "__main__":
-    print("Testing database connection...")
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Test the database connection or run maintenance")
+    parser.add_argument('command', nargs='?', choices=['test', 'rebuild-user-counters', 'rebuild-credit-bands'],
+                        default='test')
+    args = parser.parse_args()
+    
     db = Database()
+    if args.command == 'rebuild-user-counters':
+        rebuilt = db.rebuild_user_counters()
+        if rebuilt is None:
+            raise SystemExit(1)
+        print(f" Rebuilt prediction counters for {rebuilt} users")
+        raise SystemExit(0)
+    if args.command == 'rebuild-credit-bands':
+        rebuilt = db.rebuild_credit_bands()
+        if rebuilt is None:
+            raise SystemExit(1)
+        print(f" Rebuilt {rebuilt} credit score bands")
+        raise SystemExit(0)
+    
+    print("Testing database connection...")
     
-    if db.connection:
+    if db.ensure_connection():
         print(" Database connected!")
         
         # Test getting statistics
@@ -0,0 +1,184 @@
+"""Thread-safe MySQL connection pool with checkout timeout and metrics.
+
+Connections are opened on demand up to `size`. A checkout waits at most
+`timeout` seconds for one to be returned, and a connection that sat idle
+for longer than `validate_idle_seconds` is pinged (and replaced if dead)
+before it is handed out, so busy connections skip the health check.
+"""
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class PoolError(Exception):
+    """Raised when no connection can be checked out"""
+
+
+class ConnectionPool:
+    """Bounded pool of connections made by connect()"""
+
+    def __init__(self, connect, size=10, timeout=5.0, validate_idle_seconds=30.0):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.validate_idle_seconds = validate_idle_seconds
+        self._idle = []  # (connection, returned_at) pairs, most recently returned last
+        self._opened = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._waiters = deque()
+        self._wait_times = deque(maxlen=4096)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connect_errors = 0
+        self.validations = 0
+        self.replaced = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+
+    def _validate(self, connection):
+        self.validations += 1
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except Exception:
+            self.replaced += 1
+            self._discard(connection)
+            return False
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        self._free_slot()
+
+    def _free_slot(self):
+        with self._lock:
+            if self._waiters:
+                # The oldest waiter opens a replacement in this slot
+                self._handoff(None)
+            else:
+                self._opened -= 1
+
+    def _handoff(self, connection):
+        waiter = self._waiters.popleft()
+        waiter['connection'] = connection
+        waiter['ready'] = True
+        waiter['event'].set()
+
+    def acquire(self):
+        """Check out a connection, waiting up to `timeout` seconds.
+
+        Waiters are served first come, first served: a returned connection
+        goes straight to the oldest waiter rather than to whichever thread
+        asks next.
+        """
+        started = time.monotonic()
+        while True:
+            waiter = None
+            with self._lock:
+                if self._closed:
+                    raise PoolError('Connection pool is closed')
+                if self._idle and not self._waiters:
+                    connection, returned_at = self._idle.pop()
+                elif self._opened < self.size:
+                    self._opened += 1
+                    connection, returned_at = None, None
+                else:
+                    waiter = {'event': threading.Event(), 'ready': False, 'connection': None}
+                    self._waiters.append(waiter)
+
+            if waiter is not None:
+                waiter['event'].wait(max(started + self.timeout - time.monotonic(), 0))
+                with self._lock:
+                    if not waiter['ready']:
+                        if waiter in self._waiters:
+                            self._waiters.remove(waiter)
+                        if self._closed:
+                            raise PoolError('Connection pool is closed')
+                        self.timeouts += 1
+                        raise PoolError(f'No database connection free after {self.timeout}s '
+                                        f'({self.size} in use)')
+                connection = waiter['connection']
+                returned_at = time.monotonic()
+
+            if connection is None:
+                try:
+                    connection = self._connect()
+                except Exception as e:
+                    with self._lock:
+                        self.connect_errors += 1
+                    self._free_slot()
+                    raise PoolError(str(e)) from e
+            elif time.monotonic() - returned_at > self.validate_idle_seconds and not self._validate(connection):
+                continue
+
+            with self._lock:
+                self.checkouts += 1
+                self._wait_times.append(time.monotonic() - started)
+                self.in_use += 1
+                self.peak_in_use = max(self.peak_in_use, self.in_use)
+            return connection
+
+    def release(self, connection):
+        """Return a connection; an open transaction is rolled back first"""
+        with self._lock:
+            self.in_use -= 1
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except Exception:
+            self._discard(connection)
+            return
+
+        with self._lock:
+            if self._closed:
+                self._opened -= 1
+            elif self._waiters:
+                self._handoff(connection)
+                return
+            else:
+                self._idle.append((connection, time.monotonic()))
+                return
+        connection.close()
+
+    def close(self):
+        """Close idle connections; checked-out ones close when returned"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+            waiters, self._waiters = self._waiters, deque()
+        for waiter in waiters:
+            waiter['event'].set()
+        for connection, _ in idle:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def get_metrics(self):
+        """Size, utilization and checkout wait times"""
+        with self._lock:
+            in_use = self.in_use
+            waits = np.asarray(self._wait_times) * 1000
+            return {
+                'size': self.size,
+                'open': self._opened,
+                'in_use': in_use,
+                'idle': len(self._idle),
+                'waiting': len(self._waiters),
+                'utilization': round(in_use / self.size, 4) if self.size else 0,
+                'peak_in_use': self.peak_in_use,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'connect_errors': self.connect_errors,
+                'validations': self.validations,
+                'replaced': self.replaced,
+                'wait_p50_ms': round(float(np.percentile(waits, 50)), 3) if waits.size else 0,
+                'wait_p99_ms': round(float(np.percentile(waits, 99)), 3) if waits.size else 0,
+                'wait_max_ms': round(float(waits.max()), 3) if waits.size else 0
+            }
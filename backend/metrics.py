@@ -0,0 +1,369 @@
+"""Request and stage metrics in the Prometheus text format.
+
+Recording is a clock read, a bisect and a few additions under one lock
+(about a microsecond); values are only formatted when /metrics is scraped.
+Counters kept elsewhere (prediction and user caches, unknown categories)
+are read by collectors at scrape time, so they cost nothing per request.
+METRICS_ENABLED=0 turns recording off.
+
+Under serve.py each worker records its own values. A thread in each worker
+writes them to METRICS_DIR/worker-<slot>.json every METRICS_SYNC_SECONDS if
+it served requests since the last write, and /metrics on any worker adds up
+every worker's file. A worker replacing another in its slot starts from
+that file, so the totals do not go backwards when workers are recycled:
+its own metrics load the file's values, and the counters its collectors
+read (which start from zero in every process) are added to the file's.
+"""
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'metrics'))
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; from a JWT decode (tens of microseconds) to a large batch upload
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic count per label combination"""
+
+    kind = 'counter'
+
+    def __init__(self, registry, name, help_text, labels=()):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, *label_values, amount=1):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values):
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def load(self, series):
+        with self._lock:
+            for key, value in series:
+                key = tuple(key)
+                self._values[key] = self._values.get(key, 0) + value
+
+
+class _Timer:
+    __slots__ = ('histogram', 'label_values', 'started')
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+        return False
+
+
+class Histogram:
+    """Observations counted into fixed buckets per label combination"""
+
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last is +Inf), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value, *label_values):
+        if not self.registry.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *label_values):
+        """Context manager observing the seconds its block takes"""
+        return _Timer(self, label_values)
+
+    def get(self, *label_values):
+        """(count, sum) of one series"""
+        with self._lock:
+            series = self._values.get(label_values)
+            return (series[2], series[1]) if series else (0, 0.0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), [list(series[0]), series[1], series[2]]] for key, series in self._values.items()]
+
+    def load(self, series_list):
+        with self._lock:
+            for key, (buckets, total, count) in series_list:
+                key = tuple(key)
+                series = self._values.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+                series[0] = [a + b for a, b in zip(series[0], buckets)]
+                series[1] += total
+                series[2] += count
+
+
+class Registry:
+    """The metrics of one process, plus collectors read at scrape time"""
+
+    def __init__(self, enabled=True, sync_seconds=5.0):
+        self.enabled = enabled
+        self.sync_seconds = sync_seconds
+        self._metrics = {}
+        self._collectors = []
+        self._share_path = None
+        self._share_dir = None
+        # Collected counter name -> {label values: total of the slot's earlier workers}
+        self._carried = {}
+        self._changed = False
+        self._sync_lock = threading.Lock()
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+
+    def counter(self, name, help_text, labels=()):
+        return Counter(self, name, help_text, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return Histogram(self, name, help_text, labels, buckets)
+
+    def add_collector(self, collect):
+        """collect() returns [(name, 'counter' or 'gauge', help, label names, [(label values, value)])]"""
+        self._collectors.append(collect)
+
+    def snapshot(self):
+        """JSON-serialisable values of every metric and collector"""
+        metrics = {}
+        for metric in self._metrics.values():
+            entry = {'type': metric.kind, 'help': metric.help, 'labels': list(metric.labels),
+                     'series': metric.snapshot()}
+            if metric.kind == 'histogram':
+                entry['buckets'] = list(metric.buckets)
+            metrics[metric.name] = entry
+        for collect in self._collectors:
+            try:
+                for name, kind, help_text, labels, samples in collect():
+                    series = {tuple(values): value for values, value in samples}
+                    for key, value in self._carried.get(name, {}).items():
+                        series[key] = series.get(key, 0) + value
+                    metrics[name] = {'type': kind, 'help': help_text, 'labels': list(labels),
+                                     'series': [[list(key), value] for key, value in series.items()],
+                                     'collected': True}
+            except Exception as e:
+                print(f" Metrics collector error: {e}")
+        return metrics
+
+    # ---- sharing between pre-forked workers ----
+
+    def share(self, worker_id, directory=METRICS_DIR):
+        """Record this process as worker `worker_id`, continuing from its slot's last values"""
+        os.makedirs(directory, exist_ok=True)
+        self._share_dir = directory
+        self._share_path = os.path.join(directory, f'worker-{worker_id}.json')
+        previous = self._read(self._share_path)
+        # Drop what was recorded before the fork (the parent's warm-up)
+        for metric in self._metrics.values():
+            metric.clear()
+        self._carried = {}
+        for name, entry in (previous or {}).items():
+            metric = self._metrics.get(name)
+            if entry.get('collected'):
+                # Gauges describe this process only; counters carry on
+                if entry['type'] == 'counter':
+                    self._carried[name] = {tuple(key): value for key, value in entry['series']}
+            elif metric is not None:
+                metric.load(entry['series'])
+        self.sync()
+        threading.Thread(target=self._sync_loop, name='metrics-sync', daemon=True).start()
+
+    def mark_changed(self):
+        self._changed = True
+
+    def _sync_loop(self):
+        while True:
+            time.sleep(self.sync_seconds)
+            if self._changed:
+                self.sync()
+
+    def sync(self):
+        """Write this worker's values to its file (when shared)"""
+        if self._share_path is None:
+            return
+        with self._sync_lock:
+            self._changed = False
+            temp_path = f'{self._share_path}.tmp'
+            try:
+                with open(temp_path, 'w') as f:
+                    json.dump(self.snapshot(), f)
+                os.replace(temp_path, self._share_path)
+            except Exception as e:
+                print(f" Metrics sync error: {e}")
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    # ---- exposition ----
+
+    def render(self):
+        """Every metric in the Prometheus text format, summed over workers when shared"""
+        if self._share_path is None:
+            snapshots = [self.snapshot()]
+        else:
+            self.sync()
+            snapshots = [s for s in map(self._read, sorted(glob.glob(os.path.join(self._share_dir, 'worker-*.json')))) if s]
+
+        merged = {}
+        for snapshot in snapshots:
+            for name, entry in snapshot.items():
+                target = merged.setdefault(name, dict(entry, series={}))
+                for key, value in entry['series']:
+                    key = tuple(key)
+                    if entry['type'] == 'histogram':
+                        current = target['series'].get(key)
+                        target['series'][key] = value if current is None else [
+                            [a + b for a, b in zip(current[0], value[0])], current[1] + value[1], current[2] + value[2]]
+                    else:
+                        target['series'][key] = target['series'].get(key, 0) + value
+
+        lines = []
+        for name, entry in merged.items():
+            lines.append(f'# HELP {name} {entry["help"]}')
+            lines.append(f'# TYPE {name} {entry["type"]}')
+            labels = entry['labels']
+            for key, value in sorted(entry['series'].items()):
+                if entry['type'] != 'histogram':
+                    lines.append(f'{name}{_format_labels(labels, key)} {_format_value(value)}')
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(list(entry['buckets']) + [float('inf')], counts):
+                    cumulative += bucket_count
+                    le = 'le="' + _format_value(bound) + '"'
+                    lines.append(f'{name}_bucket{_format_labels(labels, key, le)} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels, key)} {_format_value(total)}')
+                lines.append(f'{name}_count{_format_labels(labels, key)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def clear_shared(directory=METRICS_DIR):
+    """Forget the worker files of a previous server run"""
+    for path in glob.glob(os.path.join(directory, 'worker-*.json*')):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+REGISTRY = Registry(enabled=os.environ.get('METRICS_ENABLED', '1') == '1',
+                    sync_seconds=float(os.environ.get('METRICS_SYNC_SECONDS', 5)))
+
+# Stages: jwt_decode, user_lookup, validation, csv_read, preprocessing, inference, db_write, serialization
+STAGE_SECONDS = REGISTRY.histogram('loan_api_stage_seconds', 'Seconds spent in each stage of request handling',
+                                   ['stage'])
+REQUEST_SECONDS = REGISTRY.histogram('loan_api_request_seconds', 'Seconds from routing to response, per endpoint',
+                                     ['method', 'endpoint'])
+REQUESTS = REGISTRY.counter('loan_api_requests_total', 'Requests answered', ['method', 'endpoint', 'status'])
+ERRORS = REGISTRY.counter('loan_api_errors_total', 'Requests answered with a 4xx or 5xx status',
+                          ['endpoint', 'status'])
+PREDICTIONS = REGISTRY.counter('loan_api_predictions_total', 'Applications scored, by source and outcome',
+                               ['source', 'outcome'])
+
+
+def record_request(method, endpoint, status, seconds):
+    """Count one answered request"""
+    if not REGISTRY.enabled:
+        return
+    REQUEST_SECONDS.observe(seconds, method, endpoint)
+    REQUESTS.inc(method, endpoint, str(status))
+    if status >= 400:
+        ERRORS.inc(endpoint, str(status))
+    REGISTRY.mark_changed()
+
+
+def serving_collector(models, db):
+    """Collector for the model's and the database's own counters"""
+    def collect():
+        predictor = models.current()
+        model_metrics = predictor.get_metrics()
+        cache = model_metrics['cache']
+        user_cache = db.get_user_cache_metrics()
+        pool = db.get_pool_metrics()
+        return [
+            ('loan_api_unknown_categories_total', 'counter',
+             'Categorical values not seen in training, by feature (current model)', ['feature'],
+             [((feature,), count) for feature, count in model_metrics['unknown_categories'].items()]),
+            ('loan_api_prediction_cache_hits_total', 'counter', 'Prediction cache hits (current model)', [],
+             [((), cache['hits'])]),
+            ('loan_api_prediction_cache_misses_total', 'counter', 'Prediction cache misses (current model)', [],
+             [((), cache['misses'])]),
+            ('loan_api_user_cache_hits_total', 'counter', 'Authenticated user cache hits', [],
+             [((), user_cache['hits'])]),
+            ('loan_api_user_cache_misses_total', 'counter', 'Authenticated user cache misses', [],
+             [((), user_cache['misses'])]),
+            ('loan_api_db_connections_in_use', 'gauge', 'Database connections checked out', [],
+             [((), pool['in_use'])]),
+            ('loan_api_model_info', 'gauge', 'Processes serving each model version', ['version', 'engine'],
+             [((predictor.model_version, predictor.engine), 1)])
+        ]
+    return collect
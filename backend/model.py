@@ -1,115 +1,465 @@
 import joblib
+import hashlib
+import os
+import threading
 import pandas as pd
 import numpy as np
+from tree_engine import TreeEnsemble
+from cache import TTLCache
+from model_bundle import MODEL_DIR, DEFAULT_BUNDLE_PATH, read_bundle
+from parallel_scoring import ShardedScorer, get_pool
+from metrics import STAGE_SECONDS
+
+# Raw input columns and how they are coerced before encoding
+NUMERIC_FEATURES = {
+    'annual_income': float,
+    'debt_to_income_ratio': float,
+    'credit_score': int,
+    'loan_amount': float,
+    'interest_rate': float
+}
+
+CATEGORICAL_DEFAULTS = {
+    'gender': 'Male',
+    'marital_status': 'Single',
+    'education_level': 'High School',
+    'employment_status': 'Employed',
+    'loan_purpose': 'Other',
+    'grade_subgrade': 'C1'
+}
+
+# Unknown categories are encoded as the first class, as the original LabelEncoder fallback did
+UNKNOWN_CATEGORY_CODE = 0
+
+# Inference engines: the LightGBM library, or the NumPy tree evaluator in tree_engine.py
+ENGINES = ('lightgbm', 'native')
+
+# The native engine beats LightGBM only on single rows (TreeEnsemble.predict_one) and
+# is about 3x slower on anything larger, so larger batches are scored with
+# LightGBM when it is installed (results are identical)
+NATIVE_MAX_ROWS = 1
+
+# Approximate bytes per prediction cache entry (key tuple, probability, LRU bookkeeping),
+# measured with tracemalloc; converts cache_memory_mb into an entry bound
+CACHE_ENTRY_BYTES = 660
+
+# Used when the threshold is not stored with the model; same boundary as LGBMClassifier.predict
+DEFAULT_THRESHOLD = 0.5
+
 
 class LoanPredictionModel:
-    def __init__(self):
+    def __init__(self, engine='lightgbm', cache_memory_mb=16, cache_ttl_seconds=300,
+                 bundle_path=DEFAULT_BUNDLE_PATH, shard_size=50000, defer_booster=False):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}")
+        self.engine = engine
+        self.bundle_path = bundle_path
+        self.ensemble = None
+        self.booster = None
         self.model = None
         self.scaler = None
         self.label_encoders = None
         self.feature_names = None
+        self.threshold = DEFAULT_THRESHOLD
+        self.model_version = None
+        self.model_source = None
+        self.load_error = None
+        self.cache = TTLCache(
+            max_entries=int(cache_memory_mb * 1024 * 1024 // CACHE_ENTRY_BYTES),
+            ttl_seconds=cache_ttl_seconds
+        )
+        self.category_tables = {}
+        self.unknown_category_counts = {}
+        self._bundle_arrays = None
+        self.shard_size = shard_size
+        self._sharded_scorer = None
+        self._booster_unavailable = False
+        # LightGBM's OpenMP threads do not survive fork(); a process that forks
+        # workers leaves the Booster to them (load_booster) and scores with the
+        # NumPy ensemble meanwhile
+        self.defer_booster = defer_booster
+        self._metrics_lock = threading.Lock()
         self.load_model()
     
     def load_model(self):
-        """Load all model files"""
+        """Load the model bundle if present, otherwise the joblib pickles"""
         try:
-            self.model = joblib.load('model_files/model.pkl')
-            self.scaler = joblib.load('model_files/scaler.pkl')
-            self.label_encoders = joblib.load('model_files/label_encoders.pkl')
-            self.feature_names = joblib.load('model_files/feature_names.pkl')
-            # print(f" Best_Model type: {type(self.model).__name__}")
+            if self.bundle_path and os.path.isfile(self.bundle_path):
+                self._load_bundle(self.bundle_path)
+            else:
+                self._load_pickles()
+            self.cache.clear()
+            self.load_error = None
             return True
         except Exception as e:
+            self.load_error = str(e)
             print(f" Error loading model files: {e}")
             return False
     
-    def preprocess_data(self, data):
-        """Preprocess input data for prediction"""
+    def _load_pickles(self):
+        """Load model.pkl, scaler.pkl, label_encoders.pkl and feature_names.pkl"""
+        self.model = None if self.defer_booster else joblib.load(os.path.join(MODEL_DIR, 'model.pkl'))
+        self.scaler = joblib.load(os.path.join(MODEL_DIR, 'scaler.pkl'))
+        self.label_encoders = joblib.load(os.path.join(MODEL_DIR, 'label_encoders.pkl'))
+        self.feature_names = list(joblib.load(os.path.join(MODEL_DIR, 'feature_names.pkl')))
         try:
-            # Convert to DataFrame if dict
-            if isinstance(data, dict):
-                df = pd.DataFrame([data])
+            self.threshold = float(joblib.load(os.path.join(MODEL_DIR, 'threshold.pkl')))
+        except FileNotFoundError:
+            self.threshold = DEFAULT_THRESHOLD
+        with open(os.path.join(MODEL_DIR, 'model.pkl'), 'rb') as f:
+            self.model_version = hashlib.sha256(f.read()).hexdigest()[:12]
+        
+        self.booster = self.model.booster_ if self.model is not None else None
+        self.ensemble = TreeEnsemble.from_booster(self.booster) if self.engine == 'native' and self.booster else None
+        self._bundle_arrays = None
+        self.model_source = 'pickles'
+        self.compile_preprocessing(
+            {col: encoder.classes_ for col, encoder in self.label_encoders.items()},
+            self.scaler.mean_,
+            self.scaler.scale_
+        )
+    
+    def _load_bundle(self, path):
+        """Map a model bundle written by model_bundle.py"""
+        header, arrays = read_bundle(path)
+        self.feature_names = list(header['feature_names'])
+        self.threshold = float(header.get('threshold', DEFAULT_THRESHOLD))
+        self.model_version = header['model_version']
+        self.scaler = None
+        self.label_encoders = None
+        
+        # Tree arrays stay memory-mapped; the LightGBM model is only parsed when used
+        self.ensemble = TreeEnsemble(
+            max_depth=header['max_depth'],
+            sigmoid=header['sigmoid'],
+            **{name: arrays[name] for name in TreeEnsemble.ARRAYS}
+        )
+        self._bundle_arrays = arrays
+        self.booster = None
+        self.model = None
+        if self.engine == 'lightgbm' and self.defer_booster:
+            # Importing is fork-safe; this shares the library's modules with the workers
+            import lightgbm  # noqa: F401
+        elif self.engine == 'lightgbm':
+            self._load_bundled_booster()
+        self.model_source = path
+        self.compile_preprocessing(header['categories'], arrays['scale_mean'], arrays['scale_scale'])
+    
+    def _load_bundled_booster(self):
+        import lightgbm
+        self.booster = lightgbm.Booster(model_str=self._lightgbm_model_text())
+        self.model = self.booster
+    
+    def _lightgbm_model_text(self):
+        """The LightGBM model as text (what Booster(model_str=...) takes), or None"""
+        if self._bundle_arrays is not None:
+            return self._bundle_arrays['lightgbm_model'].tobytes().decode('utf-8')
+        if self.model_source == 'pickles':
+            model = self.model or joblib.load(os.path.join(MODEL_DIR, 'model.pkl'))
+            return getattr(model, 'booster_', model).model_to_string()
+        return None
+    
+    def load_booster(self):
+        """Build the LightGBM model left out by defer_booster, in the process that will use it"""
+        if not self.defer_booster:
+            return
+        self.defer_booster = False
+        if self.model_source == 'pickles':
+            self.model = joblib.load(os.path.join(MODEL_DIR, 'model.pkl'))
+            self.booster = self.model.booster_
+            if self.engine == 'native':
+                self.ensemble = TreeEnsemble.from_booster(self.booster)
+        elif self._bundle_arrays is not None and self.engine == 'lightgbm':
+            self._load_bundled_booster()
+    
+    def is_loaded(self):
+        """Whether the selected engine has a model to score with"""
+        if self.engine == 'native' or self.defer_booster:
+            return self.ensemble is not None
+        return self.booster is not None
+    
+    def compile_preprocessing(self, categories, scale_mean, scale_scale):
+        """Compile category lists and scaler parameters into lookup tables and arrays"""
+        self.category_tables = {
+            col: {str(label): code for code, label in enumerate(classes)}
+            for col, classes in categories.items()
+        }
+        self.category_classes = {
+            col: np.asarray(classes, dtype=str)
+            for col, classes in categories.items()
+        }
+        self.unknown_category_counts = {col: 0 for col in self.category_tables}
+        self._scale_mean = np.asarray(scale_mean, dtype=np.float64)
+        self._scale_scale = np.asarray(scale_scale, dtype=np.float64)
+        
+        # (feature, lookup table or None) in model column order
+        self._feature_plan = [(name, self.category_tables.get(name)) for name in self.feature_names]
+    
+    def _count_unknown(self, col, count):
+        with self._metrics_lock:
+            self.unknown_category_counts[col] += count
+    
+    def get_metrics(self):
+        """Preprocessing and prediction cache counters"""
+        with self._metrics_lock:
+            unknown_categories = dict(self.unknown_category_counts)
+        return {
+            'model_version': self.model_version,
+            'model_source': self.model_source,
+            'unknown_categories': unknown_categories,
+            'cache': self.cache.get_metrics()
+        }
+    
+    def _encode_record(self, data):
+        """Encode one applicant dict into a 1 x n_features matrix"""
+        row = []
+        for name, table in self._feature_plan:
+            if name not in data:
+                row.append(0.0)
+            elif table is None:
+                row.append(float(data[name]))
             else:
-                df = data.copy()
-            
-            # Encode categorical variables
-            for col, encoder in self.label_encoders.items():
-                if col in df.columns:
-                    try:
-                        df[col] = encoder.transform(df[col].astype(str))
-                    except ValueError as e:
-                        print(f" Warning: Unknown category in {col}, using default")
-                        # Handle unknown categories by using the first class
-                        df[col] = 0
-            
-            # Ensure all features are present in correct order
-            for feature in self.feature_names:
-                if feature not in df.columns:
-                    df[feature] = 0
-            
-            # Reorder columns to match training
-            df = df[self.feature_names]
-            
-            # Scale features
-            df_scaled = self.scaler.transform(df)
+                code = table.get(str(data[name]))
+                if code is None:
+                    self._count_unknown(name, 1)
+                    code = UNKNOWN_CATEGORY_CODE
+                row.append(code)
+        
+        return np.array(row, dtype=np.float64).reshape(1, -1)
+    
+    def _encode_frame(self, df):
+        """Encode a DataFrame into an n x n_features matrix"""
+        X = np.zeros((len(df), len(self._feature_plan)), dtype=np.float64)
+        
+        for j, (name, table) in enumerate(self._feature_plan):
+            if name not in df.columns:
+                continue
             
-            return df_scaled
+            if table is None:
+                X[:, j] = df[name].to_numpy(dtype=np.float64)
+                continue
             
+            codes = pd.Categorical(df[name].astype(str), categories=self.category_classes[name]).codes
+            unknown = codes < 0
+            unknown_count = int(np.count_nonzero(unknown))
+            if unknown_count:
+                self._count_unknown(name, unknown_count)
+                codes = np.where(unknown, UNKNOWN_CATEGORY_CODE, codes)
+            X[:, j] = codes
+        
+        return X
+    
+    def encode(self, data):
+        """Encode a dict or DataFrame into unscaled model features"""
+        if isinstance(data, dict):
+            return self._encode_record(data)
+        return self._encode_frame(data)
+    
+    def scale(self, X):
+        """Same arithmetic as StandardScaler.transform, in place"""
+        X -= self._scale_mean
+        X /= self._scale_scale
+        return X
+    
+    def preprocess_data(self, data):
+        """Preprocess input data for prediction"""
+        try:
+            return self.scale(self.encode(data))
         except Exception as e:
             print(f" Preprocessing error: {e}")
             raise
     
+    def set_engine(self, engine):
+        """Switch between the lightgbm and native inference engines"""
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}")
+        if engine == 'native' and self.ensemble is None:
+            self.ensemble = TreeEnsemble.from_booster(self.booster)
+        if engine == 'lightgbm' and self.booster is None and not self.defer_booster:
+            self._load_bundled_booster()
+        self.engine = engine
+    
+    def get_sharded_scorer(self):
+        """Shards large batches across the process's scoring pool (parallel_scoring.start_pool)"""
+        if self._sharded_scorer is None:
+            with self._metrics_lock:
+                if self._sharded_scorer is None:
+                    # Workers build a single-threaded Booster from the model text, or use the ensemble
+                    model = self._lightgbm_model_text()
+                    if model is None:
+                        model = self.ensemble if self.ensemble is not None else TreeEnsemble.from_booster(self.booster)
+                    self._sharded_scorer = ShardedScorer(
+                        self.model_version, model,
+                        local=lambda X: self.score(X)[1], shard_size=self.shard_size
+                    )
+        return self._sharded_scorer
+    
+    def close(self):
+        """Stop sharding batches; the model can still score in-process"""
+        if self._sharded_scorer is not None:
+            self._sharded_scorer.close()
+    
+    def decide(self, probabilities):
+        """Approval decisions from probabilities and the approval threshold"""
+        return (probabilities >= self.threshold).astype(np.int64)
+    
+    def _has_batch_booster(self):
+        """Whether a LightGBM Booster is available for native-engine batches over NATIVE_MAX_ROWS"""
+        if self.booster is None and self._bundle_arrays is not None and not self._booster_unavailable:
+            if self.defer_booster:
+                return False
+            with self._metrics_lock:
+                if self.booster is None and not self._booster_unavailable:
+                    try:
+                        self._load_bundled_booster()
+                    except Exception as e:
+                        self._booster_unavailable = True
+                        print(f" LightGBM unavailable, scoring large batches natively: {e}")
+        return self.booster is not None
+    
+    def score(self, X):
+        """Evaluate the classifier once on scaled rows"""
+        if self.defer_booster or (self.engine == 'native' and (len(X) <= NATIVE_MAX_ROWS or not self._has_batch_booster())):
+            probabilities = self.ensemble.predict_proba(X)[:, 1]
+        else:
+            # Booster.predict gives the positive-class probability without the sklearn wrapper
+            probabilities = self.booster.predict(X)
+        return self.decide(probabilities), probabilities
+    
+    def predict_encoded(self, X):
+        """Score unscaled encoded rows, serving repeated applicants from the cache"""
+        if self.cache.max_entries <= 0:
+            return self.score(self.scale(X))
+        
+        # The encoded vector is the canonical form: 700 and '700.0' or unknown
+        # categories and the default class share one key
+        keys = [(self.model_version, row) for row in map(tuple, X.tolist())]
+        cached = self.cache.get_many(keys, default=np.nan)
+        probabilities = np.array(cached, dtype=np.float64)
+        missing = np.flatnonzero(np.isnan(probabilities))
+        
+        if missing.size:
+            _, scored = self.score(self.scale(X[missing]))
+            probabilities[missing] = scored
+            self.cache.put_many(zip([keys[i] for i in missing], scored.tolist()))
+        
+        return self.decide(probabilities), probabilities
+    
     def predict_single(self, data):
         """Make prediction for single application"""
         try:
-            X = self.preprocess_data(data)
-            prediction = int(self.model.predict(X)[0])
-            probability = float(self.model.predict_proba(X)[0][1])
-            
-            return {
-                'prediction': prediction,
-                'probability': probability,
-                'status': 'Approved' if prediction == 1 else 'Rejected'
-            }
+            with STAGE_SECONDS.time('preprocessing'):
+                X = self.encode(data)
+            with STAGE_SECONDS.time('inference'):
+                predictions, probabilities = self.predict_encoded(X)
+            return self.format_result(predictions[0], probabilities[0])
         except Exception as e:
             print(f" Prediction error: {e}")
             raise
     
-    def predict_batch(self, dataframe):
-        """Make predictions for batch of applications"""
+    def format_result(self, prediction, probability):
+        """Response dict for one scored application"""
+        prediction = int(prediction)
+        return {
+            'prediction': prediction,
+            'probability': float(probability),
+            'status': 'Approved' if prediction == 1 else 'Rejected',
+            'threshold': self.threshold
+        }
+    
+    def prepare_batch(self, dataframe):
+        """Coerce raw batch columns into model features, masking rows with invalid values"""
+        total = len(dataframe)
+        features = pd.DataFrame(index=pd.RangeIndex(total))
+        valid = np.ones(total, dtype=bool)
+        errors = np.full(total, None, dtype=object)
+        
+        for col, dtype in NUMERIC_FEATURES.items():
+            if col not in dataframe.columns:
+                features[col] = np.zeros(total, dtype=dtype)
+                continue
+            
+            raw = dataframe[col].reset_index(drop=True)
+            values = pd.to_numeric(raw, errors='coerce')
+            bad = values.isna().to_numpy()
+            
+            # Report only the first failing column of each row
+            first_bad = bad & valid
+            if first_bad.any():
+                errors[first_bad] = [f"Invalid value for {col}: {value!r}" for value in raw[first_bad]]
+            valid &= ~bad
+            
+            features[col] = values.fillna(0).to_numpy().astype(dtype)
+        
+        for col, default in CATEGORICAL_DEFAULTS.items():
+            if col in dataframe.columns:
+                features[col] = dataframe[col].astype(str).to_numpy()
+            else:
+                features[col] = default
+        
+        return features, valid, errors
+    
+    def score_batch(self, dataframe):
+        """Vectorized scoring of a whole DataFrame in one model call"""
         try:
-            results = []
+            with STAGE_SECONDS.time('preprocessing'):
+                features, valid, errors = self.prepare_batch(dataframe)
+                X = self.encode(features[valid]) if valid.any() else None
+            total = len(features)
             
-            for idx, row in dataframe.iterrows():
-                try:
-                    X = self.preprocess_data(row.to_dict())
-                    prediction = int(self.model.predict(X)[0])
-                    probability = float(self.model.predict_proba(X)[0][1])
-                    
-                    results.append({
-                        'row_number': idx + 1,
-                        'prediction': prediction,
-                        'probability': probability,
-                        'status': 'Approved' if prediction == 1 else 'Rejected'
-                    })
-                except Exception as e:
-                    results.append({
-                        'row_number': idx + 1,
-                        'error': str(e)
-                    })
+            predictions = np.full(total, -1, dtype=np.int64)
+            probabilities = np.full(total, np.nan)
             
-            return results
+            if X is not None:
+                with STAGE_SECONDS.time('inference'):
+                    if len(X) > self.shard_size and get_pool() is not None:
+                        # Portfolio-sized files: shard across processes, bypassing the cache
+                        scored = self.get_sharded_scorer().predict_proba(self.scale(X))
+                        predictions[valid], probabilities[valid] = self.decide(scored), scored
+                    else:
+                        predictions[valid], probabilities[valid] = self.predict_encoded(X)
+            
+            return {
+                'features': features,
+                'valid': valid,
+                'errors': errors,
+                'prediction': predictions,
+                'probability': probabilities,
+                'threshold': self.threshold
+            }
             
         except Exception as e:
             print(f" Batch prediction error: {e}")
             raise
+    
+    def predict_batch(self, dataframe):
+        """Make predictions for batch of applications"""
+        scores = self.score_batch(dataframe)
+        valid = scores['valid']
+        row_numbers = np.arange(1, len(valid) + 1)
+        
+        scored = pd.DataFrame({
+            'row_number': row_numbers[valid],
+            'prediction': scores['prediction'][valid],
+            'probability': scores['probability'][valid],
+            'status': np.where(scores['prediction'][valid] == 1, 'Approved', 'Rejected'),
+            'threshold': scores['threshold']
+        })
+        
+        results = [None] * len(valid)
+        for i, record in zip(np.flatnonzero(valid), scored.to_dict('records')):
+            results[i] = record
+        for i in np.flatnonzero(~valid):
+            results[i] = {'row_number': int(row_numbers[i]), 'error': scores['errors'][i]}
+        
+        return results
 
 
 # Test the model loading
 if __name__ == "__main__":
     predictor = LoanPredictionModel()
     
-    if predictor.model:
+    if predictor.is_loaded():
         print("\nModel loaded successfully!")
         
         # Example for Testing Model locally
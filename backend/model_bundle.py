@@ -0,0 +1,169 @@
+"""Single-file, memory-mappable model bundle.
+
+Layout: 8-byte magic, 8-byte little-endian header length, a JSON header,
+then every array at a 64-byte aligned offset. The header records the
+model version, approval threshold, feature order, category tables, tree
+metadata, each array's dtype/shape/offset and a SHA-256 of the payload.
+
+Arrays are returned as read-only views of one np.memmap, so every worker
+process mapping the same file shares a single copy in the page cache.
+
+Convert the existing pickles with:
+    python model_bundle.py convert [--output model_files/model.bundle]
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+BUNDLE_MAGIC = b'LOANBNDL'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_files')
+DEFAULT_BUNDLE_PATH = os.path.join(MODEL_DIR, 'model.bundle')
+
+
+class BundleError(Exception):
+    """Raised when a bundle is missing, malformed or fails its checksum"""
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_bundle(path, arrays, metadata):
+    """Write arrays and JSON-serializable metadata to a bundle file"""
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _aligned(offset)
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes
+    payload_size = offset
+
+    payload = bytearray(payload_size)
+    for name, array in arrays.items():
+        start = layout[name]['offset']
+        payload[start:start + array.nbytes] = array.tobytes()
+
+    header = dict(metadata)
+    header.update({
+        'format_version': FORMAT_VERSION,
+        'arrays': layout,
+        'payload_size': payload_size,
+        'checksum': hashlib.sha256(payload).hexdigest()
+    })
+    header_bytes = json.dumps(header).encode('utf-8')
+    # Pad so the payload itself starts on an aligned boundary
+    header_bytes += b' ' * (_aligned(16 + len(header_bytes)) - 16 - len(header_bytes))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(BUNDLE_MAGIC)
+        f.write(len(header_bytes).to_bytes(8, 'little'))
+        f.write(header_bytes)
+        f.write(payload)
+    os.replace(tmp_path, path)
+    return header
+
+
+def read_bundle(path, verify=True):
+    """Map a bundle file; returns (header, {name: read-only array})"""
+    if not os.path.isfile(path):
+        raise BundleError(f"Bundle not found: {path}")
+
+    with open(path, 'rb') as f:
+        if f.read(8) != BUNDLE_MAGIC:
+            raise BundleError(f"Not a model bundle: {path}")
+        header_size = int.from_bytes(f.read(8), 'little')
+        header = json.loads(f.read(header_size))
+
+    if header.get('format_version') != FORMAT_VERSION:
+        raise BundleError(f"Unsupported bundle format version: {header.get('format_version')}")
+
+    payload_offset = 16 + header_size
+    if header['payload_size'] == 0:
+        return header, {}
+
+    payload = np.memmap(path, dtype=np.uint8, mode='r', offset=payload_offset, shape=(header['payload_size'],))
+    if verify and hashlib.sha256(payload).hexdigest() != header['checksum']:
+        raise BundleError(f"Checksum mismatch in bundle: {path}")
+
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        array = np.frombuffer(payload, dtype=dtype, count=count, offset=spec['offset'])
+        arrays[name] = array.reshape(spec['shape'])
+
+    return header, arrays
+
+
+def convert_pickles(model_dir=MODEL_DIR, output=DEFAULT_BUNDLE_PATH, version=None):
+    """Build a bundle from model.pkl, scaler.pkl, label_encoders.pkl, feature_names.pkl"""
+    import joblib
+    from tree_engine import TreeEnsemble
+
+    model_path = os.path.join(model_dir, 'model.pkl')
+    model = joblib.load(model_path)
+    scaler = joblib.load(os.path.join(model_dir, 'scaler.pkl'))
+    label_encoders = joblib.load(os.path.join(model_dir, 'label_encoders.pkl'))
+    feature_names = list(joblib.load(os.path.join(model_dir, 'feature_names.pkl')))
+
+    threshold_path = os.path.join(model_dir, 'threshold.pkl')
+    threshold = float(joblib.load(threshold_path)) if os.path.isfile(threshold_path) else 0.5
+
+    if version is None:
+        with open(model_path, 'rb') as f:
+            version = hashlib.sha256(f.read()).hexdigest()[:12]
+
+    ensemble = TreeEnsemble.from_booster(model)
+    booster = getattr(model, 'booster_', model)
+
+    arrays = dict(ensemble.to_arrays())
+    arrays['scale_mean'] = np.asarray(scaler.mean_, dtype=np.float64)
+    arrays['scale_scale'] = np.asarray(scaler.scale_, dtype=np.float64)
+    # The LightGBM text model, so the lightgbm engine can run from the bundle too
+    arrays['lightgbm_model'] = np.frombuffer(booster.model_to_string().encode('utf-8'), dtype=np.uint8)
+
+    metadata = {
+        'model_version': version,
+        'created_at': datetime.now().isoformat(),
+        'threshold': threshold,
+        'feature_names': feature_names,
+        'categories': {col: [str(c) for c in encoder.classes_] for col, encoder in label_encoders.items()},
+        'max_depth': ensemble.max_depth,
+        'sigmoid': ensemble.sigmoid
+    }
+    return write_bundle(output, arrays, metadata)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert = subparsers.add_parser('convert', help='Build a bundle from the joblib pickles')
+    convert.add_argument('--model-dir', default=MODEL_DIR)
+    convert.add_argument('--output', default=DEFAULT_BUNDLE_PATH)
+    convert.add_argument('--version', default=None)
+
+    inspect = subparsers.add_parser('inspect', help='Print a bundle header and verify its checksum')
+    inspect.add_argument('path', nargs='?', default=DEFAULT_BUNDLE_PATH)
+
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        header = convert_pickles(args.model_dir, args.output, args.version)
+        print(f"Wrote {args.output} (version {header['model_version']}, {header['payload_size']} payload bytes)")
+    else:
+        header, arrays = read_bundle(args.path)
+        header.pop('arrays')
+        print(json.dumps(header, indent=2))
+        print(f"Checksum OK, {len(arrays)} arrays")
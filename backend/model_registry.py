@@ -0,0 +1,216 @@
+"""Versioned model registry and zero-downtime model switching.
+
+Registered bundles live in model_files/registry/<version>/model.bundle and
+the ACTIVE file names the version served at startup. ModelManager loads and
+warms a new version in a background thread, then swaps it in with a single
+reference assignment: requests that already fetched the old predictor keep
+using it until they finish.
+
+Register a bundle with:
+    python model_registry.py register model_files/model.bundle
+"""
+import os
+import re
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from model import LoanPredictionModel
+from model_bundle import MODEL_DIR, DEFAULT_BUNDLE_PATH, read_bundle
+
+REGISTRY_DIR = os.path.join(MODEL_DIR, 'registry')
+ACTIVE_FILE = 'ACTIVE'
+
+# Versions become directory names; '.' and '..' match but are rejected too
+_VERSION_PATTERN = re.compile(r'[\w.-]+')
+
+
+class ModelRegistry:
+    """Model bundles on disk, one directory per version"""
+
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+
+    def bundle_path(self, version):
+        """Bundle file of a version; ValueError for a name that is not a plain directory name"""
+        if not _VERSION_PATTERN.fullmatch(version) or version in ('.', '..'):
+            raise ValueError(f"Invalid model version: {version!r}")
+        return os.path.join(self.root, version, 'model.bundle')
+
+    def has_version(self, version):
+        try:
+            return os.path.isfile(self.bundle_path(version))
+        except ValueError:
+            return False
+
+    def list_versions(self):
+        """Registered versions with their bundle metadata, newest first"""
+        if not os.path.isdir(self.root):
+            return []
+
+        versions = []
+        for version in os.listdir(self.root):
+            if not self.has_version(version):
+                continue
+            header, _ = read_bundle(self.bundle_path(version), verify=False)
+            versions.append({
+                'version': version,
+                'created_at': header.get('created_at'),
+                'threshold': header.get('threshold'),
+                'checksum': header.get('checksum')
+            })
+        return sorted(versions, key=lambda v: v['created_at'] or '', reverse=True)
+
+    def register(self, bundle_path):
+        """Copy a bundle into the registry under its model_version"""
+        header, _ = read_bundle(bundle_path)
+        version = header['model_version']
+        target = self.bundle_path(version)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(bundle_path, f"{target}.tmp")
+        os.replace(f"{target}.tmp", target)
+        return version
+
+    def get_active(self):
+        """Version named in the ACTIVE file, or None"""
+        try:
+            with open(os.path.join(self.root, ACTIVE_FILE)) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return version if version and self.has_version(version) else None
+
+    def set_active(self, version):
+        self.bundle_path(version)  # validates the name before it reaches ACTIVE
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, ACTIVE_FILE)
+        with open(f"{path}.tmp", 'w') as f:
+            f.write(version)
+        os.replace(f"{path}.tmp", path)
+
+
+class ModelManager:
+    """Serves the active LoanPredictionModel and hot-swaps versions"""
+
+    def __init__(self, registry=None, warmup_rows=256, **predictor_kwargs):
+        self.registry = registry or ModelRegistry()
+        self.warmup_rows = warmup_rows
+        self.predictor_kwargs = predictor_kwargs
+        self.loading_version = None
+        self.last_reload = None
+        self._lock = threading.Lock()
+
+        active = self.registry.get_active()
+        bundle_path = self.registry.bundle_path(active) if active else DEFAULT_BUNDLE_PATH
+        self._predictor = LoanPredictionModel(bundle_path=bundle_path, **predictor_kwargs)
+
+    def current(self):
+        """The predictor to use for one whole request"""
+        return self._predictor
+
+    def activate(self, version, wait=False):
+        """Load, warm up and swap in a registered version in the background"""
+        if not self.registry.has_version(version):
+            raise ValueError(f"Unknown model version: {version}")
+
+        with self._lock:
+            if self.loading_version is not None:
+                raise RuntimeError(f"Model version {self.loading_version} is already loading")
+            self.loading_version = version
+
+        thread = threading.Thread(target=self._reload, args=(version,), name=f'model-reload-{version}', daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return thread
+
+    def after_fork(self):
+        """Build the LightGBM models the parent deferred (defer_booster); call once in each forked worker"""
+        self.predictor_kwargs['defer_booster'] = False
+        self._predictor.load_booster()
+
+    def warm_up(self):
+        """Warm up the serving predictor, if it loaded"""
+        predictor = self._predictor
+        if predictor.is_loaded():
+            self._warm_up(predictor)
+
+    def _warm_up(self, predictor):
+        """Run the scoring path once so the first real request pays no lazy setup"""
+        rng = np.random.default_rng(0)
+        X = rng.standard_normal((self.warmup_rows, len(predictor.feature_names)))
+        predictor.score(X)
+        # Single rows have their own path in the native engine
+        predictor.score(X[:1])
+
+    def _reload(self, version):
+        started = time.perf_counter()
+        status = {'version': version, 'started_at': datetime.now().isoformat()}
+        try:
+            predictor = LoanPredictionModel(bundle_path=self.registry.bundle_path(version), **self.predictor_kwargs)
+            if not predictor.is_loaded():
+                raise RuntimeError(predictor.load_error or 'model failed to load')
+            loaded = time.perf_counter()
+
+            self._warm_up(predictor)
+            warmed = time.perf_counter()
+
+            previous_predictor = self._predictor
+            previous = previous_predictor.model_version
+            self._predictor = predictor
+            swapped = time.perf_counter()
+            self.registry.set_active(version)
+            # Waits for shards already submitted by in-flight batches
+            previous_predictor.close()
+
+            status.update({
+                'status': 'active',
+                'previous_version': previous,
+                'load_seconds': round(loaded - started, 4),
+                'warmup_seconds': round(warmed - loaded, 4),
+                'swap_microseconds': round((swapped - warmed) * 1e6, 2)
+            })
+            print(f" Model version {version} activated (was {previous})")
+        except Exception as e:
+            status.update({'status': 'failed', 'error': str(e)})
+            print(f" Model reload error: {e}")
+        finally:
+            status['total_seconds'] = round(time.perf_counter() - started, 4)
+            self.last_reload = status
+            with self._lock:
+                self.loading_version = None
+
+    def get_status(self):
+        """Active version, in-progress load and last reload timings"""
+        return {
+            'active_version': self._predictor.model_version,
+            'model_source': self._predictor.model_source,
+            'loading_version': self.loading_version,
+            'last_reload': self.last_reload,
+            'versions': self.registry.list_versions()
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    register = subparsers.add_parser('register', help='Copy a bundle into the registry')
+    register.add_argument('bundle', nargs='?', default=DEFAULT_BUNDLE_PATH)
+    register.add_argument('--activate', action='store_true', help='Also make it the startup version')
+    subparsers.add_parser('list', help='List registered versions')
+    args = parser.parse_args()
+
+    registry = ModelRegistry()
+    if args.command == 'register':
+        version = registry.register(args.bundle)
+        if args.activate:
+            registry.set_active(version)
+        print(f"Registered version {version}")
+    else:
+        print(json.dumps({'active': registry.get_active(), 'versions': registry.list_versions()}, indent=2))
@@ -0,0 +1,47 @@
+"""Opaque continuation tokens for keyset-paginated history endpoints.
+
+A token is the URL-safe base64 of a small JSON document naming the list it
+belongs to and the sort key of the last row returned; the next page starts
+strictly after that key, so it costs the same however deep it is.
+"""
+import base64
+import json
+from datetime import datetime
+
+OUTCOMES = {'approved': 1, 'rejected': 0}
+
+
+def encode_cursor(kind, *values):
+    """Token for the row whose sort key is `values`"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps({'k': kind, 'v': payload}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(token, kind, *types):
+    """Sort key from a token made by encode_cursor(kind, ...).
+
+    `types` converts each value back (datetime values are parsed from ISO
+    format). Raises ValueError for tokens that are malformed or belong to
+    another list.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+        if payload.get('k') != kind or len(payload['v']) != len(types):
+            raise ValueError
+        return tuple(
+            datetime.fromisoformat(value) if kind_type is datetime else kind_type(value)
+            for kind_type, value in zip(types, payload['v'])
+        )
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise ValueError('Invalid cursor')
+
+
+def parse_outcome(value):
+    """prediction value for ?outcome=approved|rejected, None when absent"""
+    if not value:
+        return None
+    if value not in OUTCOMES:
+        raise ValueError("outcome must be 'approved' or 'rejected'")
+    return OUTCOMES[value]
@@ -0,0 +1,200 @@
+"""Multi-process scoring of large batches.
+
+Rows are split into shards and scored by one pool of worker processes per
+serving process (start_pool). The pool forks every worker at startup,
+before the process builds a LightGBM model or starts a thread: a fork
+copies whatever locks other threads hold at that moment, and LightGBM's
+OpenMP runtime does not survive fork. The pool outlives model versions,
+so a hot swap never forks from the running server.
+
+A ShardedScorer pickles its model once into a shared memory block:
+LightGBM model text, from which a worker builds a single-threaded
+Booster, or a TreeEnsemble when there is none. Tasks carry only the
+model's key and the names of the shared blocks. A worker reads the model
+block the first time it sees a key and keeps the most recent versions
+built. Input and output matrices travel through shared memory as well,
+and shards write their probabilities straight into place, which keeps
+row order. Both engines match LightGBM bit for bit.
+"""
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+# Model versions a worker keeps built (the serving one and the one before a swap)
+WORKER_MODELS = 2
+
+# In each worker: model key -> function from scaled rows to probabilities
+_worker_models = OrderedDict()
+
+
+def _worker_predict(key, model_name):
+    predict = _worker_models.get(key)
+    if predict is None:
+        shared_model = SharedMemory(name=model_name)
+        try:
+            model = pickle.loads(shared_model.buf)
+        finally:
+            shared_model.close()
+        if isinstance(model, str):
+            import lightgbm
+            booster = lightgbm.Booster(model_str=model)
+            # One thread per worker; the pool is the parallelism
+            predict = lambda X: booster.predict(X, num_threads=1)
+        else:
+            predict = lambda X: model.predict_proba(X)[:, 1]
+        _worker_models[key] = predict
+        while len(_worker_models) > WORKER_MODELS:
+            _worker_models.popitem(last=False)
+    return predict
+
+
+def _score_shard(key, model_name, input_name, output_name, shape, start, stop):
+    shared_input = SharedMemory(name=input_name)
+    shared_output = SharedMemory(name=output_name)
+    try:
+        X = np.ndarray(shape, dtype=np.float64, buffer=shared_input.buf)
+        out = np.ndarray((shape[0],), dtype=np.float64, buffer=shared_output.buf)
+        out[start:stop] = _worker_predict(key, model_name)(X[start:stop])
+        del X, out
+    finally:
+        shared_input.close()
+        shared_output.close()
+    return stop - start
+
+
+def _report_pid(pids):
+    pids.put(os.getpid())
+
+
+def _noop():
+    pass
+
+
+class ScoringPool:
+    """Forked worker processes shared by every model version of this process"""
+
+    def __init__(self, workers=None, start_timeout=30):
+        self.workers = workers or os.cpu_count() or 1
+        context = multiprocessing.get_context('fork')
+        pids = context.Queue()
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                             initializer=_report_pid, initargs=(pids,))
+        # A fork-context pool forks all its workers on the first submit: now
+        self._executor.submit(_noop).result()
+        try:
+            self.pids = sorted(pids.get(timeout=start_timeout) for _ in range(self.workers))
+        except queue.Empty:
+            self._executor.shutdown(wait=False)
+            raise RuntimeError(f'Scoring pool workers did not start within {start_timeout}s')
+        finally:
+            pids.close()
+
+    def submit(self, *args):
+        return self._executor.submit(_score_shard, *args)
+
+    def close(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def start_pool(workers=None):
+    """Start this process's scoring pool (once); call before any thread starts"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ScoringPool(workers)
+        return _pool
+
+
+def get_pool():
+    return _pool
+
+
+def stop_pool(wait=True):
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close(wait)
+
+
+class ShardedScorer:
+    """Scores scaled feature matrices shard by shard on the scoring pool.
+
+    model is LightGBM model text, or a TreeEnsemble; key names its version.
+    local(X) scores in-process: matrices of one shard or less, and anything
+    while no pool is running or after close().
+    """
+
+    def __init__(self, key, model, local, shard_size=50000, pool=None):
+        self.key = key
+        self.model = model
+        self.local = local
+        self.shard_size = shard_size
+        self.pool = pool
+        self._closed = False
+        self._shared_model = None
+        self._lock = threading.Lock()
+
+    def _model_name(self):
+        """Name of the shared block holding the pickled model (written on first use), or None after close()"""
+        with self._lock:
+            if self._closed:
+                return None
+            if self._shared_model is None:
+                data = pickle.dumps(self.model, protocol=pickle.HIGHEST_PROTOCOL)
+                self._shared_model = SharedMemory(create=True, size=len(data))
+                self._shared_model.buf[:len(data)] = data
+            return self._shared_model.name
+
+    def predict_proba(self, X):
+        """Positive-class probability for each row of a scaled matrix, in row order"""
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        pool = self.pool or get_pool()
+        if pool is None or self._closed or len(X) <= self.shard_size:
+            return self.local(X)
+
+        model_name = self._model_name()
+        if model_name is None:
+            return self.local(X)
+        shared_input = SharedMemory(create=True, size=max(X.nbytes, 1))
+        shared_output = SharedMemory(create=True, size=max(len(X) * 8, 1))
+        try:
+            np.ndarray(X.shape, dtype=np.float64, buffer=shared_input.buf)[:] = X
+            shards = [
+                pool.submit(self.key, model_name, shared_input.name, shared_output.name, X.shape,
+                            start, min(start + self.shard_size, len(X)))
+                for start in range(0, len(X), self.shard_size)
+            ]
+            for shard in shards:
+                shard.result()
+            return np.ndarray((len(X),), dtype=np.float64, buffer=shared_output.buf).copy()
+        except (RuntimeError, OSError) as e:
+            # Pool shut down while this request was running, a worker died (BrokenProcessPool),
+            # or the scorer was closed before a worker read its model
+            print(f" Sharded scoring unavailable, scoring in-process: {e}")
+            return self.local(X)
+        finally:
+            shared_input.close()
+            shared_input.unlink()
+            shared_output.close()
+            shared_output.unlink()
+
+    def close(self):
+        """Score in-process from now on and free the shared model; the pool itself belongs to the process"""
+        with self._lock:
+            self._closed = True
+            shared_model, self._shared_model = self._shared_model, None
+        if shared_model is not None:
+            shared_model.close()
+            shared_model.unlink()
@@ -0,0 +1,323 @@
+"""Write-behind persistence for single predictions.
+
+PredictionWriter.submit() gives a prediction its id up front and queues the
+row; a background thread stores queued rows in group commits of up to
+batch_size rows. Ids come from blocks of even ids reserved in id_sequences
+(the API's own AUTO_INCREMENT inserts get odd ones); the writer
+thread reserves the next block when fewer than id_low_water ids are left,
+so submit() normally never waits on the database. When a commit fails (MySQL unreachable), the rows are
+appended to a local spool file (JSON lines, fsynced) and replayed in order
+once the database answers again, so rows handed to the spool survive
+restarts. Rows still in the in-memory queue are flushed or spooled by
+close(); only a hard crash can lose them.
+
+The spool keeps accepted rows, not the endpoint: during an outage submit()
+can only hand out the ids already reserved, and once those run out it
+raises WriterBusy (503) until the database is back.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+from database import PredictionIdConflict
+
+SPOOL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spool', 'predictions.jsonl')
+
+
+class WriterBusy(Exception):
+    """Raised when the write queue stays full for longer than submit_timeout, or no id can be reserved"""
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    # NumPy scalars from the model; anything else as text
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+def _decode_row(line):
+    row = json.loads(line)
+    row['created_at'] = datetime.fromisoformat(row['created_at'])
+    return row
+
+
+class PredictionWriter:
+    """Background group-commit writer for single predictions"""
+
+    def __init__(self, db, spool_path=SPOOL_PATH, queue_size=10000, batch_size=500,
+                 flush_ms=20.0, submit_timeout=1.0, retry_seconds=5.0, id_block=100, id_low_water=25):
+        self.db = db
+        self.spool_path = spool_path
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_wait = flush_ms / 1000.0
+        self.submit_timeout = submit_timeout
+        self.retry_seconds = retry_seconds
+        self.id_block = id_block
+        self.id_low_water = id_low_water
+        # Reserved ids; submit() pops from the left while the writer thread
+        # extends on the right (both atomic on a deque)
+        self._ids = deque()
+        # One reservation at a time, from the writer thread or a submit() that ran dry
+        self._reserve_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self._retry_at = 0.0
+        self._metrics_lock = threading.Lock()
+        self._flush_times = deque(maxlen=4096)
+        self.submitted = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.flush_errors = 0
+        self.rows_spooled = 0
+        self.rows_replayed = 0
+        self.submit_reservations = 0
+        self.rows_conflicted = 0
+        self.spool_rows = 0
+        self.last_error = None
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.spool_path), exist_ok=True)
+        if os.path.exists(self.spool_path):
+            with open(self.spool_path, encoding='utf-8') as f:
+                self.spool_rows = sum(1 for line in f if line.strip())
+            if self.spool_rows:
+                print(f" {self.spool_rows} spooled predictions waiting to be stored")
+        self._thread = threading.Thread(target=self._run, name='prediction-writer', daemon=True)
+        self._thread.start()
+        return self
+
+    def submit(self, user_id, prediction_data):
+        """Queue one prediction and return its id.
+
+        The id comes from the block the writer thread reserved ahead. When a
+        burst has used the block up, submit() reserves the next one itself;
+        if that fails (database down) it raises WriterBusy, as it does when
+        the queue stays full for longer than submit_timeout. Every queued
+        row therefore has the id its caller was given.
+        """
+        prediction_id = self._take_id()
+        row = dict(prediction_data, id=prediction_id, user_id=user_id,
+                   created_at=datetime.now().replace(microsecond=0))
+        try:
+            self._queue.put(row, timeout=self.submit_timeout)
+        except queue.Full:
+            # The id is dropped with the row; gaps in the sequence are harmless
+            with self._metrics_lock:
+                self.rejected += 1
+            raise WriterBusy(f'Prediction write queue is full ({self.queue_size} rows)')
+        with self._metrics_lock:
+            self.submitted += 1
+        return prediction_id
+
+    def _take_id(self):
+        """A reserved id, reserving a block from the calling thread if none is left"""
+        try:
+            return self._ids.popleft()
+        except IndexError:
+            pass
+        if not self._reserve_lock.acquire(timeout=self.submit_timeout):
+            with self._metrics_lock:
+                self.rejected += 1
+            raise WriterBusy(f'No prediction id reserved within {self.submit_timeout}s')
+        try:
+            while True:
+                # Whoever held the lock may have just refilled the block
+                try:
+                    return self._ids.popleft()
+                except IndexError:
+                    pass
+                with self._metrics_lock:
+                    self.submit_reservations += 1
+                try:
+                    reserved = time.monotonic() >= self._retry_at and self._reserve_ids()
+                except Exception as e:
+                    reserved = self._failed(str(e))
+                if not reserved:
+                    with self._metrics_lock:
+                        self.rejected += 1
+                    raise WriterBusy('No prediction ids available, the database is unreachable')
+        finally:
+            self._reserve_lock.release()
+
+    def close(self, timeout=30.0):
+        """Stop accepting work and flush (or spool) everything still queued"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _collect(self):
+        """Block briefly for a first row, then gather more until the window closes"""
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + self.flush_wait
+
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _reserve_ids(self):
+        """Reserve another id block; False (and no retry until retry_seconds) if the database is down"""
+        ids = self.db.reserve_prediction_ids(self.id_block)
+        if ids is None:
+            return self._failed('No prediction ids available')
+        self._ids.extend(ids)
+        return True
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            if len(self._ids) < self.id_low_water and time.monotonic() >= self._retry_at:
+                with self._reserve_lock:
+                    try:
+                        if len(self._ids) < self.id_low_water:
+                            self._reserve_ids()
+                    except Exception as e:
+                        print(f" Prediction id reservation failed: {e}")
+                        self._failed(str(e))
+            batch = self._collect()
+            if self.spool_rows and time.monotonic() >= self._retry_at:
+                try:
+                    self._replay_spool()
+                except Exception as e:
+                    print(f" Prediction spool replay failed: {e}")
+                    self._failed(str(e))
+            if not batch:
+                continue
+            try:
+                # While older rows wait in the spool, newer ones queue up behind them
+                if self.spool_rows or not self._flush(batch):
+                    self._spool(batch)
+            except Exception as e:
+                print(f" Prediction writer error, {len(batch)} rows dropped: {e}")
+                self._failed(str(e))
+
+    def _flush(self, rows):
+        """One group commit"""
+        started = time.perf_counter()
+        try:
+            stored = self.db.save_predictions(rows)
+        except PredictionIdConflict as e:
+            # Another row holds these ids. Keep ours aside for an operator
+            # rather than store them under a different id or drop them
+            print(f" {e}; rows kept in {self.spool_path}.conflicts")
+            conflicted = set(e.ids)
+            self._set_aside([row for row in rows if row['id'] in conflicted])
+            rows = [row for row in rows if row['id'] not in conflicted]
+            stored = self.db.save_predictions(rows)
+        if stored is None:
+            return self._failed('Group commit failed')
+
+        with self._metrics_lock:
+            self.flushes += 1
+            self.rows_flushed += len(rows)
+            self._flush_times.append(time.perf_counter() - started)
+        return True
+
+    def _failed(self, reason):
+        with self._metrics_lock:
+            self.flush_errors += 1
+            self.last_error = reason
+        self._retry_at = time.monotonic() + self.retry_seconds
+        return False
+
+    def _spool(self, rows):
+        with open(self.spool_path, 'a', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, default=_encode_value))
+                f.write('\n')
+            f.flush()
+            os.fsync(f.fileno())
+        with self._metrics_lock:
+            self.spool_rows += len(rows)
+            self.rows_spooled += len(rows)
+
+    def _set_aside(self, rows):
+        with open(self.spool_path + '.conflicts', 'a', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, default=_encode_value))
+                f.write('\n')
+            f.flush()
+            os.fsync(f.fileno())
+        with self._metrics_lock:
+            self.rows_conflicted += len(rows)
+
+    def _rewrite_spool(self, rows):
+        """Atomically replace the spool with `rows`"""
+        temporary = self.spool_path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, default=_encode_value))
+                f.write('\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.spool_path)
+        with self._metrics_lock:
+            self.spool_rows = len(rows)
+
+    def _replay_spool(self):
+        """Store spooled rows oldest first; whatever fails stays spooled"""
+        with open(self.spool_path, encoding='utf-8') as f:
+            rows = [_decode_row(line) for line in f if line.strip()]
+
+        # Every spooled row was queued with its id; one without is corrupt
+        corrupt = [row for row in rows if row.get('id') is None]
+        if corrupt:
+            print(f" {len(corrupt)} spooled predictions have no id; kept in {self.spool_path}.conflicts")
+            self._set_aside(corrupt)
+            rows = [row for row in rows if row.get('id') is not None]
+            self._rewrite_spool(rows)
+
+        for start in range(0, len(rows), self.batch_size):
+            if not self._flush(rows[start:start + self.batch_size]):
+                self._rewrite_spool(rows[start:])
+                return
+            with self._metrics_lock:
+                self.rows_replayed += len(rows[start:start + self.batch_size])
+
+        self._rewrite_spool([])
+        print(f" Stored {len(rows)} spooled predictions")
+
+    def get_metrics(self):
+        """Queue depth, group commit latency and spool backlog"""
+        try:
+            spool_bytes = os.path.getsize(self.spool_path)
+        except OSError:
+            spool_bytes = 0
+        with self._metrics_lock:
+            flush_ms = np.asarray(self._flush_times) * 1000
+            return {
+                'queue_depth': self._queue.qsize(),
+                'queue_capacity': self.queue_size,
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'flushes': self.flushes,
+                'rows_flushed': self.rows_flushed,
+                'avg_rows_per_flush': round(self.rows_flushed / self.flushes, 2) if self.flushes else 0,
+                'flush_p50_ms': round(float(np.percentile(flush_ms, 50)), 3) if flush_ms.size else 0,
+                'flush_p99_ms': round(float(np.percentile(flush_ms, 99)), 3) if flush_ms.size else 0,
+                'flush_max_ms': round(float(flush_ms.max()), 3) if flush_ms.size else 0,
+                'flush_errors': self.flush_errors,
+                'last_error': self.last_error,
+                'ids_reserved': len(self._ids),
+                'submit_reservations': self.submit_reservations,
+                'rows_conflicted': self.rows_conflicted,
+                'spool_rows': self.spool_rows,
+                'spool_bytes': spool_bytes,
+                'rows_spooled': self.rows_spooled,
+                'rows_replayed': self.rows_replayed
+            }
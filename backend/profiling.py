@@ -0,0 +1,363 @@
+"""On-demand request profiling, switched on by admins at runtime.
+
+POST /admin/profiling starts a session that profiles the next N requests
+(optionally only those to one route) and then ends by itself. Each profiled
+request is saved under PROFILE_DIR/<session id>/:
+
+- statistical (default): a sampler thread records the request thread's
+  stack every interval_ms and writes folded stacks ("a;b;c 12" per line),
+  the input of flamegraph.pl, inferno and speedscope.
+- deterministic: cProfile traces every call of the request thread and
+  writes a .pstats file (snakeviz, flameprof, gprof2dot). A process runs
+  one cProfile at a time (Python 3.12+ refuses a second, and traces every
+  thread with it), so a request that overlaps one is sampled instead.
+
+The session lives in PROFILE_DIR/active.json so that every pre-forked
+worker follows it: each process checks the file once a second. Workers
+claim request numbers by creating files exclusively, so N requests are
+profiled in total, not N per worker. With no session, a request costs one
+attribute check.
+"""
+import cProfile
+import glob
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'profiles'))
+MODES = ('statistical', 'deterministic')
+MAX_REQUESTS = 1000
+MAX_SECONDS = 3600
+# Routes never profiled: the profile downloads themselves
+EXCLUDED_PREFIX = '/admin/profil'
+
+_NAME_PATTERN = re.compile(r'^[\w.-]+$')
+
+# Held by the request that has this process's cProfile enabled
+_deterministic_lock = threading.Lock()
+
+
+def fold_stack(frame):
+    """'outer;...;inner' for a frame, each entry 'function (file:line)'"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """Samples the stacks of registered threads every interval seconds"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._targets = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, thread_id):
+        counts = Counter()
+        with self._lock:
+            self._targets[thread_id] = counts
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+                self._thread.start()
+        return counts
+
+    def remove(self, thread_id):
+        with self._lock:
+            return self._targets.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._targets:
+                    # Exit when idle; the next add() starts a new thread
+                    self._thread = None
+                    return
+                targets = list(self._targets.items())
+            frames = sys._current_frames()
+            for thread_id, counts in targets:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    counts[fold_stack(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+class RequestProfile:
+    """The profile of one request, from begin() until finish()"""
+
+    def __init__(self, profiler, session, number, method, route):
+        self.profiler = profiler
+        self.session = session
+        self.number = number
+        self.method = method
+        self.route = route
+        self.thread_id = threading.get_ident()
+        self.started_at = datetime.now()
+        self.started = time.perf_counter()
+        self._profile = None
+        if session['mode'] == 'deterministic' and _deterministic_lock.acquire(blocking=False):
+            try:
+                profile = cProfile.Profile()
+                profile.enable()
+                self._profile = profile
+            except ValueError as e:
+                # Another profiling tool (not ours) is active
+                _deterministic_lock.release()
+                print(f" cProfile unavailable, sampling instead: {e}")
+        self.mode = 'deterministic' if self._profile is not None else 'statistical'
+        if self._profile is None:
+            profiler.sampler(session['interval_ms']).add(self.thread_id)
+
+    def finish(self, status=None):
+        """Stop profiling and write the profile and its metadata"""
+        duration_ms = round((time.perf_counter() - self.started) * 1000, 3)
+        try:
+            directory = self.profiler.session_dir(self.session['id'])
+            base = os.path.join(directory, f'{self.number:04d}-{os.getpid()}')
+            if self._profile is not None:
+                try:
+                    self._profile.disable()
+                finally:
+                    _deterministic_lock.release()
+                path = f'{base}.pstats'
+                self._profile.dump_stats(path)
+                samples = None
+            else:
+                counts = self.profiler.sampler(self.session['interval_ms']).remove(self.thread_id)
+                path = f'{base}.folded'
+                with open(path, 'w') as f:
+                    for stack, count in counts.most_common():
+                        f.write(f'{stack} {count}\n')
+                samples = sum(counts.values())
+            with open(f'{base}.json', 'w') as f:
+                json.dump({
+                    'file': os.path.basename(path),
+                    'number': self.number,
+                    'method': self.method,
+                    'route': self.route,
+                    'status': status,
+                    'duration_ms': duration_ms,
+                    'samples': samples,
+                    'mode': self.mode,
+                    'pid': os.getpid(),
+                    'started_at': self.started_at.isoformat()
+                }, f)
+        except Exception as e:
+            print(f" Profile write error: {e}")
+
+
+class Profiler:
+    """Profiling sessions shared by every process serving from PROFILE_DIR"""
+
+    def __init__(self, directory=PROFILE_DIR, poll_seconds=1.0):
+        self.directory = directory
+        self.poll_seconds = poll_seconds
+        self.active_path = os.path.join(directory, 'active.json')
+        # The active session (a dict) or None; the only thing requests check when idle
+        self.session = None
+        self._session_mtime = None
+        self._samplers = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---- sessions ----
+
+    def start_session(self, route=None, requests=10, mode='statistical', interval_ms=5, seconds=600):
+        """Start profiling the next `requests` requests (to `route` if given) for at most `seconds`"""
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}")
+        requests, interval_ms, seconds = int(requests), float(interval_ms), float(seconds)
+        if not 1 <= requests <= MAX_REQUESTS:
+            raise ValueError(f"requests must be between 1 and {MAX_REQUESTS}")
+        if not 0.5 <= interval_ms <= 1000:
+            raise ValueError("interval_ms must be between 0.5 and 1000")
+        if not 0 < seconds <= MAX_SECONDS:
+            raise ValueError(f"seconds must be between 0 and {MAX_SECONDS}")
+        if route is not None and not str(route).startswith('/'):
+            raise ValueError("route must be a path such as /predict/batch")
+
+        with self._lock:
+            self.refresh()
+            if self.session is not None:
+                raise RuntimeError(f"Profiling session {self.session['id']} is already running")
+            now = time.time()
+            session = {
+                'id': datetime.now().strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6],
+                'route': route,
+                'requests': requests,
+                'mode': mode,
+                'interval_ms': interval_ms,
+                'started_at': now,
+                'expires_at': now + seconds
+            }
+            os.makedirs(os.path.join(self.session_dir(session['id']), 'claims'), exist_ok=True)
+            self._write_json(os.path.join(self.session_dir(session['id']), 'session.json'), session)
+            self._write_json(self.active_path, session)
+            self.session = session
+        print(f" Profiling session {session['id']} started: {requests} requests to {route or 'any route'} ({mode})")
+        return session
+
+    def stop_session(self, session_id=None):
+        """End the active session (only if it is session_id, when given); returns it or None"""
+        with self._lock:
+            self.refresh()
+            session = self.session
+            if session is None or (session_id is not None and session['id'] != session_id):
+                return None
+            try:
+                os.remove(self.active_path)
+            except FileNotFoundError:
+                pass
+            self.session = None
+            self._session_mtime = None
+        print(f" Profiling session {session['id']} ended")
+        return session
+
+    def status(self):
+        session = self.session
+        if session is None:
+            return {'active': False}
+        claimed = len(os.listdir(os.path.join(self.session_dir(session['id']), 'claims')))
+        return dict(session, active=True, claimed=claimed, remaining=max(session['requests'] - claimed, 0))
+
+    def refresh(self):
+        """Pick up a session started or stopped by another process"""
+        try:
+            mtime = os.stat(self.active_path).st_mtime_ns
+        except FileNotFoundError:
+            self.session = None
+            self._session_mtime = None
+            return
+        if mtime != self._session_mtime:
+            session = self._read_json(self.active_path)
+            self._session_mtime = mtime
+            self.session = session
+
+    def start(self):
+        """Follow the active session file from a background thread"""
+        os.makedirs(self.directory, exist_ok=True)
+        self.refresh()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._poll, name='profiling-poll', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _poll(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f" Profiling poll error: {e}")
+
+    # ---- requests ----
+
+    def begin(self, method, route):
+        """A RequestProfile if this request is to be profiled, else None"""
+        session = self.session
+        if session is None or route is None or route.startswith(EXCLUDED_PREFIX):
+            return None
+        if session['route'] is not None and route != session['route']:
+            return None
+        if time.time() > session['expires_at']:
+            self.stop_session(session['id'])
+            return None
+
+        number = self._claim(session)
+        if number is None or number == session['requests'] - 1:
+            self.stop_session(session['id'])
+        if number is None:
+            return None
+        return RequestProfile(self, session, number, method, route)
+
+    def _claim(self, session):
+        """Next free request number of the session, claimed across processes"""
+        claims = os.path.join(self.session_dir(session['id']), 'claims')
+        for number in range(len(os.listdir(claims)), session['requests']):
+            try:
+                os.close(os.open(os.path.join(claims, str(number)), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return number
+            except FileExistsError:
+                continue
+        return None
+
+    def sampler(self, interval_ms):
+        with self._lock:
+            sampler = self._samplers.get(interval_ms)
+            if sampler is None:
+                sampler = self._samplers[interval_ms] = StackSampler(interval_ms / 1000)
+            return sampler
+
+    # ---- stored profiles ----
+
+    def session_dir(self, session_id):
+        return os.path.join(self.directory, session_id)
+
+    def list_profiles(self):
+        """Sessions, newest first, with the profiles each has written"""
+        sessions = []
+        for path in sorted(glob.glob(os.path.join(self.directory, '*', 'session.json')), reverse=True):
+            session = self._read_json(path)
+            if session is None:
+                continue
+            directory = os.path.dirname(path)
+            profiles = [self._read_json(meta) for meta in sorted(glob.glob(os.path.join(directory, '[0-9]*.json')))]
+            session['profiles'] = [profile for profile in profiles if profile]
+            session['active'] = self.session is not None and self.session['id'] == session['id']
+            sessions.append(session)
+        return sessions
+
+    def profile_path(self, session_id, name):
+        """Path of a stored profile file, or None if there is no such file"""
+        if not _NAME_PATTERN.match(session_id) or not _NAME_PATTERN.match(name):
+            return None
+        if not name.endswith(('.folded', '.pstats')):
+            return None
+        path = os.path.join(self.session_dir(session_id), name)
+        return path if os.path.isfile(path) else None
+
+    def merged_folded(self, session_id):
+        """All of a session's folded stacks added together, or None if it has none"""
+        if not _NAME_PATTERN.match(session_id):
+            return None
+        paths = glob.glob(os.path.join(self.session_dir(session_id), '*.folded'))
+        if not paths:
+            return None
+        counts = Counter()
+        for path in paths:
+            with open(path) as f:
+                for line in f:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    if stack:
+                        counts[stack] += int(count)
+        return ''.join(f'{stack} {count}\n' for stack, count in counts.most_common())
+
+    @staticmethod
+    def _write_json(path, data):
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _read_json(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
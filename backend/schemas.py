@@ -1,12 +1,12 @@
 # schemas.py
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional, List
 from datetime import datetime
 
 # Auth schemas
 class UserRegister(BaseModel):
     username: str = Field(..., min_length=3, max_length=50)
-    email: str = Field(..., regex=r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
+    email: str = Field(..., pattern=r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
     password: str = Field(..., min_length=8)
     full_name: Optional[str] = Field(None, max_length=100)
 
@@ -26,6 +26,14 @@ class ChangePasswordRequest(BaseModel):
     new_password: str = Field(..., min_length=8)
 
 # Loan prediction schemas
+# Allowed values of the categorical fields (the categories the model was trained on)
+GENDERS = ['Male', 'Female', 'Other']
+MARITAL_STATUSES = ['Single', 'Married', 'Divorced', 'Widowed']
+EDUCATION_LEVELS = ["Bachelor's", 'High School', "Master's", 'Other', 'PhD']
+EMPLOYMENT_STATUSES = ['Employed', 'Retired', 'Self-employed', 'Student', 'Unemployed']
+LOAN_PURPOSES = ['Business', 'Car', 'Debt consolidation', 'Education', 'Home', 'Medical', 'Other', 'Vacation']
+GRADE_SUBGRADES = [f'{grade}{level}' for grade in 'ABCDEF' for level in range(1, 6)]
+
 class SinglePredictionRequest(BaseModel):
     applicant_name: str = Field(..., description="Name of the applicant")
     annual_income: float = Field(..., gt=0, description="Annual income in USD")
@@ -42,39 +50,45 @@ class SinglePredictionRequest(BaseModel):
     loan_purpose: Optional[str] = Field(None, description="Purpose of the loan")
     grade_subgrade: Optional[str] = Field(None, description="Loan grade/subgrade")
 
-    @validator('gender')
+    @field_validator('gender')
+    @classmethod
     def validate_gender(cls, v):
-        if v and v not in ['Male', 'Female', 'Other']:
+        if v and v not in GENDERS:
             raise ValueError('Gender must be Male, Female, or Other')
         return v
 
-    @validator('marital_status')
+    @field_validator('marital_status')
+    @classmethod
     def validate_marital_status(cls, v):
-        if v and v not in ['Single', 'Married', 'Divorced', 'Widowed']:
+        if v and v not in MARITAL_STATUSES:
             raise ValueError('Marital status must be Single, Married, Divorced, or Widowed')
         return v
 
-    @validator('education_level')
+    @field_validator('education_level')
+    @classmethod
     def validate_education_level(cls, v):
-        if v and v not in ["Bachelor's", 'High School', "Master's", 'Other', 'PhD']:
+        if v and v not in EDUCATION_LEVELS:
             raise ValueError("Education level must be: High School, Bachelor's, Master's, PhD, or Other")
         return v
 
-    @validator('employment_status')
+    @field_validator('employment_status')
+    @classmethod
     def validate_employment_status(cls, v):
-        if v and v not in ['Employed', 'Retired', 'Self-employed', 'Student', 'Unemployed']:
+        if v and v not in EMPLOYMENT_STATUSES:
             raise ValueError('Employment status must be Employed, Self-employed, Student, Retired, or Unemployed')
         return v
 
-    @validator('loan_purpose')
+    @field_validator('loan_purpose')
+    @classmethod
     def validate_loan_purpose(cls, v):
-        if v and v not in ['Business', 'Car', 'Debt consolidation', 'Education', 'Home', 'Medical', 'Other', 'Vacation']:
+        if v and v not in LOAN_PURPOSES:
             raise ValueError('Invalid loan purpose')
         return v
 
-    @validator('grade_subgrade')
+    @field_validator('grade_subgrade')
+    @classmethod
     def validate_grade_subgrade(cls, v):
-        if v and v not in ['A1', 'A2', 'A3', 'A4', 'A5', 'B1', 'B2', 'B3', 'B4', 'B5', 'C1', 'C2', 'C3', 'C4', 'C5', 'D1', 'D2', 'D3', 'D4', 'D5', 'E1', 'E2', 'E3', 'E4', 'E5', 'F1', 'F2', 'F3', 'F4', 'F5']:
+        if v and v not in GRADE_SUBGRADES:
             raise ValueError('Invalid grade/subgrade')
         return v
 
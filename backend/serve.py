@@ -0,0 +1,337 @@
+"""Pre-fork production server for the API.
+
+    python serve.py --workers 4 --bind 0.0.0.0:5000
+
+The parent imports app.py with SERVE_PREFORK=1, so the model bundle is mapped,
+its preprocessing compiled and its NumPy trees warmed up once; gc.freeze()
+then keeps the collector from writing to those objects, and the forked
+workers share their pages copy-on-write. The parent never builds a LightGBM
+Booster: LightGBM's OpenMP thread pool does not survive fork(), and a worker
+forked from a parent that built one hangs on its first predict. Each worker
+builds its own from the shared mapped model text (ModelManager.after_fork()),
+which costs about 5 MB of private memory per worker. The parent opens no database
+connection and starts no threads. Each worker opens its own connection pool
+and background threads (app.init_worker()), warms up, and only then listens
+on the shared socket and reports ready: until the first worker is ready,
+connections are refused rather than left hanging.
+
+Workers are recycled gracefully. After --max-requests requests (plus up to
+--max-requests-jitter, so workers do not all restart together), or on
+SIGTERM, a worker stops accepting, finishes the requests in flight (up to
+--graceful-timeout seconds), flushes its write-behind queue and audit log,
+and exits; the parent starts a replacement in the same slot. SIGHUP
+restarts every worker this way one at a time, first loading the registry's
+active model version in the parent if it changed. SIGTERM or SIGINT to the
+parent stops all workers.
+"""
+import argparse
+import gc
+import os
+import random
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+from werkzeug.wsgi import ClosingIterator
+
+from metrics import clear_shared
+
+
+class RequestCounter:
+    """WSGI middleware that counts requests and calls on_limit at max_requests"""
+
+    def __init__(self, app, max_requests=0, on_limit=None):
+        self.app = app
+        self.max_requests = max_requests
+        self.on_limit = on_limit
+        self.served = 0
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.served += 1
+            self.in_flight += 1
+            limit_reached = self.served == self.max_requests
+        if limit_reached and self.on_limit:
+            self.on_limit()
+        try:
+            # Streamed responses are still in flight until the server closes them
+            return ClosingIterator(self.app(environ, start_response), self._finished)
+        except BaseException:
+            self._finished()
+            raise
+
+    def _finished(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def wait_idle(self, timeout):
+        """Wait up to `timeout` seconds for in-flight requests; True if none are left"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if self.in_flight == 0:
+                    return True
+            time.sleep(0.05)
+        return False
+
+
+class RequestHandler(WSGIRequestHandler):
+    """Werkzeug's handler with an idle timeout on client sockets and optional access log"""
+
+    timeout = 15
+    access_log = False
+
+    def log_request(self, *args, **kwargs):
+        if self.access_log:
+            super().log_request(*args, **kwargs)
+
+
+def parse_bind(bind):
+    host, _, port = bind.rpartition(':')
+    return host.strip('[]') or '127.0.0.1', int(port)
+
+
+def run_worker(slot, sock, ready_pipe, args):
+    """Body of one forked worker; never returns"""
+    import app as api
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    # Ctrl-C reaches the whole process group; the parent decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+
+    status = 0
+    try:
+        warm_up = api.init_worker(slot)
+
+        # A fresh generator: the module-level one was copied from the parent
+        max_requests = args.max_requests
+        if max_requests:
+            max_requests += random.Random().randint(0, args.max_requests_jitter)
+        counter = RequestCounter(api.app, max_requests, on_limit=stop.set)
+
+        RequestHandler.timeout = args.idle_timeout
+        RequestHandler.access_log = args.access_log
+        host, port = parse_bind(args.bind)
+        server = make_server(host, port, counter, threaded=True,
+                             request_handler=RequestHandler, fd=sock.fileno())
+        sock.listen(args.backlog)
+        serving = threading.Thread(target=server.serve_forever, name='http-server', daemon=True)
+        serving.start()
+        os.write(ready_pipe, f'{slot} {os.getpid()} {warm_up["seconds"]}\n'.encode())
+
+        while not stop.wait(1.0):
+            pass
+
+        server.shutdown()
+        if not counter.wait_idle(args.graceful_timeout):
+            print(f" Worker {os.getpid()}: requests still running after {args.graceful_timeout}s")
+        print(f" Worker {os.getpid()} (slot {slot}) exiting after {counter.served} requests")
+    except Exception as e:
+        print(f" Worker {os.getpid()} (slot {slot}) failed: {e}")
+        status = 1
+    finally:
+        try:
+            api.stop_services()
+        except Exception as e:
+            print(f" Worker {os.getpid()}: error stopping services: {e}")
+        sys.stdout.flush()
+        os._exit(status)
+
+
+class Arbiter:
+    """Parent process: forks workers, watches them and replaces the ones that exit"""
+
+    def __init__(self, args, sock, api):
+        self.args = args
+        self.sock = sock
+        self.api = api
+        self.slots = {}           # slot -> pid
+        self.ready = set()        # pids that reported ready
+        self.respawn_at = {}      # slot -> monotonic time of the next spawn
+        self.restart_queue = []   # slots still to restart for SIGHUP
+        self.restarting = None    # slot being restarted
+        self._restarting_pid = None
+        self.stopping = False
+        self.reload_requested = False
+        self.all_ready_logged = False
+        self.started = time.monotonic()
+        self._ready_read, self._ready_write = os.pipe()
+        self._ready_buffer = b''
+
+    def spawn(self, slot):
+        pid = os.fork()
+        if pid == 0:
+            os.close(self._ready_read)
+            run_worker(slot, self.sock, self._ready_write, self.args)
+        self.slots[slot] = pid
+        self.respawn_at.pop(slot, None)
+        print(f" Worker {pid} started in slot {slot}")
+        return pid
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGHUP, self._request_reload)
+
+        for slot in range(self.args.workers):
+            self.spawn(slot)
+
+        while not self.stopping:
+            self._read_ready(timeout=0.5)
+            self._reap()
+            now = time.monotonic()
+            for slot, spawn_at in list(self.respawn_at.items()):
+                if now >= spawn_at:
+                    self.spawn(slot)
+            if self.reload_requested:
+                self._start_rolling_restart()
+            self._advance_rolling_restart()
+
+        self._stop_workers()
+
+    def _request_stop(self, signum, frame):
+        self.stopping = True
+
+    def _request_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def _read_ready(self, timeout):
+        readable, _, _ = select.select([self._ready_read], [], [], timeout)
+        if not readable:
+            return
+        self._ready_buffer += os.read(self._ready_read, 4096)
+        *lines, self._ready_buffer = self._ready_buffer.split(b'\n')
+        for line in lines:
+            slot, pid, seconds = line.decode().split()
+            self.ready.add(int(pid))
+            print(f" Worker {pid} (slot {slot}) ready after {seconds}s warm-up")
+
+        if not self.all_ready_logged and len(self.ready & set(self.slots.values())) == self.args.workers:
+            self.all_ready_logged = True
+            print(f" All {self.args.workers} workers ready in "
+                  f"{time.monotonic() - self.started:.2f}s on http://{self.args.bind}")
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            slot = next((s for s, p in self.slots.items() if p == pid), None)
+            was_ready = pid in self.ready
+            self.ready.discard(pid)
+            if slot is None:
+                continue
+            del self.slots[slot]
+            if self.stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            print(f" Worker {pid} (slot {slot}) exited with status {code}")
+            # A worker that never got ready is restarted after a pause, not in a tight loop
+            delay = 0 if was_ready else self.args.respawn_delay
+            self.respawn_at[slot] = time.monotonic() + delay
+
+    def _start_rolling_restart(self):
+        self.reload_requested = False
+        models = self.api.models
+        active = models.registry.get_active()
+        if active and active != models.current().model_version:
+            print(f" Loading model version {active} before restarting workers")
+            models.activate(active, wait=True)
+            gc.collect()
+            gc.freeze()
+        self.restart_queue = sorted(self.slots)
+        print(f" Restarting {len(self.restart_queue)} workers one at a time")
+
+    def _advance_rolling_restart(self):
+        if self.restarting is not None:
+            pid = self.slots.get(self.restarting)
+            if pid is None or pid not in self.ready or pid == self._restarting_pid:
+                return
+            self.restarting = None
+        if not self.restart_queue:
+            return
+        slot = self.restart_queue.pop(0)
+        pid = self.slots.get(slot)
+        if pid is None:
+            return
+        self.restarting, self._restarting_pid = slot, pid
+        os.kill(pid, signal.SIGTERM)
+
+    def _stop_workers(self):
+        print(f" Stopping {len(self.slots)} workers")
+        for pid in self.slots.values():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        deadline = time.monotonic() + self.args.graceful_timeout + 30
+        while self.slots and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in self.slots.values():
+            print(f" Worker {pid} did not stop, killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bind', default=os.environ.get('SERVE_BIND', '127.0.0.1:5000'), help='host:port')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('SERVE_WORKERS', os.cpu_count() or 1)))
+    parser.add_argument('--max-requests', type=int, default=int(os.environ.get('SERVE_MAX_REQUESTS', 0)),
+                        help='recycle a worker after this many requests (0 never)')
+    parser.add_argument('--max-requests-jitter', type=int, default=int(os.environ.get('SERVE_MAX_REQUESTS_JITTER', 0)))
+    parser.add_argument('--graceful-timeout', type=float, default=float(os.environ.get('SERVE_GRACEFUL_TIMEOUT', 30)),
+                        help='seconds a stopping worker waits for requests in flight')
+    parser.add_argument('--idle-timeout', type=float, default=15.0, help='seconds before an idle client socket is closed')
+    parser.add_argument('--backlog', type=int, default=1024)
+    parser.add_argument('--respawn-delay', type=float, default=1.0,
+                        help='pause before replacing a worker that exited before it was ready')
+    parser.add_argument('--access-log', action='store_true')
+    args = parser.parse_args()
+
+    if args.workers > 1 and os.environ.get('BATCH_JOB_STORE') == 'memory':
+        print(" BATCH_JOB_STORE=memory keeps jobs per worker; status polls may reach another worker")
+
+    # Bind before loading anything so a port in use fails fast; listen() is left
+    # to the workers once they are warm
+    host, port = parse_bind(args.bind)
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+    args.bind = f'{host}:{sock.getsockname()[1]}'
+
+    os.environ['SERVE_PREFORK'] = '1'
+    started = time.perf_counter()
+    import app as api
+    api.models.warm_up()
+    print(f" Model {api.models.current().model_version} loaded in {time.perf_counter() - started:.2f}s")
+
+    if threading.active_count() > 1:
+        names = [thread.name for thread in threading.enumerate() if thread is not threading.main_thread()]
+        print(f" Threads running before fork will not exist in workers: {names}")
+
+    # Metrics files left by a previous run would add to this run's totals
+    clear_shared()
+    gc.collect()
+    gc.freeze()
+    Arbiter(args, sock, api).run()
+
+
+if __name__ == '__main__':
+    main()
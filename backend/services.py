@@ -0,0 +1,105 @@
+"""Model and background services shared by the Flask (app.py) and asyncio
+(async_app.py) APIs, configured from the same environment variables.
+"""
+import os
+
+from model_registry import ModelManager
+from coalescer import PredictionCoalescer
+from batch_jobs import BatchJobRunner, JOB_DIR
+from prediction_writer import PredictionWriter, SPOOL_PATH
+from audit_log import AuditLog, AUDIT_DIR
+from parallel_scoring import start_pool
+
+# Rows read, scored and stored at a time by streaming batch uploads
+BATCH_CHUNK_ROWS = int(os.environ.get('BATCH_CHUNK_ROWS', 10000))
+
+
+def build_models(defer_booster=False):
+    """ModelManager for the active model (MODEL_ENGINE=native selects the NumPy tree evaluator).
+
+    defer_booster leaves the LightGBM models to ModelManager.after_fork(), for a
+    parent that forks workers (serve.py).
+    """
+    return ModelManager(
+        defer_booster=defer_booster,
+        engine=os.environ.get('MODEL_ENGINE', 'lightgbm'),
+        cache_memory_mb=float(os.environ.get('PREDICTION_CACHE_MB', 16)),
+        cache_ttl_seconds=float(os.environ.get('PREDICTION_CACHE_TTL', 300)),
+        shard_size=int(os.environ.get('BATCH_SHARD_SIZE', 50000))
+    )
+
+
+def start_scoring_pool():
+    """Fork the BATCH_WORKERS processes that score large batches, or None (BATCH_WORKERS=0).
+
+    Call it before the process builds a LightGBM model or starts a thread
+    (see parallel_scoring.py).
+    """
+    workers = int(os.environ.get('BATCH_WORKERS', 0))
+    if workers <= 0:
+        return None
+    return start_pool(workers)
+
+
+def build_coalescer(predictor):
+    """Micro-batching of concurrent single predictions, or None (PREDICT_COALESCE_MS=0)"""
+    coalesce_ms = float(os.environ.get('PREDICT_COALESCE_MS', 0))
+    if coalesce_ms <= 0:
+        return None
+    return PredictionCoalescer(
+        predictor,
+        max_wait_ms=coalesce_ms,
+        max_batch_size=int(os.environ.get('PREDICT_COALESCE_MAX_BATCH', 64)),
+        max_queue_size=int(os.environ.get('PREDICT_COALESCE_QUEUE', 1000)),
+        timeout=float(os.environ.get('PREDICT_COALESCE_TIMEOUT', 1))
+    )
+
+
+def build_prediction_writer(db, worker_id=None):
+    """Started write-behind writer for single predictions, or None unless PREDICTION_WRITE_BEHIND=1.
+
+    worker_id (a pre-fork worker slot) keeps each worker's spool in a file of its own.
+    """
+    if os.environ.get('PREDICTION_WRITE_BEHIND', '0') != '1':
+        return None
+    spool_path = os.environ.get('PREDICTION_SPOOL_PATH', SPOOL_PATH)
+    if worker_id is not None:
+        base, ext = os.path.splitext(spool_path)
+        spool_path = f'{base}-{worker_id}{ext}'
+    return PredictionWriter(
+        db,
+        spool_path=spool_path,
+        queue_size=int(os.environ.get('PREDICTION_WRITE_QUEUE', 10000)),
+        batch_size=int(os.environ.get('PREDICTION_WRITE_BATCH', 500)),
+        flush_ms=float(os.environ.get('PREDICTION_WRITE_FLUSH_MS', 20)),
+        submit_timeout=float(os.environ.get('PREDICTION_WRITE_TIMEOUT', 1)),
+        id_block=int(os.environ.get('PREDICTION_ID_BLOCK', 100)),
+        id_low_water=int(os.environ.get('PREDICTION_ID_LOW_WATER', 25))
+    ).start()
+
+
+def build_audit_log():
+    """Started audit log of every prediction served, or None when AUDIT_LOG=0"""
+    if os.environ.get('AUDIT_LOG', '1') != '1':
+        return None
+    return AuditLog(
+        directory=os.environ.get('AUDIT_LOG_DIR', AUDIT_DIR),
+        flush_seconds=float(os.environ.get('AUDIT_LOG_FLUSH_SECONDS', 1)),
+        max_bytes=int(float(os.environ.get('AUDIT_LOG_MAX_MB', 64)) * 1024 * 1024),
+        rotate_seconds=float(os.environ.get('AUDIT_LOG_ROTATE_SECONDS', 3600))
+    ).start()
+
+
+def build_batch_jobs(store_factory, predictor_source, audit_log=None):
+    """Started background batch job runner, or None when BATCH_JOB_WORKERS=0"""
+    workers = int(os.environ.get('BATCH_JOB_WORKERS', 1))
+    if workers <= 0:
+        return None
+    return BatchJobRunner(
+        store_factory=store_factory,
+        predictor_source=predictor_source,
+        job_dir=os.environ.get('BATCH_JOB_DIR', JOB_DIR),
+        workers=workers,
+        chunk_rows=BATCH_CHUNK_ROWS,
+        audit_log=audit_log
+    ).start()
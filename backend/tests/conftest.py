@@ -0,0 +1,27 @@
+# Tests import the backend modules the way app.py does, from backend/
+import os
+import sys
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def api(tmp_path_factory):
+    """app.py imported once, without MySQL, audit log or batch job threads"""
+    scratch = tmp_path_factory.mktemp('api')
+    os.environ.update(AUDIT_LOG='0', BATCH_JOB_WORKERS='0', BATCH_JOB_STORE='memory',
+                      PROFILE_DIR=str(scratch / 'profiles'), METRICS_DIR=str(scratch / 'metrics'),
+                      USER_INVALIDATIONS_PATH=str(scratch / 'invalidations.log'))
+    import app
+    yield app
+    app.stop_services()
+
+
+def auth_headers(api, user_id=1):
+    token = jwt.encode({'user_id': user_id, 'exp': datetime.utcnow() + timedelta(hours=1)},
+                       api.app.config['SECRET_KEY'], algorithm='HS256')
+    return {'Authorization': f'Bearer {token}'}
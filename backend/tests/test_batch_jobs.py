@@ -0,0 +1,128 @@
+"""Batch job claims and requeues (batch_jobs.py), with the in-memory job store and a fake model."""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from batch_jobs import BatchJobRunner, InMemoryJobStore
+
+ROWS = 6
+STALE_SECONDS = 0.5
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+class FakePredictor:
+    """Approves credit scores of 600 and up; its first score_batch call waits for `gate`"""
+
+    model_version = 'test'
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.gate.set()
+        self.entered = threading.Event()
+        self.calls = 0
+
+    def is_loaded(self):
+        return True
+
+    def score_batch(self, df):
+        self.calls += 1
+        if self.calls == 1:
+            self.entered.set()
+            self.gate.wait(10)
+        probability = df['credit_score'].to_numpy() / 1000
+        return {'features': df[['credit_score', 'debt_to_income_ratio']], 'valid': np.ones(len(df), dtype=bool),
+                'prediction': (probability >= 0.6).astype(int), 'probability': probability,
+                'errors': [None] * len(df), 'threshold': 0.6}
+
+
+@pytest.fixture
+def store():
+    return InMemoryJobStore()
+
+
+@pytest.fixture
+def job_id(store, tmp_path):
+    path = tmp_path / 'applicants.csv'
+    path.write_text('credit_score,debt_to_income_ratio\n' + ''.join(f'{550 + 20 * i},0.2\n' for i in range(ROWS)))
+    return store.create_batch_job(1, {'batch_name': 'test', 'filename': path.name, 'file_path': str(path),
+                                      'file_size_kb': 0.1, 'total_rows': ROWS})
+
+
+@pytest.fixture
+def runner(store, tmp_path):
+    runners = []
+
+    def start(predictor, workers=1):
+        runner = BatchJobRunner(lambda: store, lambda: predictor, job_dir=str(tmp_path / 'jobs'), workers=workers,
+                                chunk_rows=2, poll_seconds=0.02, stale_seconds=STALE_SECONDS).start()
+        runners.append(runner)
+        return runner
+
+    yield start
+    for runner in runners:
+        runner.stop(timeout=10)
+
+
+def stored_rows(store, job):
+    return sorted(row['row_number'] for row in store.details[job['batch_id']])
+
+
+def test_chunk_slower_than_stale_seconds_is_not_requeued(store, job_id, runner):
+    predictor = FakePredictor()
+    predictor.gate.clear()
+    jobs = runner(predictor, workers=2)
+    predictor.entered.wait(5)
+    time.sleep(STALE_SECONDS * 3)
+    predictor.gate.set()
+
+    wait_for(lambda: store.get_batch_job(job_id)['status'] == 'done')
+    job = store.get_batch_job(job_id)
+    assert predictor.calls == ROWS // 2
+    assert stored_rows(store, job) == list(range(1, ROWS + 1))
+    assert jobs.get_metrics()['jobs_completed'] == 1
+
+
+def test_job_of_a_dead_worker_is_requeued_and_redone(store, job_id, runner):
+    # A worker claimed the job, stored a first chunk and died
+    store.claim_next_batch_job('dead worker')
+    batch_id = store.save_batch_prediction(1, {'batch_name': 'test'})
+    store.save_batch_prediction_columns(batch_id, {'row_number': [1, 2]})
+    store.update_batch_job(job_id, {'batch_id': batch_id, 'rows_processed': 2})
+    store.jobs[job_id]['heartbeat_at'] = datetime.now() - timedelta(seconds=STALE_SECONDS * 2)
+
+    runner(FakePredictor())
+    wait_for(lambda: store.get_batch_job(job_id)['status'] == 'done')
+    job = store.get_batch_job(job_id)
+    assert job['batch_id'] == batch_id
+    assert job['rows_processed'] == ROWS
+    assert stored_rows(store, job) == list(range(1, ROWS + 1))
+
+
+def test_worker_that_lost_its_claim_stops_writing(store, job_id, runner):
+    predictor = FakePredictor()
+    predictor.gate.clear()
+    jobs = runner(predictor)
+    predictor.entered.wait(5)
+    token = store.get_batch_job(job_id)['claim_token']
+
+    # What requeue_stale_batch_jobs does to a job whose heartbeat lapsed
+    with store._lock:
+        store.jobs[job_id].update({'status': 'queued', 'claim_token': None})
+    time.sleep(STALE_SECONDS)
+    predictor.gate.set()
+
+    wait_for(lambda: store.get_batch_job(job_id)['status'] == 'done')
+    job = store.get_batch_job(job_id)
+    assert job['claim_token'] != token
+    # The first claim stopped before storing its chunk, so no row is stored twice
+    assert stored_rows(store, job) == list(range(1, ROWS + 1))
+    assert jobs.get_metrics() == {'workers': 1, 'jobs_completed': 1, 'jobs_failed': 0}
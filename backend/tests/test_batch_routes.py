@@ -0,0 +1,55 @@
+"""A batch whose details fail to save must not be reported, or kept, as a success."""
+import io
+import json
+
+import pytest
+
+from conftest import auth_headers
+
+CSV = (
+    'annual_income,debt_to_income_ratio,credit_score,loan_amount,interest_rate,gender,'
+    'marital_status,education_level,employment_status,loan_purpose,grade_subgrade\n'
+    '45000,0.1,700,15000,12.5,Female,Single,Master\'s,Employed,Car,B2\n'
+    '30000,0.4,580,5000,15.2,Male,Married,PhD,Retired,Home,F5\n'
+)
+USER = {'id': 1, 'username': 'tester', 'email': 'tester@example.com'}
+BATCH_ID = 42
+
+
+@pytest.fixture
+def failing_db(api, monkeypatch):
+    """The app's database with detail writes failing; records what gets deleted"""
+    deleted = []
+    db = api.db
+    monkeypatch.setattr(db, 'ensure_connection', lambda: True)
+    monkeypatch.setattr(db, 'get_user_by_id_cached', lambda user_id: dict(USER, id=user_id))
+    monkeypatch.setattr(db, 'save_batch_prediction', lambda user_id, batch_data: BATCH_ID)
+    monkeypatch.setattr(db, 'update_batch_prediction', lambda batch_id, batch_data: True)
+    monkeypatch.setattr(db, 'save_batch_prediction_columns', lambda batch_id, columns, row_count=None: False)
+    monkeypatch.setattr(db, 'delete_batch_prediction', lambda batch_id: deleted.append(batch_id) or True)
+    monkeypatch.setattr(api, 'audit_log', None)
+    if not api.models.current().is_loaded():
+        pytest.skip('model artifacts not available')
+    return deleted
+
+
+def upload(api, query=''):
+    client = api.app.test_client()
+    return client.post(f'/predict/batch{query}', headers=auth_headers(api),
+                       data={'file': (io.BytesIO(CSV.encode()), 'applicants.csv')},
+                       content_type='multipart/form-data')
+
+
+def test_failed_detail_save_returns_500_and_removes_batch(api, failing_db):
+    response = upload(api)
+    assert response.status_code == 500
+    assert response.get_json()['detail'] == 'Failed to save batch results'
+    assert failing_db == [BATCH_ID]
+
+
+def test_failed_chunk_save_ends_stream_with_error(api, failing_db):
+    response = upload(api, '?stream=true')
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line['type'] for line in lines] == ['batch', 'error']
+    assert 'failed to save rows 1-2' in lines[-1]['detail']
+    assert lines[-1]['rows_processed'] == 0
@@ -0,0 +1,142 @@
+"""Micro-batching of single predictions (coalescer.py), with a fake model."""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from coalescer import PredictionCoalescer, CoalescerBusy
+from conftest import auth_headers
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+class FakePredictor:
+    """Scores x as x / 100; holds every model call while `gate` is clear"""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.gate.set()
+        self.calls = []
+
+    def encode(self, data):
+        if data['x'] < 0:
+            raise ValueError('negative')
+        return np.array([[data['x']]], dtype=float)
+
+    def predict_encoded(self, X):
+        self.calls.append(X[:, 0].tolist())
+        self.gate.wait()
+        probabilities = X[:, 0] / 100
+        return (probabilities >= 0.5).astype(int), probabilities
+
+    def format_result(self, prediction, probability):
+        return {'prediction': int(prediction), 'probability': float(probability)}
+
+
+@pytest.fixture
+def predictor():
+    predictor = FakePredictor()
+    yield predictor
+    predictor.gate.set()
+
+
+def hold(coalescer, predictor):
+    """Park the scoring thread inside a model call, so later requests queue up"""
+    predictor.gate.clear()
+    first = coalescer.submit({'x': 0})
+    wait_for(lambda: predictor.calls)
+    return first
+
+
+def test_concurrent_requests_are_scored_together(predictor):
+    coalescer = PredictionCoalescer(predictor, max_wait_ms=50, max_batch_size=8)
+    first = hold(coalescer, predictor)
+    futures = [coalescer.submit({'x': x}) for x in (10, 60, -1, 90)]
+    predictor.gate.set()
+
+    assert first.result(5)['probability'] == 0
+    assert [f.result(5)['prediction'] for f in (futures[0], futures[1], futures[3])] == [0, 1, 1]
+    assert futures[1].result()['probability'] == 0.6
+    # The bad record fails alone and is not sent to the model
+    with pytest.raises(ValueError):
+        futures[2].result()
+    assert predictor.calls == [[0], [10, 60, 90]]
+    assert coalescer.get_metrics()['max_batch_size_seen'] == 4
+    coalescer.stop()
+
+
+def test_batches_are_capped_at_max_batch_size(predictor):
+    coalescer = PredictionCoalescer(predictor, max_wait_ms=50, max_batch_size=2)
+    hold(coalescer, predictor)
+    futures = [coalescer.submit({'x': x}) for x in range(5)]
+    predictor.gate.set()
+    assert [f.result(5)['probability'] for f in futures] == [x / 100 for x in range(5)]
+    assert predictor.calls == [[0], [0, 1], [2, 3], [4]]
+    coalescer.stop()
+
+
+def test_timed_out_request_raises_and_is_not_scored(predictor):
+    coalescer = PredictionCoalescer(predictor, max_wait_ms=1, timeout=0.05)
+    first = hold(coalescer, predictor)
+    with pytest.raises(CoalescerBusy, match='No prediction within 0.05s'):
+        coalescer.predict({'x': 70})
+    predictor.gate.set()
+
+    assert first.result(5)['prediction'] == 0
+    assert coalescer.predict({'x': 80})['prediction'] == 1
+    assert predictor.calls == [[0], [80]]
+    assert coalescer.get_metrics()['timed_out'] == 1
+    coalescer.stop()
+
+
+def test_full_queue_rejects_instead_of_blocking(predictor):
+    coalescer = PredictionCoalescer(predictor, max_wait_ms=1, max_queue_size=2)
+    hold(coalescer, predictor)
+    queued = [coalescer.submit({'x': x}) for x in (1, 2)]
+    with pytest.raises(CoalescerBusy, match='queue is full'):
+        coalescer.submit({'x': 3})
+    assert coalescer.get_metrics()['rejected'] == 1
+
+    predictor.gate.set()
+    assert [f.result(5)['probability'] for f in queued] == [0.01, 0.02]
+    coalescer.stop()
+
+
+def test_stop_scores_queued_requests_then_refuses_new_ones(predictor):
+    coalescer = PredictionCoalescer(predictor, max_wait_ms=1)
+    hold(coalescer, predictor)
+    queued = coalescer.submit({'x': 55})
+    stopping = threading.Thread(target=coalescer.stop)
+    stopping.start()
+    predictor.gate.set()
+    stopping.join(5)
+
+    assert not stopping.is_alive()
+    assert queued.result(0)['prediction'] == 1
+    with pytest.raises(CoalescerBusy, match='stopped'):
+        coalescer.submit({'x': 1})
+
+
+def test_predict_route_answers_503_when_the_coalescer_is_busy(api, monkeypatch):
+    class BusyCoalescer:
+        def predict(self, data, predictor=None):
+            raise CoalescerBusy('No prediction within 1.0s')
+
+    if not api.models.current().is_loaded():
+        pytest.skip('model artifacts not available')
+    saved = []
+    monkeypatch.setattr(api, 'coalescer', BusyCoalescer())
+    monkeypatch.setattr(api.db, 'ensure_connection', lambda: True)
+    monkeypatch.setattr(api.db, 'get_user_by_id_cached', lambda user_id: {'id': user_id, 'username': 'tester'})
+    monkeypatch.setattr(api.db, 'save_prediction', lambda *args: saved.append(args))
+
+    response = api.app.test_client().post('/predict', headers=auth_headers(api), json={'credit_score': 700})
+    assert response.status_code == 503
+    assert response.get_json()['detail'] == 'No prediction within 1.0s, retry shortly'
+    assert saved == []
@@ -0,0 +1,166 @@
+"""ConnectionPool (db_pool.py) under concurrency, with fake connections."""
+import itertools
+import threading
+import time
+
+import pytest
+
+from db_pool import ConnectionPool, PoolError
+
+
+class FakeConnection:
+    """Stands in for a mysql.connector connection"""
+
+    _ids = itertools.count()
+
+    def __init__(self):
+        self.id = next(self._ids)
+        self.alive = True
+        self.closed = False
+        self.in_transaction = False
+        self.rollbacks = 0
+        self.holder = None
+
+    def ping(self, reconnect=False):
+        if not self.alive:
+            raise ConnectionError('server has gone away')
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('condition not reached')
+        time.sleep(0.001)
+
+
+def test_no_connection_is_handed_to_two_threads():
+    opened = []
+
+    def connect():
+        connection = FakeConnection()
+        opened.append(connection)
+        return connection
+
+    pool = ConnectionPool(connect, size=4, timeout=10, validate_idle_seconds=0.001)
+    violations = []
+
+    def worker():
+        me = threading.get_ident()
+        for _ in range(200):
+            connection = pool.acquire()
+            if connection.holder is not None:
+                violations.append(connection.id)
+            connection.holder = me
+            time.sleep(0)
+            connection.holder = None
+            pool.release(connection)
+
+    threads = [threading.Thread(target=worker) for _ in range(32)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    metrics = pool.get_metrics()
+    assert violations == []
+    assert len(opened) <= 4
+    assert metrics['checkouts'] == 32 * 200
+    assert metrics['in_use'] == 0
+    assert metrics['peak_in_use'] <= 4
+    assert metrics['timeouts'] == 0
+
+
+def test_waiters_are_served_in_arrival_order():
+    pool = ConnectionPool(FakeConnection, size=1, timeout=10)
+    held = pool.acquire()
+    served = []
+
+    def waiter(n):
+        connection = pool.acquire()
+        served.append(n)
+        pool.release(connection)
+
+    threads = []
+    for n in range(8):
+        thread = threading.Thread(target=waiter, args=(n,))
+        thread.start()
+        threads.append(thread)
+        # Queue the threads one at a time so their arrival order is known
+        wait_for(lambda: pool.get_metrics()['waiting'] == n + 1)
+
+    pool.release(held)
+    for thread in threads:
+        thread.join()
+    assert served == list(range(8))
+
+
+def test_checkout_times_out_when_the_pool_is_exhausted():
+    pool = ConnectionPool(FakeConnection, size=2, timeout=0.2)
+    held = [pool.acquire(), pool.acquire()]
+
+    started = time.monotonic()
+    with pytest.raises(PoolError):
+        pool.acquire()
+    assert 0.15 <= time.monotonic() - started < 2
+    assert pool.get_metrics()['timeouts'] == 1
+    assert pool.get_metrics()['waiting'] == 0
+
+    pool.release(held.pop())
+    assert pool.acquire() is not None
+
+
+def test_broken_idle_connection_is_replaced_after_validation():
+    pool = ConnectionPool(FakeConnection, size=1, timeout=1, validate_idle_seconds=0.01)
+    first = pool.acquire()
+    pool.release(first)
+    first.alive = False
+    time.sleep(0.02)
+
+    second = pool.acquire()
+    assert second is not first
+    assert first.closed
+    metrics = pool.get_metrics()
+    assert metrics['validations'] == 1
+    assert metrics['replaced'] == 1
+    assert metrics['open'] == 1
+
+
+def test_recently_used_connection_skips_validation():
+    pool = ConnectionPool(FakeConnection, size=1, timeout=1, validate_idle_seconds=60)
+    first = pool.acquire()
+    pool.release(first)
+    assert pool.acquire() is first
+    assert pool.get_metrics()['validations'] == 0
+
+
+def test_release_rolls_back_an_open_transaction():
+    pool = ConnectionPool(FakeConnection, size=1, timeout=1)
+    connection = pool.acquire()
+    connection.in_transaction = True
+    pool.release(connection)
+    assert connection.rollbacks == 1
+    assert pool.acquire() is connection
+
+
+def test_failed_connect_frees_its_slot():
+    attempts = []
+
+    def connect():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError('refused')
+        return FakeConnection()
+
+    pool = ConnectionPool(connect, size=1, timeout=0.2)
+    with pytest.raises(PoolError):
+        pool.acquire()
+    assert pool.get_metrics()['open'] == 0
+    assert pool.acquire() is not None
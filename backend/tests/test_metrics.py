@@ -0,0 +1,41 @@
+"""Counters summed over pre-fork workers must not go backwards when a worker is recycled."""
+from metrics import Registry
+
+
+def worker(directory, slot, cache_hits):
+    """A fresh process's registry in `slot`; its collector reads `cache_hits` (from zero, like a real cache)"""
+    registry = Registry(sync_seconds=3600)
+    requests = registry.counter('requests_total', 'Requests answered', ['status'])
+    latency = registry.histogram('request_seconds', 'Request seconds', buckets=(0.1, 1.0))
+    registry.add_collector(lambda: [
+        ('cache_hits_total', 'counter', 'Cache hits', [], [((), cache_hits['hits'])]),
+        ('connections_in_use', 'gauge', 'Connections in use', [], [((), cache_hits['in_use'])]),
+    ])
+    registry.share(slot, str(directory))
+    return registry, requests, latency
+
+
+def values(text):
+    return dict(line.rsplit(' ', 1) for line in text.splitlines() if not line.startswith('#'))
+
+
+def test_counters_continue_across_recycles(tmp_path):
+    other, other_requests, _ = worker(tmp_path, 1, {'hits': 7, 'in_use': 1})
+    other_requests.inc('200', amount=2)
+    other.sync()
+
+    for _ in range(3):
+        cache = {'hits': 0, 'in_use': 2}
+        registry, requests, latency = worker(tmp_path, 0, cache)
+        requests.inc('200', amount=10)
+        latency.observe(0.5)
+        cache['hits'] += 5
+        registry.sync()  # what stop_services does on the way out
+
+    rendered = values(registry.render())
+    assert rendered['requests_total{status="200"}'] == str(3 * 10 + 2)
+    assert rendered['request_seconds_count'] == '3'
+    assert rendered['request_seconds_bucket{le="1"}'] == '3'
+    assert rendered['cache_hits_total'] == str(3 * 5 + 7)
+    # Gauges are this moment's values, not history
+    assert rendered['connections_in_use'] == '3'
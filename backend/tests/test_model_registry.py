@@ -0,0 +1,37 @@
+"""Model versions are directory names under the registry (model_registry.py) and must stay inside it."""
+import pytest
+
+from conftest import auth_headers
+from model_registry import ModelRegistry
+
+ADMIN = {'id': 1, 'username': 'admin', 'email': 'admin@example.com', 'is_admin': True}
+
+
+@pytest.mark.parametrize('version', ['..', '.', '', '../registry', 'v1/../..', 'v1\n'])
+def test_registry_rejects_versions_that_are_not_plain_names(tmp_path, version):
+    registry = ModelRegistry(root=str(tmp_path / 'registry'))
+    with pytest.raises(ValueError):
+        registry.bundle_path(version)
+    assert not registry.has_version(version)
+    with pytest.raises(ValueError):
+        registry.set_active(version)
+    assert not (tmp_path / 'registry' / 'ACTIVE').exists()
+
+
+def test_registry_accepts_plain_versions(tmp_path):
+    registry = ModelRegistry(root=str(tmp_path))
+    assert registry.bundle_path('v1.2-rc_1') == str(tmp_path / 'v1.2-rc_1' / 'model.bundle')
+
+
+def test_activate_route_answers_404_for_a_dot_dot_version(api, monkeypatch, tmp_path):
+    # '..' would name tmp_path/model.bundle, a bundle outside the registry
+    (tmp_path / 'model.bundle').write_bytes(b'bundle')
+    (tmp_path / 'registry').mkdir()
+    monkeypatch.setattr(api.models, 'registry', ModelRegistry(root=str(tmp_path / 'registry')))
+    reloads = []
+    monkeypatch.setattr(api.models, '_reload', reloads.append)
+    monkeypatch.setattr(api.db, 'get_user_by_id_cached', lambda user_id: dict(ADMIN, id=user_id))
+
+    response = api.app.test_client().post('/admin/models/%2E%2E/activate', headers=auth_headers(api))
+    assert response.status_code == 404
+    assert reloads == []
@@ -0,0 +1,97 @@
+"""Sharded scoring (parallel_scoring.py) must return what in-process scoring does."""
+import os
+import pickle
+import subprocess
+import sys
+from concurrent.futures import Future
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pytest
+
+from parallel_scoring import ShardedScorer
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter: the pool must fork before any Booster is built,
+# and this test process has built some already
+SHARD_SCRIPT = '''
+import signal, sys
+import numpy as np
+from parallel_scoring import start_pool, stop_pool, get_pool, ShardedScorer
+from benchmark import synthetic_applicants
+
+signal.alarm(120)
+pool = start_pool(2)
+assert len(set(pool.pids)) == 2, pool.pids
+
+from model import LoanPredictionModel
+from tree_engine import TreeEnsemble
+
+predictor = LoanPredictionModel(cache_memory_mb=0, shard_size=1000)
+df = synthetic_applicants(predictor, 4500)
+sharded = predictor.score_batch(df)
+X = predictor.scale(predictor.encode(df))
+expected = predictor.booster.predict(X)
+assert np.array_equal(sharded['probability'], expected), 'lightgbm shards differ'
+assert np.array_equal(sharded['prediction'], predictor.decide(expected))
+
+# Without model text the workers score with the ensemble
+scorer = ShardedScorer('ensemble', TreeEnsemble.from_booster(predictor.booster), lambda X: None, shard_size=1000)
+assert np.array_equal(scorer.predict_proba(X), expected), 'ensemble shards differ'
+scorer.close()
+assert scorer.predict_proba(X) is None, 'a closed scorer scores in-process'
+
+stop_pool()
+assert get_pool() is None
+assert np.array_equal(predictor.score_batch(df)['probability'], expected)
+'''
+
+
+def test_sharded_scores_match_in_process_scores():
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR)
+    result = subprocess.run([sys.executable, '-c', SHARD_SCRIPT], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, timeout=180)
+    assert result.returncode == 0, result.stdout + result.stderr
+
+
+def test_scorer_stays_in_process_without_a_pool_or_for_one_shard():
+    calls = []
+
+    def local(X):
+        calls.append(len(X))
+        return X[:, 0]
+
+    class Pool:
+        def submit(self, *args):
+            raise AssertionError('a single shard went to the pool')
+
+    X = np.arange(20, dtype=np.float64).reshape(10, 2)
+    assert np.array_equal(ShardedScorer('v1', 'model', local, shard_size=10).predict_proba(X), X[:, 0])
+    assert np.array_equal(ShardedScorer('v1', 'model', local, shard_size=10, pool=Pool()).predict_proba(X), X[:, 0])
+    assert calls == [10, 10]
+
+
+def test_tasks_carry_the_model_by_name_only():
+    model = 'tree\n' * 100000
+    tasks = []
+
+    class Pool:
+        def submit(self, *args):
+            tasks.append(args)
+            future = Future()
+            future.set_result(None)
+            return future
+
+    scorer = ShardedScorer('v1', model, None, shard_size=4, pool=Pool())
+    scorer.predict_proba(np.zeros((10, 2)))
+    assert [task[5:] for task in tasks] == [(0, 4), (4, 8), (8, 10)]
+    assert {task[:2] for task in tasks} == {('v1', tasks[0][1])}
+    assert len(pickle.dumps(tasks)) < 2000
+
+    shared_model = SharedMemory(name=tasks[0][1])
+    assert pickle.loads(shared_model.buf) == model
+    shared_model.close()
+    scorer.close()
+    with pytest.raises(FileNotFoundError):
+        SharedMemory(name=tasks[0][1])
@@ -0,0 +1,147 @@
+"""Write-behind id reservation and spooling (prediction_writer.py), with a fake database."""
+import json
+import threading
+import time
+
+import pytest
+
+from database import PredictionIdConflict
+from prediction_writer import PredictionWriter, WriterBusy
+
+
+class FakeDatabase:
+    """Reserves even ids, as Database does, and stores rows in memory; `up` switches the database off and on"""
+
+    def __init__(self):
+        self.up = True
+        self.next_id = 2
+        self.reservations = 0
+        self.rows = {}
+        self.reserving = threading.Event()
+
+    def reserve_prediction_ids(self, count):
+        self.reserving.set()
+        if not self.up:
+            return None
+        self.reservations += 1
+        first, self.next_id = self.next_id, self.next_id + 2 * count
+        return range(first, self.next_id, 2)
+
+    def save_predictions(self, rows):
+        if not self.up:
+            return None
+        conflicts = [row['id'] for row in rows
+                     if row['id'] in self.rows and self.rows[row['id']]['user_id'] != row['user_id']]
+        if conflicts:
+            raise PredictionIdConflict(conflicts)
+        new = [row for row in rows if row['id'] not in self.rows]
+        self.rows.update((row['id'], row) for row in new)
+        return len(new)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('condition not reached')
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def db():
+    return FakeDatabase()
+
+
+@pytest.fixture
+def writer(db, tmp_path):
+    writer = PredictionWriter(db, spool_path=str(tmp_path / 'predictions.jsonl'), flush_ms=1,
+                              retry_seconds=0.05, id_block=10, id_low_water=4).start()
+    yield writer
+    writer.close()
+
+
+def test_ids_come_from_blocks_reserved_ahead_by_the_writer(db, writer):
+    wait_for(lambda: writer.get_metrics()['ids_reserved'] == 10)
+    db.reserve_prediction_ids = None  # submit() must not touch the database
+
+    ids = [writer.submit(1, {'prediction': 1}) for _ in range(7)]
+    assert ids == list(range(2, 16, 2))
+    wait_for(lambda: len(db.rows) == 7)
+    assert writer.get_metrics()['submit_reservations'] == 0
+
+
+def test_next_block_is_reserved_at_the_low_water_mark(db, writer):
+    wait_for(lambda: writer.get_metrics()['ids_reserved'] == 10)
+    for _ in range(7):
+        writer.submit(1, {'prediction': 0})
+    wait_for(lambda: db.reservations == 2)
+    assert writer.get_metrics()['ids_reserved'] == 13
+    assert writer.submit(1, {'prediction': 0}) == 16
+
+
+def test_burst_past_the_block_reserves_in_submit(db, writer):
+    wait_for(lambda: writer.get_metrics()['ids_reserved'] == 10)
+    ids = [writer.submit(1, {'prediction': 1}) for _ in range(25)]
+    assert None not in ids
+    assert len(set(ids)) == 25
+    wait_for(lambda: len(db.rows) == 25)
+    assert sorted(db.rows) == sorted(ids)
+
+
+def test_database_down_rejects_submits_without_an_id(db, tmp_path):
+    db.up = False
+    writer = PredictionWriter(db, spool_path=str(tmp_path / 'predictions.jsonl'), flush_ms=1,
+                              retry_seconds=0.05, id_block=10, id_low_water=4).start()
+    try:
+        wait_for(db.reserving.is_set)
+        with pytest.raises(WriterBusy):
+            writer.submit(1, {'prediction': 1})
+        assert writer.get_metrics()['submitted'] == 0
+
+        db.up = True
+        wait_for(lambda: writer.get_metrics()['ids_reserved'] > 0)
+        assert writer.submit(1, {'prediction': 1}) == 2
+    finally:
+        writer.close()
+
+
+def test_rows_queued_before_an_outage_are_spooled_with_their_ids(db, writer):
+    wait_for(lambda: writer.get_metrics()['ids_reserved'] == 10)
+    db.up = False
+    ids = [writer.submit(user_id, {'prediction': 0}) for user_id in (1, 2)]
+    wait_for(lambda: writer.get_metrics()['spool_rows'] == 2)
+
+    db.up = True
+    wait_for(lambda: writer.get_metrics()['spool_rows'] == 0)
+    assert {row_id: row['user_id'] for row_id, row in db.rows.items()} == dict(zip(ids, (1, 2)))
+
+
+def test_row_whose_id_is_taken_is_set_aside_not_dropped(db, writer, tmp_path):
+    wait_for(lambda: writer.get_metrics()['ids_reserved'] == 10)
+    db.rows[4] = {'id': 4, 'user_id': 99}
+    ids = [writer.submit(1, {'prediction': 1}) for _ in range(3)]
+    assert ids == [2, 4, 6]
+
+    wait_for(lambda: writer.get_metrics()['rows_conflicted'] == 1)
+    wait_for(lambda: 6 in db.rows)
+    assert db.rows[4]['user_id'] == 99
+    with open(tmp_path / 'predictions.jsonl.conflicts', encoding='utf-8') as f:
+        assert [json.loads(line)['user_id'] for line in f] == [1]
+
+
+def test_spooled_row_without_an_id_is_set_aside(db, tmp_path):
+    spool_path = tmp_path / 'predictions.jsonl'
+    spooled = [{'id': 40, 'user_id': 1, 'created_at': '2026-10-18T12:00:00', 'prediction': 1},
+               {'id': None, 'user_id': 2, 'created_at': '2026-10-18T12:00:01', 'prediction': 0},
+               {'user_id': 3, 'created_at': '2026-10-18T12:00:02', 'prediction': 0}]
+    spool_path.write_text(''.join(json.dumps(row) + '\n' for row in spooled), encoding='utf-8')
+
+    writer = PredictionWriter(db, spool_path=str(spool_path), flush_ms=1, retry_seconds=0.05).start()
+    try:
+        wait_for(lambda: writer.get_metrics()['spool_rows'] == 0)
+        assert list(db.rows) == [40]
+        assert writer.get_metrics()['rows_conflicted'] == 2
+        with open(f'{spool_path}.conflicts', encoding='utf-8') as f:
+            assert [json.loads(line)['user_id'] for line in f] == [2, 3]
+    finally:
+        writer.close()
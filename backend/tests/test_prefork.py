@@ -0,0 +1,61 @@
+"""serve.py's parent must leave the LightGBM Booster to the forked workers."""
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from model import LoanPredictionModel
+from model_registry import ModelManager
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter: this test process has built Boosters already
+FORK_SCRIPT = '''
+import os, signal, sys
+import numpy as np
+from model_registry import ModelManager
+
+models = ModelManager(defer_booster=True, cache_memory_mb=0)
+models.warm_up()
+assert models.current().booster is None
+pid = os.fork()
+if pid == 0:
+    signal.alarm(60)
+    models.after_fork()
+    predictor = models.current()
+    X = np.random.default_rng(0).standard_normal((500, len(predictor.feature_names)))
+    _, probabilities = predictor.score(X)
+    os._exit(0 if np.array_equal(probabilities, predictor.booster.predict(X)) else 1)
+_, status = os.waitpid(pid, 0)
+sys.exit(os.waitstatus_to_exitcode(status))
+'''
+
+
+def test_deferred_predictor_scores_with_the_numpy_trees():
+    predictor = LoanPredictionModel(defer_booster=True, cache_memory_mb=0)
+    assert predictor.booster is None
+    assert predictor.is_loaded()
+
+    X = np.random.default_rng(0).standard_normal((2000, len(predictor.feature_names)))
+    _, probabilities = predictor.score(X.copy())
+    assert predictor.booster is None
+    assert np.array_equal(probabilities, predictor.ensemble.predict_proba(X)[:, 1])
+
+    predictor.load_booster()
+    assert predictor.booster is not None
+    assert np.array_equal(predictor.score(X.copy())[1], predictor.booster.predict(X))
+
+
+def test_after_fork_builds_the_booster_for_later_versions_too():
+    models = ModelManager(defer_booster=True, cache_memory_mb=0)
+    models.after_fork()
+    assert models.current().booster is not None
+    assert models.predictor_kwargs['defer_booster'] is False
+
+
+def test_worker_forked_from_a_deferred_parent_can_predict():
+    env = dict(os.environ, OMP_NUM_THREADS='4', PYTHONPATH=BACKEND_DIR)
+    result = subprocess.run([sys.executable, '-c', FORK_SCRIPT], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stdout + result.stderr
@@ -0,0 +1,33 @@
+"""Overlapping deterministic request profiles (profiling.py)."""
+import json
+import os
+import threading
+
+from profiling import Profiler
+
+
+def test_overlapping_deterministic_profiles_fall_back_to_sampling(tmp_path):
+    profiler = Profiler(str(tmp_path))
+    profiler.start_session(requests=2, mode='deterministic', interval_ms=1)
+
+    first = profiler.begin('POST', '/predict')
+    second = []
+    thread = threading.Thread(target=lambda: second.append(profiler.begin('POST', '/predict')))
+    thread.start()
+    thread.join()
+    assert first.mode == 'deterministic'
+    assert second[0].mode == 'statistical'
+
+    second[0].finish(200)
+    first.finish(200)
+    directory = profiler.session_dir(first.session['id'])
+    files = sorted(name for name in os.listdir(directory) if name.endswith(('.pstats', '.folded')))
+    assert [os.path.splitext(name)[1] for name in files] == ['.pstats', '.folded']
+    with open(os.path.join(directory, files[1].replace('.folded', '.json'))) as f:
+        assert json.load(f)['mode'] == 'statistical'
+
+    # The cProfile slot is free again once the first request finished
+    profiler.start_session(requests=1, mode='deterministic')
+    third = profiler.begin('GET', '/health')
+    assert third.mode == 'deterministic'
+    third.finish(200)
@@ -0,0 +1,120 @@
+"""The NumPy tree evaluator (tree_engine.py) must match LightGBM bit for bit."""
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+import model
+from model import LoanPredictionModel, CATEGORICAL_DEFAULTS, MODEL_DIR
+from model_bundle import DEFAULT_BUNDLE_PATH
+from tree_engine import TreeEnsemble, MISSING_NAN
+
+ROWS = 5000
+ROW_KINDS = ('training', 'nan', 'unseen_category')
+
+
+@pytest.fixture(scope='module')
+def classifier():
+    return joblib.load(os.path.join(MODEL_DIR, 'model.pkl'))
+
+
+@pytest.fixture(scope='module')
+def native():
+    predictor = LoanPredictionModel(engine='native', cache_memory_mb=0)
+    assert predictor.model_source == DEFAULT_BUNDLE_PATH, predictor.load_error
+    return predictor
+
+
+@pytest.fixture(scope='module')
+def lightgbm():
+    predictor = LoanPredictionModel(engine='lightgbm', cache_memory_mb=0)
+    assert predictor.model_source == DEFAULT_BUNDLE_PATH, predictor.load_error
+    return predictor
+
+
+def scaled_rows(predictor, kind, seed=0):
+    """Scaled feature rows: the training distribution, with NaNs, or with unseen category codes"""
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((ROWS, len(predictor.feature_names)))
+    if kind == 'nan':
+        X[rng.random(X.shape) < 0.2] = np.nan
+    elif kind == 'unseen_category':
+        # Codes below and beyond every trained class, scaled like real codes
+        for j, name in enumerate(predictor.feature_names):
+            if name in CATEGORICAL_DEFAULTS:
+                codes = rng.integers(-5, len(predictor.category_classes[name]) + 50, ROWS)
+                X[:, j] = (codes - predictor._scale_mean[j]) / predictor._scale_scale[j]
+    return X
+
+
+@pytest.mark.parametrize('kind', ROW_KINDS)
+def test_pickle_built_ensemble_matches_lightgbm(classifier, native, kind):
+    ensemble = TreeEnsemble.from_booster(classifier)
+    X = scaled_rows(native, kind)
+    expected = classifier.booster_.predict(X)
+    assert np.array_equal(ensemble.predict_proba(X)[:, 1], expected)
+
+
+@pytest.mark.parametrize('kind', ROW_KINDS)
+def test_bundle_ensemble_matches_bundled_lightgbm(native, lightgbm, kind):
+    X = scaled_rows(native, kind)
+    expected = lightgbm.booster.predict(X)
+    assert np.array_equal(native.ensemble.predict_proba(X)[:, 1], expected)
+
+
+@pytest.mark.parametrize('kind', ROW_KINDS)
+def test_single_row_path_matches_lightgbm(native, lightgbm, kind):
+    X = scaled_rows(native, kind)[:500]
+    expected = lightgbm.booster.predict(X)
+    single = [native.ensemble.predict_proba(X[i:i + 1])[0, 1] for i in range(len(X))]
+    assert native.ensemble._row_tables
+    assert np.array_equal(single, expected)
+
+
+def test_single_row_path_steps_aside_for_missing_value_rules(classifier):
+    ensemble = TreeEnsemble.from_booster(classifier)
+    ensemble.missing_type[ensemble.roots[0]] = MISSING_NAN
+    ensemble.has_missing_rules = True
+    X = np.zeros((2, classifier.n_features_))
+    assert ensemble.predict_one(X[0].tolist()) is None
+    assert np.array_equal(ensemble.predict_proba(X[:1]), ensemble.predict_proba(X)[:1])
+
+
+def test_bundle_and_pickle_models_agree(classifier, lightgbm):
+    X = scaled_rows(lightgbm, 'nan')
+    assert np.array_equal(lightgbm.booster.predict(X), classifier.booster_.predict(X))
+
+
+def test_engines_agree_on_raw_applicants(native, lightgbm):
+    applicants = pd.DataFrame({
+        'annual_income': [45000, 'n/a', 120000, 30000],
+        'debt_to_income_ratio': [0.1, 0.2, 0.05, 0.4],
+        'credit_score': [700, 650, 810, 580],
+        'loan_amount': [15000, 9000, 40000, 5000],
+        'interest_rate': [12.5, 11.0, 8.9, 15.2],
+        'gender': ['Female', 'Male', 'Unknown', 'Other'],
+        'marital_status': ['Single', 'Married', 'Divorced', 'Eloped'],
+        'education_level': ["Master's", 'PhD', 'Other', 'High School'],
+        'employment_status': ['Employed', 'Retired', 'Self-employed', 'Freelance'],
+        'loan_purpose': ['Car', 'Home', 'Boat', 'Medical'],
+        'grade_subgrade': ['B2', 'Z9', 'A1', 'F5']
+    })
+    native_scores = native.score_batch(applicants)
+    lightgbm_scores = lightgbm.score_batch(applicants)
+    assert np.array_equal(native_scores['probability'], lightgbm_scores['probability'], equal_nan=True)
+    assert np.array_equal(native_scores['prediction'], lightgbm_scores['prediction'])
+    assert not native_scores['valid'][1]
+
+
+def test_native_engine_scores_large_batches_with_lightgbm(lightgbm):
+    predictor = LoanPredictionModel(engine='native', cache_memory_mb=0)
+    X = scaled_rows(predictor, 'training')[:model.NATIVE_MAX_ROWS]
+    predictor.score(X.copy())
+    assert predictor.booster is None
+
+    X = scaled_rows(predictor, 'training')[:model.NATIVE_MAX_ROWS + 1]
+    _, probabilities = predictor.score(X.copy())
+    assert predictor.booster is not None
+    assert np.array_equal(probabilities, lightgbm.booster.predict(X))
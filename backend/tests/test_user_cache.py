@@ -0,0 +1,114 @@
+"""User cache invalidation across processes (cache.SharedInvalidations)."""
+import multiprocessing
+import os
+import time
+
+import pytest
+
+import database
+from cache import SharedInvalidations
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    return str(tmp_path / 'user_cache' / 'invalidations.log')
+
+
+def test_keys_published_elsewhere_are_seen_once(log_path):
+    reader = SharedInvalidations(log_path)
+    writer = SharedInvalidations(log_path)
+    assert reader.changes() == []
+
+    writer.publish(7)
+    writer.publish(42)
+    assert reader.changes() == ['7', '42']
+    assert reader.changes() == []
+
+
+def test_keys_published_by_another_process_are_seen(log_path):
+    reader = SharedInvalidations(log_path)
+    process = multiprocessing.get_context('fork').Process(target=lambda: SharedInvalidations(log_path).publish(3))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    assert reader.changes() == ['3']
+
+
+def test_only_keys_published_after_start_are_reported(log_path):
+    SharedInvalidations(log_path).publish(1)
+    reader = SharedInvalidations(log_path)
+    SharedInvalidations(log_path).publish(2)
+    assert reader.changes() == ['2']
+
+
+def test_replaced_file_drops_everything(log_path):
+    SharedInvalidations(log_path).publish(1)
+    reader = SharedInvalidations(log_path)
+    os.remove(log_path)
+    SharedInvalidations(log_path).publish(2)
+    assert reader.changes() is None
+    assert reader.changes() == []
+
+
+def test_file_is_replaced_once_every_key_has_outlived_the_ttl(log_path):
+    reader = SharedInvalidations(log_path, max_age=30)
+    writer = SharedInvalidations(log_path, max_age=30)
+    writer.publish(1)
+    writer.publish(2)
+    assert reader.changes() == ['1', '2']
+    size = os.path.getsize(log_path)
+
+    # Keys younger than the TTL stay
+    writer.publish(3)
+    assert os.path.getsize(log_path) > size
+    assert reader.changes() == ['3']
+
+    aged = time.time() - 31
+    os.utime(log_path, (aged, aged))
+    writer.publish(4)
+    assert os.path.getsize(log_path) == SharedInvalidations.ID_LINE_BYTES + len('4\n')
+    assert reader.changes() is None
+    writer.publish(5)
+    assert reader.changes() == ['5']
+
+
+def test_file_without_max_age_only_grows(log_path):
+    writer = SharedInvalidations(log_path)
+    writer.publish(1)
+    aged = time.time() - 3600
+    os.utime(log_path, (aged, aged))
+    writer.publish(2)
+    with open(log_path) as f:
+        assert f.read().split()[1:] == ['1', '2']
+
+
+class Worker(database.Database):
+    """A Database whose user rows come from a dict shared by every 'worker'"""
+
+    def __init__(self, users):
+        super().__init__(connect=False)
+        self.users = users
+        self.reads = 0
+
+    def get_user_by_id(self, user_id):
+        self.reads += 1
+        user = self.users.get(user_id)
+        return dict(user) if user and user['is_active'] else None
+
+    def deactivate_user(self, user_id):
+        self.users[user_id]['is_active'] = False
+        self.invalidate_user(user_id)
+
+
+def test_deactivation_reaches_every_worker_at_once(log_path, monkeypatch):
+    monkeypatch.setattr(database, 'USER_INVALIDATIONS_PATH', log_path)
+    users = {1: {'id': 1, 'username': 'alice', 'is_active': True}}
+    first, second = Worker(users), Worker(users)
+
+    assert first.get_user_by_id_cached(1)['username'] == 'alice'
+    assert first.get_user_by_id_cached(1) is not None
+    assert first.reads == 1
+
+    second.deactivate_user(1)
+    assert first.get_user_by_id_cached(1) is None
+    assert first.reads == 2
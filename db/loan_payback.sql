@@ -30,13 +30,39 @@ SET time_zone = "+00:00";
 CREATE TABLE `approval_by_credit_score` (
 `credit_score_range` varchar(19)
 ,`total_applications` bigint(21)
-,`approved` decimal(22,0)
-,`rejected` decimal(22,0)
-,`approval_rate` decimal(6,2)
+,`approved` bigint(20)
+,`rejected` bigint(20)
+,`approval_rate` decimal(27,2)
 );
 
 -- --------------------------------------------------------
 
+--
+-- Table structure for table `batch_jobs`
+--
+
+CREATE TABLE `batch_jobs` (
+  `id` int(11) NOT NULL,
+  `user_id` int(11) NOT NULL,
+  `batch_name` varchar(255) DEFAULT NULL,
+  `file_name` varchar(255) NOT NULL,
+  `file_path` varchar(512) NOT NULL,
+  `file_size_kb` decimal(10,2) DEFAULT NULL,
+  `status` enum('queued','running','done','failed') NOT NULL DEFAULT 'queued',
+  `total_rows` int(11) DEFAULT NULL,
+  `rows_processed` int(11) NOT NULL DEFAULT 0,
+  `batch_id` int(11) DEFAULT NULL,
+  `error_message` text DEFAULT NULL,
+  `claim_token` char(32) DEFAULT NULL,
+  `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
+  `started_at` timestamp NULL DEFAULT NULL,
+  `finished_at` timestamp NULL DEFAULT NULL,
+  `heartbeat_at` timestamp NULL DEFAULT NULL,
+  `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp()
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- --------------------------------------------------------
+
 --
 -- Table structure for table `batch_predictions`
 --
@@ -88,7 +114,8 @@ CREATE TABLE `batch_prediction_details` (
   `probability` decimal(5,4) NOT NULL,
   `risk_score` decimal(5,2) DEFAULT NULL,
   `rejection_reasons` text DEFAULT NULL,
-  `row_number` int(11) DEFAULT NULL
+  `row_number` int(11) DEFAULT NULL,
+  `model_version` varchar(32) DEFAULT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
 --
@@ -119,6 +146,48 @@ INSERT INTO `batch_prediction_details` (`id`, `batch_id`, `applicant_name`, `ann
 
 -- --------------------------------------------------------
 
+--
+-- Table structure for table `credit_score_band_counts`
+--
+
+CREATE TABLE `credit_score_band_counts` (
+  `band` tinyint(4) NOT NULL,
+  `credit_score_range` varchar(19) NOT NULL,
+  `approved` bigint(20) NOT NULL DEFAULT 0,
+  `rejected` bigint(20) NOT NULL DEFAULT 0,
+  `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp()
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+--
+-- Dumping data for table `credit_score_band_counts`
+--
+
+INSERT INTO `credit_score_band_counts` (`band`, `credit_score_range`, `approved`, `rejected`, `updated_at`) VALUES
+(2, 'Fair (580-669)', 1, 2, '2025-12-27 17:08:50'),
+(3, 'Good (670-739)', 4, 0, '2025-12-27 17:08:50'),
+(4, 'Very Good (740-799)', 1, 0, '2025-12-27 17:08:50'),
+(5, 'Excellent (800-850)', 14, 0, '2025-12-27 17:08:50');
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `id_sequences`
+--
+
+CREATE TABLE `id_sequences` (
+  `name` varchar(64) NOT NULL,
+  `next_id` bigint(20) NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+--
+-- Dumping data for table `id_sequences`
+--
+
+INSERT INTO `id_sequences` (`name`, `next_id`) VALUES
+('single_predictions', 13);
+
+-- --------------------------------------------------------
+
 --
 -- Table structure for table `password_reset_tokens`
 --
@@ -175,7 +244,8 @@ CREATE TABLE `single_predictions` (
   `probability` decimal(5,4) NOT NULL,
   `risk_score` decimal(5,2) DEFAULT NULL,
   `rejection_reasons` text DEFAULT NULL,
-  `created_at` timestamp NOT NULL DEFAULT current_timestamp()
+  `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
+  `model_version` varchar(32) DEFAULT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
 --
@@ -220,6 +290,31 @@ INSERT INTO `users` (`id`, `username`, `email`, `full_name`, `hashed_password`,
 
 -- --------------------------------------------------------
 
+--
+-- Table structure for table `user_prediction_counters`
+--
+
+CREATE TABLE `user_prediction_counters` (
+  `user_id` int(11) NOT NULL,
+  `single_predictions` int(11) NOT NULL DEFAULT 0,
+  `single_approved` int(11) NOT NULL DEFAULT 0,
+  `single_rejected` int(11) NOT NULL DEFAULT 0,
+  `batch_predictions` int(11) NOT NULL DEFAULT 0,
+  `batch_applications` bigint(20) NOT NULL DEFAULT 0,
+  `batch_approved` bigint(20) NOT NULL DEFAULT 0,
+  `batch_rejected` bigint(20) NOT NULL DEFAULT 0,
+  `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp()
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+--
+-- Dumping data for table `user_prediction_counters`
+--
+
+INSERT INTO `user_prediction_counters` (`user_id`, `single_predictions`, `single_approved`, `single_rejected`, `batch_predictions`, `batch_applications`, `batch_approved`, `batch_rejected`, `updated_at`) VALUES
+(4, 2, 2, 0, 2, 20, 18, 2, '2025-12-27 17:08:50');
+
+-- --------------------------------------------------------
+
 --
 -- Stand-in structure for view `user_statistics`
 -- (See below for the actual view)
@@ -231,11 +326,11 @@ CREATE TABLE `user_statistics` (
 ,`full_name` varchar(100)
 ,`created_at` timestamp
 ,`last_login` timestamp
-,`total_single_predictions` bigint(21)
-,`total_batch_predictions` bigint(21)
-,`total_applications_processed` decimal(32,0)
-,`total_approved` decimal(32,0)
-,`total_rejected` decimal(32,0)
+,`total_single_predictions` int(11)
+,`total_batch_predictions` int(11)
+,`total_applications_processed` bigint(20)
+,`total_approved` bigint(20)
+,`total_rejected` bigint(20)
 );
 
 -- --------------------------------------------------------
@@ -245,7 +340,7 @@ CREATE TABLE `user_statistics` (
 --
 DROP TABLE IF EXISTS `approval_by_credit_score`;
 
-CREATE ALGORITHM=UNDEFINED DEFINER=`root`@`localhost` SQL SECURITY DEFINER VIEW `approval_by_credit_score`  AS SELECT CASE WHEN `combined`.`credit_score` < 580 THEN 'Poor (300-579)' WHEN `combined`.`credit_score` < 670 THEN 'Fair (580-669)' WHEN `combined`.`credit_score` < 740 THEN 'Good (670-739)' WHEN `combined`.`credit_score` < 800 THEN 'Very Good (740-799)' ELSE 'Excellent (800-850)' END AS `credit_score_range`, count(0) AS `total_applications`, sum(case when `combined`.`prediction` = 1 then 1 else 0 end) AS `approved`, sum(case when `combined`.`prediction` = 0 then 1 else 0 end) AS `rejected`, round(avg(case when `combined`.`prediction` = 1 then 1 else 0 end) * 100,2) AS `approval_rate` FROM (select `single_predictions`.`credit_score` AS `credit_score`,`single_predictions`.`prediction` AS `prediction` from `single_predictions` union all select `batch_prediction_details`.`credit_score` AS `credit_score`,`batch_prediction_details`.`prediction` AS `prediction` from `batch_prediction_details`) AS `combined` GROUP BY CASE WHEN `combined`.`credit_score` < 580 THEN 'Poor (300-579)' WHEN `combined`.`credit_score` < 670 THEN 'Fair (580-669)' WHEN `combined`.`credit_score` < 740 THEN 'Good (670-739)' WHEN `combined`.`credit_score` < 800 THEN 'Very Good (740-799)' ELSE 'Excellent (800-850)' END ORDER BY min(`combined`.`credit_score`) ASC ;
+CREATE ALGORITHM=UNDEFINED DEFINER=`root`@`localhost` SQL SECURITY DEFINER VIEW `approval_by_credit_score`  AS SELECT `credit_score_band_counts`.`credit_score_range` AS `credit_score_range`, `credit_score_band_counts`.`approved` + `credit_score_band_counts`.`rejected` AS `total_applications`, `credit_score_band_counts`.`approved` AS `approved`, `credit_score_band_counts`.`rejected` AS `rejected`, round(`credit_score_band_counts`.`approved` * 100 / (`credit_score_band_counts`.`approved` + `credit_score_band_counts`.`rejected`),2) AS `approval_rate` FROM `credit_score_band_counts` WHERE `credit_score_band_counts`.`approved` + `credit_score_band_counts`.`rejected` > 0 ORDER BY `credit_score_band_counts`.`band` ASC ;
 
 -- --------------------------------------------------------
 
@@ -263,19 +358,29 @@ CREATE ALGORITHM=UNDEFINED DEFINER=`root`@`localhost` SQL SECURITY DEFINER VIEW
 --
 DROP TABLE IF EXISTS `user_statistics`;
 
-CREATE ALGORITHM=UNDEFINED DEFINER=`root`@`localhost` SQL SECURITY DEFINER VIEW `user_statistics`  AS SELECT `u`.`id` AS `id`, `u`.`username` AS `username`, `u`.`email` AS `email`, `u`.`full_name` AS `full_name`, `u`.`created_at` AS `created_at`, `u`.`last_login` AS `last_login`, count(distinct `sp`.`id`) AS `total_single_predictions`, count(distinct `bp`.`id`) AS `total_batch_predictions`, coalesce(sum(`bp`.`total_applications`),0) AS `total_applications_processed`, coalesce(sum(`bp`.`approved_applications`),0) AS `total_approved`, coalesce(sum(`bp`.`rejected_applications`),0) AS `total_rejected` FROM ((`users` `u` left join `single_predictions` `sp` on(`u`.`id` = `sp`.`user_id`)) left join `batch_predictions` `bp` on(`u`.`id` = `bp`.`user_id`)) GROUP BY `u`.`id`, `u`.`username`, `u`.`email`, `u`.`full_name`, `u`.`created_at`, `u`.`last_login` ;
+CREATE ALGORITHM=UNDEFINED DEFINER=`root`@`localhost` SQL SECURITY DEFINER VIEW `user_statistics`  AS SELECT `u`.`id` AS `id`, `u`.`username` AS `username`, `u`.`email` AS `email`, `u`.`full_name` AS `full_name`, `u`.`created_at` AS `created_at`, `u`.`last_login` AS `last_login`, coalesce(`c`.`single_predictions`,0) AS `total_single_predictions`, coalesce(`c`.`batch_predictions`,0) AS `total_batch_predictions`, coalesce(`c`.`batch_applications`,0) AS `total_applications_processed`, coalesce(`c`.`batch_approved`,0) AS `total_approved`, coalesce(`c`.`batch_rejected`,0) AS `total_rejected` FROM (`users` `u` left join `user_prediction_counters` `c` on(`u`.`id` = `c`.`user_id`)) ;
 
 --
 -- Indexes for dumped tables
 --
 
+--
+-- Indexes for table `batch_jobs`
+--
+ALTER TABLE `batch_jobs`
+  ADD PRIMARY KEY (`id`),
+  ADD KEY `idx_batch_jobs_status` (`status`,`id`),
+  ADD KEY `idx_batch_jobs_user_id` (`user_id`),
+  ADD KEY `batch_id` (`batch_id`);
+
 --
 -- Indexes for table `batch_predictions`
 --
 ALTER TABLE `batch_predictions`
   ADD PRIMARY KEY (`id`),
   ADD KEY `idx_batch_predictions_user_id` (`user_id`),
-  ADD KEY `idx_batch_predictions_processed_at` (`processed_at`);
+  ADD KEY `idx_batch_predictions_processed_at` (`processed_at`),
+  ADD KEY `idx_batch_predictions_user_processed` (`user_id`,`processed_at`,`id`);
 
 --
 -- Indexes for table `batch_prediction_details`
@@ -284,7 +389,21 @@ ALTER TABLE `batch_prediction_details`
   ADD PRIMARY KEY (`id`),
   ADD KEY `idx_batch_details_batch_id` (`batch_id`),
   ADD KEY `idx_batch_details_prediction` (`prediction`),
-  ADD KEY `idx_batch_details_credit_score` (`credit_score`);
+  ADD KEY `idx_batch_details_credit_score` (`credit_score`),
+  ADD KEY `idx_batch_details_batch_row` (`batch_id`,`row_number`),
+  ADD KEY `idx_batch_details_batch_outcome` (`batch_id`,`prediction`,`row_number`);
+
+--
+-- Indexes for table `credit_score_band_counts`
+--
+ALTER TABLE `credit_score_band_counts`
+  ADD PRIMARY KEY (`band`);
+
+--
+-- Indexes for table `id_sequences`
+--
+ALTER TABLE `id_sequences`
+  ADD PRIMARY KEY (`name`);
 
 --
 -- Indexes for table `password_reset_tokens`
@@ -304,7 +423,15 @@ ALTER TABLE `single_predictions`
   ADD KEY `idx_single_predictions_user_id` (`user_id`),
   ADD KEY `idx_single_predictions_created_at` (`created_at`),
   ADD KEY `idx_single_predictions_prediction` (`prediction`),
-  ADD KEY `idx_single_predictions_credit_score` (`credit_score`);
+  ADD KEY `idx_single_predictions_credit_score` (`credit_score`),
+  ADD KEY `idx_single_predictions_user_created` (`user_id`,`created_at`,`id`),
+  ADD KEY `idx_single_predictions_user_outcome` (`user_id`,`prediction`,`created_at`,`id`);
+
+--
+-- Indexes for table `user_prediction_counters`
+--
+ALTER TABLE `user_prediction_counters`
+  ADD PRIMARY KEY (`user_id`);
 
 --
 -- Indexes for table `users`
@@ -321,6 +448,12 @@ ALTER TABLE `users`
 -- AUTO_INCREMENT for dumped tables
 --
 
+--
+-- AUTO_INCREMENT for table `batch_jobs`
+--
+ALTER TABLE `batch_jobs`
+  MODIFY `id` int(11) NOT NULL AUTO_INCREMENT;
+
 --
 -- AUTO_INCREMENT for table `batch_predictions`
 --
@@ -355,6 +488,13 @@ ALTER TABLE `users`
 -- Constraints for dumped tables
 --
 
+--
+-- Constraints for table `batch_jobs`
+--
+ALTER TABLE `batch_jobs`
+  ADD CONSTRAINT `batch_jobs_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE,
+  ADD CONSTRAINT `batch_jobs_ibfk_2` FOREIGN KEY (`batch_id`) REFERENCES `batch_predictions` (`id`) ON DELETE SET NULL;
+
 --
 -- Constraints for table `batch_predictions`
 --
@@ -378,6 +518,12 @@ ALTER TABLE `password_reset_tokens`
 --
 ALTER TABLE `single_predictions`
   ADD CONSTRAINT `single_predictions_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE;
+
+--
+-- Constraints for table `user_prediction_counters`
+--
+ALTER TABLE `user_prediction_counters`
+  ADD CONSTRAINT `user_prediction_counters_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE;
 COMMIT;
 
 /*!40101 SET CHARACTER_SET_CLIENT=@OLD_CHARACTER_SET_CLIENT */;
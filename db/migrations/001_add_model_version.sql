@@ -0,0 +1,10 @@
+--
+-- Record which model version produced each prediction
+-- (already included in loan_payback.sql for new installs)
+--
+
+ALTER TABLE `single_predictions`
+  ADD COLUMN `model_version` varchar(32) DEFAULT NULL;
+
+ALTER TABLE `batch_prediction_details`
+  ADD COLUMN `model_version` varchar(32) DEFAULT NULL;
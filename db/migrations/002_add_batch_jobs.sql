@@ -0,0 +1,28 @@
+--
+-- Background batch scoring jobs
+-- (already included in loan_payback.sql for new installs)
+--
+
+CREATE TABLE `batch_jobs` (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `user_id` int(11) NOT NULL,
+  `batch_name` varchar(255) DEFAULT NULL,
+  `file_name` varchar(255) NOT NULL,
+  `file_path` varchar(512) NOT NULL,
+  `file_size_kb` decimal(10,2) DEFAULT NULL,
+  `status` enum('queued','running','done','failed') NOT NULL DEFAULT 'queued',
+  `total_rows` int(11) DEFAULT NULL,
+  `rows_processed` int(11) NOT NULL DEFAULT 0,
+  `batch_id` int(11) DEFAULT NULL,
+  `error_message` text DEFAULT NULL,
+  `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
+  `started_at` timestamp NULL DEFAULT NULL,
+  `finished_at` timestamp NULL DEFAULT NULL,
+  `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+  PRIMARY KEY (`id`),
+  KEY `idx_batch_jobs_status` (`status`,`id`),
+  KEY `idx_batch_jobs_user_id` (`user_id`),
+  KEY `batch_id` (`batch_id`),
+  CONSTRAINT `batch_jobs_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE,
+  CONSTRAINT `batch_jobs_ibfk_2` FOREIGN KEY (`batch_id`) REFERENCES `batch_predictions` (`id`) ON DELETE SET NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
@@ -0,0 +1,15 @@
+--
+-- Indexes for keyset pagination of the history endpoints
+-- (already included in loan_payback.sql for new installs)
+--
+
+ALTER TABLE `single_predictions`
+  ADD KEY `idx_single_predictions_user_created` (`user_id`,`created_at`,`id`),
+  ADD KEY `idx_single_predictions_user_outcome` (`user_id`,`prediction`,`created_at`,`id`);
+
+ALTER TABLE `batch_predictions`
+  ADD KEY `idx_batch_predictions_user_processed` (`user_id`,`processed_at`,`id`);
+
+ALTER TABLE `batch_prediction_details`
+  ADD KEY `idx_batch_details_batch_row` (`batch_id`,`row_number`),
+  ADD KEY `idx_batch_details_batch_outcome` (`batch_id`,`prediction`,`row_number`);
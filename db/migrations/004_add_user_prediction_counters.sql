@@ -0,0 +1,47 @@
+--
+-- Per-user prediction counters, kept up to date by the application in the
+-- same transaction as each prediction, and the user_statistics view
+-- rewritten to read them instead of aggregating the prediction tables
+-- (already included in loan_payback.sql for new installs)
+--
+
+CREATE TABLE `user_prediction_counters` (
+  `user_id` int(11) NOT NULL,
+  `single_predictions` int(11) NOT NULL DEFAULT 0,
+  `single_approved` int(11) NOT NULL DEFAULT 0,
+  `single_rejected` int(11) NOT NULL DEFAULT 0,
+  `batch_predictions` int(11) NOT NULL DEFAULT 0,
+  `batch_applications` bigint(20) NOT NULL DEFAULT 0,
+  `batch_approved` bigint(20) NOT NULL DEFAULT 0,
+  `batch_rejected` bigint(20) NOT NULL DEFAULT 0,
+  `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+  PRIMARY KEY (`user_id`),
+  CONSTRAINT `user_prediction_counters_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+--
+-- Backfill from existing history. Run with the application stopped, or
+-- afterwards run `python database.py rebuild-user-counters`.
+--
+
+INSERT INTO `user_prediction_counters` (`user_id`, `single_predictions`, `single_approved`, `single_rejected`, `batch_predictions`, `batch_applications`, `batch_approved`, `batch_rejected`)
+SELECT `u`.`id`,
+  coalesce(`sp`.`total`,0), coalesce(`sp`.`approved`,0), coalesce(`sp`.`rejected`,0),
+  coalesce(`bp`.`total`,0), coalesce(`bp`.`applications`,0), coalesce(`bp`.`approved`,0), coalesce(`bp`.`rejected`,0)
+FROM `users` `u`
+LEFT JOIN (SELECT `user_id`, count(0) AS `total`, sum(`prediction` = 1) AS `approved`, count(0) - sum(`prediction` = 1) AS `rejected`
+           FROM `single_predictions` GROUP BY `user_id`) `sp` ON `sp`.`user_id` = `u`.`id`
+LEFT JOIN (SELECT `user_id`, count(0) AS `total`, sum(`total_applications`) AS `applications`,
+                  sum(`approved_applications`) AS `approved`, sum(`rejected_applications`) AS `rejected`
+           FROM `batch_predictions` GROUP BY `user_id`) `bp` ON `bp`.`user_id` = `u`.`id`
+WHERE `sp`.`user_id` IS NOT NULL OR `bp`.`user_id` IS NOT NULL;
+
+CREATE OR REPLACE ALGORITHM=UNDEFINED SQL SECURITY DEFINER VIEW `user_statistics` AS
+SELECT `u`.`id` AS `id`, `u`.`username` AS `username`, `u`.`email` AS `email`, `u`.`full_name` AS `full_name`,
+  `u`.`created_at` AS `created_at`, `u`.`last_login` AS `last_login`,
+  coalesce(`c`.`single_predictions`,0) AS `total_single_predictions`,
+  coalesce(`c`.`batch_predictions`,0) AS `total_batch_predictions`,
+  coalesce(`c`.`batch_applications`,0) AS `total_applications_processed`,
+  coalesce(`c`.`batch_approved`,0) AS `total_approved`,
+  coalesce(`c`.`batch_rejected`,0) AS `total_rejected`
+FROM `users` `u` LEFT JOIN `user_prediction_counters` `c` ON `u`.`id` = `c`.`user_id`;
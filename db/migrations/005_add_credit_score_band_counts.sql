@@ -0,0 +1,40 @@
+--
+-- Approved/rejected counts per credit score band, kept up to date by the
+-- application as predictions are saved, and the approval_by_credit_score
+-- view rewritten to read them instead of scanning every prediction
+-- (already included in loan_payback.sql for new installs)
+--
+
+CREATE TABLE `credit_score_band_counts` (
+  `band` tinyint(4) NOT NULL,
+  `credit_score_range` varchar(19) NOT NULL,
+  `approved` bigint(20) NOT NULL DEFAULT 0,
+  `rejected` bigint(20) NOT NULL DEFAULT 0,
+  `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+  PRIMARY KEY (`band`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+--
+-- Backfill from existing history. Run with the application stopped, or
+-- afterwards run `python database.py rebuild-credit-bands`. The label is
+-- wrapped in min() (one label per band) so ONLY_FULL_GROUP_BY accepts it.
+--
+
+INSERT INTO `credit_score_band_counts` (`band`, `credit_score_range`, `approved`, `rejected`)
+SELECT CASE WHEN `credit_score` < 580 THEN 1 WHEN `credit_score` < 670 THEN 2 WHEN `credit_score` < 740 THEN 3 WHEN `credit_score` < 800 THEN 4 ELSE 5 END AS `band`,
+  min(CASE WHEN `credit_score` < 580 THEN 'Poor (300-579)' WHEN `credit_score` < 670 THEN 'Fair (580-669)' WHEN `credit_score` < 740 THEN 'Good (670-739)' WHEN `credit_score` < 800 THEN 'Very Good (740-799)' ELSE 'Excellent (800-850)' END),
+  sum(case when `prediction` = 1 then 1 else 0 end), sum(case when `prediction` = 0 then 1 else 0 end)
+FROM (SELECT `credit_score`, `prediction` FROM `single_predictions`
+      UNION ALL
+      SELECT `credit_score`, `prediction` FROM `batch_prediction_details`) AS `combined`
+GROUP BY `band`;
+
+CREATE OR REPLACE ALGORITHM=UNDEFINED SQL SECURITY DEFINER VIEW `approval_by_credit_score` AS
+SELECT `credit_score_range` AS `credit_score_range`,
+  `approved` + `rejected` AS `total_applications`,
+  `approved` AS `approved`,
+  `rejected` AS `rejected`,
+  round(`approved` * 100 / (`approved` + `rejected`),2) AS `approval_rate`
+FROM `credit_score_band_counts`
+WHERE `approved` + `rejected` > 0
+ORDER BY `band` ASC;
@@ -0,0 +1,14 @@
+--
+-- Block allocator for single_predictions ids: the application reserves ids
+-- here so write-behind mode can return an id before the row is stored
+-- (already included in loan_payback.sql for new installs)
+--
+
+CREATE TABLE `id_sequences` (
+  `name` varchar(64) NOT NULL,
+  `next_id` bigint(20) NOT NULL,
+  PRIMARY KEY (`name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+INSERT INTO `id_sequences` (`name`, `next_id`)
+SELECT 'single_predictions', coalesce(max(`id`),0) + 1 FROM `single_predictions`;
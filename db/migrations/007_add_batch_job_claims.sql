@@ -0,0 +1,9 @@
+--
+-- Batch job claims: the worker running a job holds its claim_token and
+-- refreshes heartbeat_at while it runs, so only jobs whose worker stopped
+-- are requeued (already included in loan_payback.sql for new installs)
+--
+
+ALTER TABLE `batch_jobs`
+  ADD COLUMN `claim_token` char(32) DEFAULT NULL AFTER `error_message`,
+  ADD COLUMN `heartbeat_at` timestamp NULL DEFAULT NULL AFTER `finished_at`;